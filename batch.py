@@ -0,0 +1,117 @@
+# Description: Vectorized legality checks for large batches of (position, move) pairs, using NumPy. Every rule of
+# JanggiGame.is_legal_move is turned into a table indexed by (from square, to square), built once from the move
+# tables, so a whole batch is answered with a few array lookups instead of one Python call per move.
+#
+# Positions are rows of 90 int8 CompactBoard piece codes (square = y * 9 + x), moves are rows of
+# (from_x, from_y, to_x, to_y), the coordinate order is_legal_move takes.
+
+import numpy as np
+
+from board import GENERAL, GUARD, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER, RED_FLAG
+from tables import (BOARD_WIDTH, BOARD_HEIGHT, NUM_SQUARES, RAYS, PALACE_STEPS, SOLDIER_MOVES, HORSE_MOVES,
+                    ELEPHANT_MOVES, CANNON_PALACE_JUMPS)
+
+NUM_PAIRS = NUM_SQUARES * NUM_SQUARES  # (from, to) pairs, indexed from * 90 + to
+CHUNK_SIZE = 1 << 16  # rows handled at once, which bounds the size of the temporary arrays
+
+
+def _build_pair_tables():
+    """Returns (reach, first_leg, second_leg, between, screen) for every (from, to) pair:
+    reach[piece type] says the piece can make the move on an empty board, first_leg/second_leg are the horse and
+    elephant squares that must be empty (-1 if none), between marks the squares strictly between the two squares
+    of an orthogonal move, and screen is the palace centre a diagonal cannon jump passes over (-1 if none)"""
+    reach = np.zeros((8, NUM_PAIRS), dtype=bool)
+    first_leg = np.full(NUM_PAIRS, -1, dtype=np.int16)
+    second_leg = np.full(NUM_PAIRS, -1, dtype=np.int16)
+    between = np.zeros((NUM_PAIRS, NUM_SQUARES), dtype=bool)
+    screen = np.full(NUM_PAIRS, -1, dtype=np.int16)
+
+    for sq in range(NUM_SQUARES):
+        base = sq * NUM_SQUARES
+        for ray in RAYS[sq]:
+            for index, to in enumerate(ray):
+                reach[CHARIOT, base + to] = reach[CANNON, base + to] = True
+                between[base + to, list(ray[:index])] = True
+        for centre, to in CANNON_PALACE_JUMPS[sq]:
+            reach[CANNON, base + to] = True
+            screen[base + to] = centre
+        for to, leg in HORSE_MOVES[sq]:
+            reach[HORSE, base + to] = True
+            first_leg[base + to] = leg
+        for to, leg1, leg2 in ELEPHANT_MOVES[sq]:
+            reach[ELEPHANT, base + to] = True
+            first_leg[base + to] = leg1
+            second_leg[base + to] = leg2
+        for to in SOLDIER_MOVES[sq]:
+            reach[SOLDIER, base + to] = True
+        for to in PALACE_STEPS[sq]:
+            reach[GENERAL, base + to] = reach[GUARD, base + to] = True
+    return reach, first_leg, second_leg, between, screen
+
+
+REACH, FIRST_LEG, SECOND_LEG, BETWEEN, SCREEN = _build_pair_tables()
+
+
+def positions_array(boards):
+    """Stacks the squares of CompactBoards into an N x 90 int8 array"""
+    return np.frombuffer(b"".join(bytes(board.squares) for board in boards), dtype=np.int8).reshape(-1, NUM_SQUARES)
+
+
+def is_legal_batch(positions, moves):
+    """Returns a boolean array saying whether each move is legal in the position on the same row.
+    A move is legal when JanggiGame.is_legal_move accepts it and it does not land on a piece of the mover's own
+    side, i.e. it passes every check make_move makes before looking at checks on the general. Moves from an
+    empty square, passes and coordinates off the board are never legal"""
+    positions = np.asarray(positions, dtype=np.int8)
+    moves = np.asarray(moves, dtype=np.int64)
+    if positions.ndim != 2 or positions.shape[1] != NUM_SQUARES:
+        raise ValueError("positions must be an N x %d array" % NUM_SQUARES)
+    if moves.shape != (len(positions), 4):
+        raise ValueError("moves must be an N x 4 array with one row per position")
+    result = np.empty(len(positions), dtype=bool)
+    for start in range(0, len(positions), CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        result[start:stop] = _is_legal_chunk(positions[start:stop], moves[start:stop])
+    return result
+
+
+def _is_legal_chunk(positions, moves):
+    """is_legal_batch for one chunk of rows"""
+    from_x, from_y, to_x, to_y = moves.T
+    on_board = ((0 <= from_x) & (from_x < BOARD_WIDTH) & (0 <= from_y) & (from_y < BOARD_HEIGHT)
+                & (0 <= to_x) & (to_x < BOARD_WIDTH) & (0 <= to_y) & (to_y < BOARD_HEIGHT))
+    from_square = np.where(on_board, from_y * BOARD_WIDTH + from_x, 0)
+    to_square = np.where(on_board, to_y * BOARD_WIDTH + to_x, 0)
+    pair = from_square * NUM_SQUARES + to_square
+    rows = np.arange(len(positions))
+
+    mover = positions[rows, from_square]
+    target = positions[rows, to_square]
+    piece_type = mover & 7
+    occupied = positions != 0
+    cannons = (positions & 7) == CANNON
+
+    legal = on_board & (mover != 0) & (from_square != to_square)
+    legal &= (target == 0) | ((target ^ mover) & RED_FLAG != 0)
+    legal &= REACH[piece_type, pair]
+
+    # horse and elephant legs
+    first_leg = FIRST_LEG[pair]
+    second_leg = SECOND_LEG[pair]
+    first_blocked = (first_leg >= 0) & occupied[rows, np.maximum(first_leg, 0)]
+    second_blocked = (second_leg >= 0) & occupied[rows, np.maximum(second_leg, 0)]
+    legal &= ~((piece_type == HORSE) & first_blocked)
+    legal &= ~((piece_type == ELEPHANT) & (first_blocked | second_blocked))
+
+    # chariot and cannon rays
+    between = BETWEEN[pair]
+    pieces_between = (between & occupied).sum(axis=1)
+    cannons_between = (between & cannons).sum(axis=1)
+    legal &= (piece_type != CHARIOT) | (pieces_between == 0)
+
+    screen = SCREEN[pair]
+    screen_code = positions[rows, np.maximum(screen, 0)]
+    palace_jump = (screen >= 0) & (screen_code != 0) & (screen_code & 7 != CANNON)
+    orthogonal_jump = (screen < 0) & (pieces_between == 1) & (cannons_between == 0) & (target & 7 != CANNON)
+    legal &= (piece_type != CANNON) | palace_jump | orthogonal_jump
+    return legal
@@ -0,0 +1,326 @@
+# Description: Bitboard move generation. Occupancy is kept as 90-bit Python integers (bit n is square n = y * 9 + x),
+# one per side and one per piece type, so a chariot or cannon slide is a few integer operations on a precomputed
+# ray mask: the first blocker along a ray is its lowest or highest set bit. Horse and elephant jumps are tested
+# against precomputed leg masks. The rules, quirks included, are the same as JanggiGame.is_legal_move and
+# CompactBoard.
+#
+# Usage:
+#     python bitboard.py bench [--games 20]    checks the bitboard answers against is_legal_move on sample games and
+#                                              compares their cost, and the cost of generating a piece's targets
+#                                              against CompactBoard, per piece type
+
+import argparse
+import time
+
+from board import CompactBoard, EMPTY, GENERAL, GUARD, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER, PIECE_NAMES
+from tables import (NUM_SQUARES, RAYS, PALACE_STEPS, SOLDIER_MOVES, HORSE_MOVES, ELEPHANT_MOVES,
+                    CANNON_PALACE_JUMPS, NO_LEG)
+
+
+def _mask(squares):
+    """Returns the bitmask of an iterable of squares"""
+    mask = 0
+    for sq in squares:
+        mask |= 1 << sq
+    return mask
+
+
+# Squares met walking outwards from every square, one table per RAYS direction. Walking down or right the square
+# numbers grow, so the nearest blocker on those rays is the lowest set bit; on the others it is the highest
+UP, DOWN, LEFT, RIGHT = (tuple(_mask(RAYS[sq][direction]) for sq in range(NUM_SQUARES)) for direction in range(4))
+_DIRECTIONS = ((UP, False), (DOWN, True), (LEFT, False), (RIGHT, True))
+STEP_MASKS = tuple(_mask(PALACE_STEPS[sq]) for sq in range(NUM_SQUARES))  # general and guards
+SOLDIER_MASKS = tuple(_mask(SOLDIER_MOVES[sq]) for sq in range(NUM_SQUARES))
+CANNON_PALACE_MASKS = tuple(tuple((1 << screen, 1 << to) for screen, to in CANNON_PALACE_JUMPS[sq])
+                            for sq in range(NUM_SQUARES))
+
+
+def _build_horse_masks():
+    """For every square, (targets no leg can block, ((leg bit, targets that leg blocks), ...))"""
+    masks = []
+    for sq in range(NUM_SQUARES):
+        free = 0
+        by_leg = {}
+        for to, leg in HORSE_MOVES[sq]:
+            if leg == NO_LEG:
+                free |= 1 << to
+            else:
+                by_leg[1 << leg] = by_leg.get(1 << leg, 0) | 1 << to
+        masks.append((free, tuple(by_leg.items())))
+    return tuple(masks)
+
+
+HORSE_MASKS = _build_horse_masks()
+ELEPHANT_MASKS = tuple(tuple((1 << first_leg | 1 << second_leg, 1 << to) for to, first_leg, second_leg in jumps)
+                       for jumps in ELEPHANT_MOVES)
+
+
+class BitBoard:
+    """Piece codes (as in board.py) plus occupancy bitmasks per side and per piece type. Use
+    BitBoard.from_compact to build one from a CompactBoard"""
+
+    __slots__ = ("squares", "sides", "types", "occupied", "side")
+
+    def __init__(self):
+        """Creates an empty board"""
+        self.squares = bytearray(NUM_SQUARES)
+        self.sides = [0, 0]
+        self.types = [0] * 8  # both sides' pieces of each type; index 0 is unused
+        self.occupied = 0
+        self.side = 0
+
+    @classmethod
+    def from_compact(cls, compact):
+        """Builds a bitboard holding the position of a CompactBoard"""
+        bitboard = cls()
+        for sq, code in enumerate(compact.squares):
+            if code:
+                bitboard.put_piece(sq, code)
+        bitboard.side = compact.side
+        return bitboard
+
+    @classmethod
+    def from_board(cls, board, current_turn="BLUE"):
+        """Builds a bitboard from a JanggiGame style 10x9 list of Piece objects"""
+        return cls.from_compact(CompactBoard.from_board(board, current_turn))
+
+    def put_piece(self, sq, code):
+        """Places a piece code on an empty square"""
+        bit = 1 << sq
+        self.squares[sq] = code
+        self.sides[code >> 3] |= bit
+        self.types[code & 7] |= bit
+        self.occupied |= bit
+
+    def remove_piece(self, sq):
+        """Clears an occupied square"""
+        code = self.squares[sq]
+        bit = 1 << sq
+        self.squares[sq] = EMPTY
+        self.sides[code >> 3] ^= bit
+        self.types[code & 7] ^= bit
+        self.occupied ^= bit
+
+    def make_move(self, move):
+        """Applies a packed move and hands the turn over. Returns the captured piece code for unmake_move. Does not
+        check legality"""
+        from_square = move >> 7
+        to_square = move & 127
+        captured = EMPTY
+        if from_square != to_square:
+            captured = self.squares[to_square]
+            if captured:
+                self.remove_piece(to_square)
+            code = self.squares[from_square]
+            self.remove_piece(from_square)
+            self.put_piece(to_square, code)
+        self.side ^= 1
+        return captured
+
+    def unmake_move(self, move, captured):
+        """Reverts a move applied by make_move"""
+        from_square = move >> 7
+        to_square = move & 127
+        self.side ^= 1
+        if from_square != to_square:
+            code = self.squares[to_square]
+            self.remove_piece(to_square)
+            self.put_piece(from_square, code)
+            if captured:
+                self.put_piece(to_square, captured)
+
+    def chariot_targets(self, sq):
+        """Returns the bitmask a chariot on sq reaches: every square up to and including the first blocker"""
+        occupied = self.occupied
+        targets = 0
+        ray = UP[sq]
+        blockers = ray & occupied
+        targets |= ray ^ UP[blockers.bit_length() - 1] if blockers else ray
+        ray = DOWN[sq]
+        blockers = ray & occupied
+        targets |= ray ^ DOWN[(blockers & -blockers).bit_length() - 1] if blockers else ray
+        ray = LEFT[sq]
+        blockers = ray & occupied
+        targets |= ray ^ LEFT[blockers.bit_length() - 1] if blockers else ray
+        ray = RIGHT[sq]
+        blockers = ray & occupied
+        targets |= ray ^ RIGHT[(blockers & -blockers).bit_length() - 1] if blockers else ray
+        return targets
+
+    def cannon_targets(self, sq):
+        """Returns the bitmask a cannon on sq reaches: the squares past a screen that isn't a cannon, up to and
+        including the next piece unless that is a cannon, plus the palace diagonal jumps"""
+        occupied = self.occupied
+        cannons = self.types[CANNON]
+        targets = 0
+        for rays, increasing in _DIRECTIONS:
+            blockers = rays[sq] & occupied
+            if not blockers:
+                continue
+            screen = (blockers & -blockers).bit_length() - 1 if increasing else blockers.bit_length() - 1
+            if cannons >> screen & 1:
+                continue
+            beyond = rays[screen]
+            blockers = beyond & occupied
+            if not blockers:
+                targets |= beyond
+                continue
+            victim = (blockers & -blockers).bit_length() - 1 if increasing else blockers.bit_length() - 1
+            targets |= beyond ^ rays[victim]
+            if cannons >> victim & 1:
+                targets ^= 1 << victim
+        for screen, to in CANNON_PALACE_MASKS[sq]:
+            if occupied & screen and not cannons & screen:
+                targets |= to
+        return targets
+
+    def horse_targets(self, sq):
+        """Returns the bitmask of the horse jumps from sq whose leg is empty"""
+        targets, legs = HORSE_MASKS[sq]
+        occupied = self.occupied
+        for leg, blocked in legs:
+            if not occupied & leg:
+                targets |= blocked
+        return targets
+
+    def elephant_targets(self, sq):
+        """Returns the bitmask of the elephant jumps from sq with both legs empty"""
+        occupied = self.occupied
+        targets = 0
+        for legs, to in ELEPHANT_MASKS[sq]:
+            if not occupied & legs:
+                targets |= to
+        return targets
+
+    def targets(self, sq):
+        """Returns the bitmask of squares the piece on sq could move to if they held enemy pieces"""
+        piece_type = self.squares[sq] & 7
+        if piece_type == CHARIOT:
+            return self.chariot_targets(sq)
+        if piece_type == CANNON:
+            return self.cannon_targets(sq)
+        if piece_type == HORSE:
+            return self.horse_targets(sq)
+        if piece_type == ELEPHANT:
+            return self.elephant_targets(sq)
+        if piece_type == SOLDIER:
+            return SOLDIER_MASKS[sq]
+        if piece_type in (GENERAL, GUARD):
+            return STEP_MASKS[sq]
+        return 0
+
+    def destinations(self, sq):
+        """Returns the bitmask of squares the piece on sq can move to, leaving out its own pieces. Moves that
+        would leave its own general in check are included"""
+        code = self.squares[sq]
+        if not code:
+            return 0
+        return self.targets(sq) & ~self.sides[code >> 3]
+
+    def is_pseudo_legal(self, move):
+        """Returns whether a packed move is one is_legal_move accepts and that doesn't take an own piece. Whose
+        turn it is and check are not looked at; a pass is never pseudo-legal"""
+        from_square = move >> 7
+        to_square = move & 127
+        return from_square != to_square and bool(self.destinations(from_square) >> to_square & 1)
+
+
+def bench_validators(games, positions_per_game=5):
+    """Asks is_legal_move and the bitboard about every piece against every square in positions taken from games.
+    Returns (mismatches, {piece type name: (calls, validator seconds, bitboard seconds)})"""
+    from main import JanggiGame
+    costs = {name: [0, 0.0, 0.0] for name in PIECE_NAMES.values()}
+    mismatches = 0
+    timer = time.perf_counter
+    for game_moves in games:
+        game = JanggiGame()
+        stride = max(1, len(game_moves) // positions_per_game)
+        for ply, (pos1, pos2) in enumerate(game_moves):
+            game.make_move(pos1, pos2)
+            if ply % stride:
+                continue
+            board = game._board
+            bitboard = BitBoard.from_compact(game.get_compact_board())
+            for from_y, row in enumerate(board):
+                for from_x, piece in enumerate(row):
+                    if piece == "":
+                        continue
+                    from_coordinate = [from_x, from_y]
+                    targets = [([x, y], board[y][x]) for y in range(10) for x in range(9)
+                               if [x, y] != from_coordinate]
+                    start = timer()
+                    expected = [bool(game.is_legal_move(from_coordinate, piece, to_coordinate, next_piece))
+                                and (next_piece == "" or next_piece.get_piece_color() != piece.get_piece_color())
+                                for to_coordinate, next_piece in targets]
+                    middle = timer()
+                    from_square = from_y * 9 + from_x
+                    base = from_square << 7
+                    answers = [bitboard.is_pseudo_legal(base | to_y * 9 + to_x) for (to_x, to_y), _ in targets]
+                    end = timer()
+                    mismatches += sum(1 for a, b in zip(expected, answers) if a != b)
+                    cost = costs[piece.get_piece_type()]
+                    cost[0] += len(targets)
+                    cost[1] += middle - start
+                    cost[2] += end - middle
+    return mismatches, {name: tuple(cost) for name, cost in costs.items()}
+
+
+def bench_generation(games, repeat=20):
+    """Times generating every piece's targets with BitBoard.targets and with CompactBoard._targets, on the final
+    position of each game. Returns {piece type name: (pieces, compact seconds, bitboard seconds)}"""
+    from main import JanggiGame
+    costs = {name: [0, 0.0, 0.0] for name in PIECE_NAMES.values()}
+    timer = time.perf_counter
+    for game_moves in games:
+        game = JanggiGame()
+        for pos1, pos2 in game_moves:
+            game.make_move(pos1, pos2)
+        compact = game.get_compact_board()
+        bitboard = BitBoard.from_compact(compact)
+        for sq, code in enumerate(compact.squares):
+            if not code:
+                continue
+            start = timer()
+            for _ in range(repeat):
+                compact._targets(sq)
+            middle = timer()
+            for _ in range(repeat):
+                bitboard.targets(sq)
+            end = timer()
+            cost = costs[PIECE_NAMES[code & 7]]
+            cost[0] += repeat
+            cost[1] += middle - start
+            cost[2] += end - middle
+    return {name: tuple(cost) for name, cost in costs.items()}
+
+
+def main(argv=None):
+    """Command line entry point"""
+    from perft import sample_games
+    parser = argparse.ArgumentParser(description="Bitboard move generation")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="compare the bitboard with is_legal_move")
+    bench_parser.add_argument("--games", type=int, default=20)
+    bench_parser.add_argument("--length", type=int, default=80)
+    args = parser.parse_args(argv)
+
+    games = sample_games(args.games, args.length)
+    mismatches, costs = bench_validators(games)
+    print("mismatches with is_legal_move:", mismatches)
+    print("cost per call        is_legal_move    bitboard")
+    for name, (calls, validator_seconds, bitboard_seconds) in sorted(costs.items()):
+        if calls:
+            print("  %-8s %8d  %8.0f ns    %6.0f ns  %5.1fx" % (
+                name, calls, validator_seconds / calls * 1e9, bitboard_seconds / calls * 1e9,
+                validator_seconds / bitboard_seconds if bitboard_seconds else 0.0))
+    print("all targets of one piece  CompactBoard     bitboard")
+    for name, (calls, compact_seconds, bitboard_seconds) in sorted(bench_generation(games).items()):
+        if calls:
+            print("  %-8s %8d  %8.0f ns    %6.0f ns  %5.1fx" % (
+                name, calls, compact_seconds / calls * 1e9, bitboard_seconds / calls * 1e9,
+                compact_seconds / bitboard_seconds if bitboard_seconds else 0.0))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,623 @@
+# Description: Compact array-backed board used for search and bulk replay. The 90 squares live in a flat bytearray
+# of small integer piece codes, each side keeps a list of the squares its pieces stand on, and moves are applied
+# and reverted in place by make_move/unmake_move without copying anything.
+
+from tables import (NUM_SQUARES, RAYS, PALACE_STEPS, SOLDIER_MOVES, HORSE_MOVES, ELEPHANT_MOVES,
+                    CANNON_PALACE_JUMPS, NO_LEG, EMPTY, GENERAL, GUARD, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER)
+from zobrist import PIECE_KEYS, SIDE_KEY
+from evaluation import PIECE_SQUARE_VALUES
+
+BLUE = 0
+RED = 1
+COLORS = ("BLUE", "RED")  # index matches JanggiGame._players
+RED_FLAG = 8  # red piece codes are the piece type with this bit set
+
+PIECE_TYPES = {"General": GENERAL, "Guard": GUARD, "Elephant": ELEPHANT, "Horse": HORSE,
+               "Chariot": CHARIOT, "Cannon": CANNON, "Soldier": SOLDIER}
+PIECE_NAMES = {code: name for name, code in PIECE_TYPES.items()}
+
+
+def piece_code(side, piece_type):
+    """Returns the code stored on the board for a piece type belonging to side"""
+    return piece_type | (RED_FLAG if side == RED else 0)
+
+
+def code_side(code):
+    """Returns the side (BLUE or RED) a non-empty piece code belongs to"""
+    return code >> 3
+
+
+def code_type(code):
+    """Returns the piece type of a piece code"""
+    return code & 7
+
+
+def encode_move(from_square, to_square):
+    """Packs a move into a single integer. A move whose squares are equal is a pass"""
+    return from_square << 7 | to_square
+
+
+def move_from(move):
+    """Returns the starting square of a packed move"""
+    return move >> 7
+
+
+def move_to(move):
+    """Returns the destination square of a packed move"""
+    return move & 127
+
+
+def _build_watch_masks():
+    """For every piece type and square, a bitmask of the squares whose contents can change where that piece attacks.
+    Soldiers, guards and generals always reach the same squares, so nothing is watched for them"""
+    lines = []
+    for sq in range(NUM_SQUARES):
+        mask = 0
+        for ray in RAYS[sq]:
+            for to in ray:
+                mask |= 1 << to
+        lines.append(mask)
+    masks = [[0] * NUM_SQUARES for _ in range(8)]
+    for sq in range(NUM_SQUARES):
+        masks[CHARIOT][sq] = lines[sq]
+        masks[CANNON][sq] = lines[sq]
+        for screen, _ in CANNON_PALACE_JUMPS[sq]:
+            masks[CANNON][sq] |= 1 << screen
+        for _, leg in HORSE_MOVES[sq]:
+            if leg != NO_LEG:
+                masks[HORSE][sq] |= 1 << leg
+        for _, first_leg, second_leg in ELEPHANT_MOVES[sq]:
+            masks[ELEPHANT][sq] |= 1 << first_leg | 1 << second_leg
+    return tuple(tuple(mask) for mask in masks)
+
+
+def _build_check_masks():
+    """For every square a general could stand on, a bitmask of the squares whose contents can decide whether an
+    enemy piece attacks it: its row and column, the screen of a diagonal cannon jump onto it and the legs of
+    every horse or elephant jump that lands on it"""
+    masks = [0] * NUM_SQUARES
+    for general in range(NUM_SQUARES):
+        for ray in RAYS[general]:
+            for sq in ray:
+                masks[general] |= 1 << sq
+    for sq in range(NUM_SQUARES):
+        for screen, to in CANNON_PALACE_JUMPS[sq]:
+            masks[to] |= 1 << screen
+        for to, leg in HORSE_MOVES[sq]:
+            if leg != NO_LEG:
+                masks[to] |= 1 << leg
+        for to, first_leg, second_leg in ELEPHANT_MOVES[sq]:
+            masks[to] |= 1 << first_leg | 1 << second_leg
+    return tuple(masks)
+
+
+def _build_reach_masks():
+    """For every piece type and square, a bitmask of every square that piece could ever move to from there"""
+    masks = [[0] * NUM_SQUARES for _ in range(8)]
+    for sq in range(NUM_SQUARES):
+        for ray in RAYS[sq]:
+            for to in ray:
+                masks[CHARIOT][sq] |= 1 << to
+        masks[CANNON][sq] = masks[CHARIOT][sq]
+        for _, to in CANNON_PALACE_JUMPS[sq]:
+            masks[CANNON][sq] |= 1 << to
+        for to, _ in HORSE_MOVES[sq]:
+            masks[HORSE][sq] |= 1 << to
+        for to, _, _ in ELEPHANT_MOVES[sq]:
+            masks[ELEPHANT][sq] |= 1 << to
+        for to in SOLDIER_MOVES[sq]:
+            masks[SOLDIER][sq] |= 1 << to
+        for to in PALACE_STEPS[sq]:
+            masks[GENERAL][sq] |= 1 << to
+            masks[GUARD][sq] |= 1 << to
+    return tuple(tuple(mask) for mask in masks)
+
+
+def _build_safety_masks():
+    """For every square, its check mask plus every square a piece could attack it from: together, the squares
+    whose contents decide whether that square is attacked"""
+    masks = list(CHECK_MASKS)
+    for piece_type in range(GENERAL, SOLDIER + 1):
+        for sq in range(NUM_SQUARES):
+            reach = REACH_MASKS[piece_type][sq]
+            for to in range(NUM_SQUARES):
+                if (reach >> to) & 1:
+                    masks[to] |= 1 << sq
+    return tuple(masks)
+
+
+WATCH_MASKS = _build_watch_masks()
+CHECK_MASKS = _build_check_masks()
+REACH_MASKS = _build_reach_masks()
+SAFETY_MASKS = _build_safety_masks()
+
+
+class CompactBoard:
+    """Flat board of piece codes with per-side piece lists. make_move returns whatever it captured so
+    unmake_move can put the board back exactly as it was. The Zobrist hash of the position is kept in
+    self.hash and updated incrementally by every change to the board.
+
+    Each side also has an attack map: attacks[side][sq] counts the pieces of side that could move to sq. A move
+    only recomputes the attacks of the pieces whose rays or legs pass through the two squares it touched, and
+    the location of both generals is cached, so in_check is a pair of lookups."""
+
+    def __init__(self):
+        """Creates an empty board with blue to move"""
+        self.squares = bytearray(NUM_SQUARES)
+        self.piece_lists = ([], [])
+        self._list_index = bytearray(NUM_SQUARES)  # position of each occupied square in its side's piece list
+        self.side = BLUE
+        self.hash = 0
+        self.scores = [0, 0]  # material plus piece-square total of each side, see evaluation.py
+        self.generals = [-1, -1]  # square of each side's general, -1 while it is off the board
+        self.attacks = (bytearray(NUM_SQUARES), bytearray(NUM_SQUARES))
+        self._piece_attacks = [()] * NUM_SQUARES  # squares attacked by the piece standing on each square
+        self._undo_log = []  # attack map changes made by each move, newest last
+        self._destination_cache = {}  # square -> (legal destinations, mask of the squares the answer depends on)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @classmethod
+    def from_board(cls, board, current_turn="BLUE"):
+        """Builds a compact board from a JanggiGame style 10x9 list of Piece objects"""
+        compact = cls()
+        for y, row in enumerate(board):
+            for x, piece in enumerate(row):
+                if piece != "":
+                    side = COLORS.index(piece.get_piece_color())
+                    compact.put_piece(y * 9 + x, piece_code(side, PIECE_TYPES[piece.get_piece_type()]))
+        compact.side = COLORS.index(current_turn)
+        if compact.side == RED:
+            compact.hash ^= SIDE_KEY
+        compact.rebuild_attacks()
+        return compact
+
+    def copy(self, keep_undo=False):
+        """Returns an independent copy of this board. Moves made before the copy can't be unmade on it unless
+        keep_undo is set; the logged entries are never changed once written, so they are shared, not copied"""
+        compact = CompactBoard.__new__(CompactBoard)
+        compact.squares = bytearray(self.squares)
+        compact.piece_lists = (list(self.piece_lists[0]), list(self.piece_lists[1]))
+        compact._list_index = bytearray(self._list_index)
+        compact.side = self.side
+        compact.hash = self.hash
+        compact.scores = list(self.scores)
+        compact.generals = list(self.generals)
+        compact.attacks = (bytearray(self.attacks[0]), bytearray(self.attacks[1]))
+        compact._piece_attacks = list(self._piece_attacks)
+        compact._undo_log = list(self._undo_log) if keep_undo else []
+        compact._destination_cache = {}
+        compact.cache_hits = 0
+        compact.cache_misses = 0
+        return compact
+
+    def copy_from(self, other):
+        """Overwrites this board with the position of other, reusing its buffers instead of allocating new ones"""
+        self.squares[:] = other.squares
+        self.piece_lists[0][:] = other.piece_lists[0]
+        self.piece_lists[1][:] = other.piece_lists[1]
+        self._list_index[:] = other._list_index
+        self.side = other.side
+        self.hash = other.hash
+        self.scores[:] = other.scores
+        self.generals[:] = other.generals
+        self.attacks[0][:] = other.attacks[0]
+        self.attacks[1][:] = other.attacks[1]
+        self._piece_attacks[:] = other._piece_attacks
+        self._undo_log.clear()
+        self._destination_cache.clear()
+
+    def put_piece(self, sq, code):
+        """Places a piece on an empty square. Call rebuild_attacks once the board is set up"""
+        pieces = self.piece_lists[code_side(code)]
+        self.squares[sq] = code
+        self._list_index[sq] = len(pieces)
+        pieces.append(sq)
+        self.hash ^= PIECE_KEYS[code][sq]
+        self.scores[code >> 3] += PIECE_SQUARE_VALUES[code][sq]
+        if code & 7 == GENERAL:
+            self.generals[code_side(code)] = sq
+
+    def remove_piece(self, sq):
+        """Takes the piece off a square and returns its code. Call rebuild_attacks once the board is set up"""
+        code = self.squares[sq]
+        pieces = self.piece_lists[code_side(code)]
+        last = pieces.pop()
+        if last != sq:  # fill the hole with the piece that used to be last
+            index = self._list_index[sq]
+            pieces[index] = last
+            self._list_index[last] = index
+        self.squares[sq] = EMPTY
+        self.hash ^= PIECE_KEYS[code][sq]
+        self.scores[code >> 3] -= PIECE_SQUARE_VALUES[code][sq]
+        if code & 7 == GENERAL:
+            self.generals[code_side(code)] = -1
+        return code
+
+    def rebuild_attacks(self):
+        """Recomputes both attack maps from scratch"""
+        self.attacks = (bytearray(NUM_SQUARES), bytearray(NUM_SQUARES))
+        self._piece_attacks = [()] * NUM_SQUARES
+        self._undo_log = []
+        self._destination_cache.clear()
+        for pieces in self.piece_lists:
+            for sq in pieces:
+                self._add_attacks(sq)
+
+    def _add_attacks(self, sq):
+        """Records the attacks of the piece on sq"""
+        targets = self._targets(sq)
+        self._piece_attacks[sq] = targets
+        attacks = self.attacks[self.squares[sq] >> 3]
+        for to in targets:
+            attacks[to] += 1
+
+    def _replace_attacks(self, sq, targets, side, log):
+        """Swaps the recorded attacks of the piece on sq for targets, noting the old ones in log for unmake_move"""
+        piece_attacks = self._piece_attacks
+        old = piece_attacks[sq]
+        if old:
+            attacks = self.attacks[self.squares[sq] >> 3]
+            for to in old:
+                attacks[to] -= 1
+        log.append((sq, old, self.squares[sq] >> 3))
+        piece_attacks[sq] = targets
+        if targets:
+            attacks = self.attacks[side]
+            for to in targets:
+                attacks[to] += 1
+
+    def make_move(self, move):
+        """Applies a packed move and hands the turn to the other side. Returns the captured piece code (EMPTY
+        if nothing was captured), which unmake_move needs to revert the move. Does not check legality.
+        The attack maps are brought up to date by recomputing only the moved piece and the pieces whose rays or
+        legs pass through the two squares that changed; what they replaced is logged so unmake_move can restore
+        it without recomputing anything"""
+        from_square = move >> 7
+        to_square = move & 127
+        captured = EMPTY
+        if from_square != to_square:
+            squares = self.squares
+            side = self.side
+            log = []
+            self._replace_attacks(from_square, (), side, log)
+            captured = squares[to_square]
+            if captured:
+                self._replace_attacks(to_square, (), side, log)
+                self.remove_piece(to_square)
+            index = self._list_index[from_square]
+            self.piece_lists[side][index] = to_square
+            self._list_index[to_square] = index
+            moved = squares[from_square]
+            squares[to_square] = moved
+            squares[from_square] = EMPTY
+            self.hash ^= PIECE_KEYS[moved][from_square] ^ PIECE_KEYS[moved][to_square]
+            values = PIECE_SQUARE_VALUES[moved]
+            self.scores[side] += values[to_square] - values[from_square]
+            if moved & 7 == GENERAL:
+                self.generals[side] = to_square
+            if not captured:
+                log.append((to_square, (), side))
+            piece_attacks = self._piece_attacks
+            attacks = self.attacks[side]
+            targets = self._targets(to_square)
+            piece_attacks[to_square] = targets
+            for to in targets:
+                attacks[to] += 1
+
+            changed = 1 << from_square | 1 << to_square
+            for pieces in self.piece_lists:
+                for sq in pieces:
+                    if WATCH_MASKS[squares[sq] & 7][sq] & changed and sq != to_square:
+                        self._replace_attacks(sq, self._targets(sq), squares[sq] >> 3, log)
+            self._undo_log.append(log)
+            if self._destination_cache:
+                self._invalidate_destinations(changed)
+        self.side ^= 1
+        self.hash ^= SIDE_KEY
+        return captured
+
+    def unmake_move(self, move, captured):
+        """Reverts the last move applied by make_move"""
+        from_square = move >> 7
+        to_square = move & 127
+        self.side ^= 1
+        self.hash ^= SIDE_KEY
+        if from_square != to_square:
+            squares = self.squares
+            piece_attacks = self._piece_attacks
+            attacks = self.attacks
+            for sq, old, old_side in reversed(self._undo_log.pop()):
+                current = piece_attacks[sq]
+                if current:
+                    current_attacks = attacks[squares[sq] >> 3]
+                    for to in current:
+                        current_attacks[to] -= 1
+                if old:
+                    old_attacks = attacks[old_side]
+                    for to in old:
+                        old_attacks[to] += 1
+                piece_attacks[sq] = old
+
+            index = self._list_index[to_square]
+            self.piece_lists[self.side][index] = from_square
+            self._list_index[from_square] = index
+            moved = squares[to_square]
+            squares[from_square] = moved
+            squares[to_square] = EMPTY
+            self.hash ^= PIECE_KEYS[moved][from_square] ^ PIECE_KEYS[moved][to_square]
+            values = PIECE_SQUARE_VALUES[moved]
+            self.scores[self.side] += values[from_square] - values[to_square]
+            if moved & 7 == GENERAL:
+                self.generals[self.side] = from_square
+            if captured:
+                self.put_piece(to_square, captured)
+            if self._destination_cache:
+                self._invalidate_destinations(1 << from_square | 1 << to_square)
+
+    def _targets(self, from_square):
+        """Returns every square the piece on from_square could move to if it held an enemy piece. Follows the
+        same rules as JanggiGame.is_legal_move"""
+        squares = self.squares
+        piece_type = squares[from_square] & 7
+
+        if piece_type == CHARIOT:
+            targets = []
+            for ray in RAYS[from_square]:
+                for to in ray:
+                    targets.append(to)
+                    if squares[to]:
+                        break
+            return targets
+
+        if piece_type == CANNON:
+            targets = []
+            for ray in RAYS[from_square]:
+                jumped = False
+                for to in ray:
+                    next_code = squares[to]
+                    if not jumped:
+                        if next_code:
+                            if next_code & 7 == CANNON:  # cannon can't jump a cannon
+                                break
+                            jumped = True
+                        continue
+                    if not next_code:
+                        targets.append(to)
+                        continue
+                    if next_code & 7 != CANNON:  # cannon can't take cannon
+                        targets.append(to)
+                    break
+            for screen, to in CANNON_PALACE_JUMPS[from_square]:
+                if squares[screen] and squares[screen] & 7 != CANNON:
+                    targets.append(to)
+            return targets
+
+        if piece_type == HORSE:
+            return [to for to, leg in HORSE_MOVES[from_square] if leg == NO_LEG or not squares[leg]]
+
+        if piece_type == ELEPHANT:
+            return [to for to, first_leg, second_leg in ELEPHANT_MOVES[from_square]
+                    if not squares[first_leg] and not squares[second_leg]]
+
+        if piece_type == SOLDIER:
+            return SOLDIER_MOVES[from_square]
+
+        if piece_type:  # General and Guard
+            return PALACE_STEPS[from_square]
+        return ()
+
+    def piece_destinations(self, from_square):
+        """Returns the squares the piece on from_square can move to, skipping squares held by its own side.
+        Moves that would leave its own general in check are included"""
+        squares = self.squares
+        own = squares[from_square] & RED_FLAG
+        return [to for to in self._piece_attacks[from_square] if not squares[to] or squares[to] & RED_FLAG != own]
+
+    def legal_destinations(self, from_square):
+        """Returns the squares the piece on from_square can move to without leaving its own general in check.
+        Answers are cached per square and stay valid until a move changes one of the squares they depend on"""
+        entry = self._destination_cache.get(from_square)
+        if entry is not None:
+            self.cache_hits += 1
+            return list(entry[0])
+        self.cache_misses += 1
+        destinations = self._legal_destinations(from_square)
+        self._destination_cache[from_square] = (tuple(destinations), self._destination_dependencies(from_square))
+        return destinations
+
+    def _destination_dependencies(self, from_square):
+        """Returns a bitmask of the squares whose contents legal_destinations(from_square) depends on: the piece's
+        own square, the squares it watches and attacks, and the squares that decide whether its general is attacked
+        (or, for the general itself, whether each of its destinations is)"""
+        code = self.squares[from_square]
+        targets = self._piece_attacks[from_square]
+        mask = 1 << from_square | WATCH_MASKS[code & 7][from_square]
+        for to in targets:
+            mask |= 1 << to
+        general = self.generals[code >> 3]
+        if general == from_square:
+            for to in targets:
+                mask |= SAFETY_MASKS[to]
+        elif general >= 0:
+            mask |= 1 << general | SAFETY_MASKS[general]
+        return mask
+
+    def _invalidate_destinations(self, changed):
+        """Drops the cached destinations that depend on any square in the bitmask changed"""
+        cache = self._destination_cache
+        for sq in [sq for sq, (_, mask) in cache.items() if mask & changed]:
+            del cache[sq]
+
+    def get_cache_stats(self):
+        """Returns the destination cache size and its hit/miss counters"""
+        return {"entries": len(self._destination_cache), "hits": self.cache_hits, "misses": self.cache_misses}
+
+    def _legal_destinations(self, from_square):
+        """Computes legal_destinations without the cache"""
+        side = self.squares[from_square] >> 3
+        general = self.generals[side]
+        if general < 0:
+            return self.piece_destinations(from_square)
+        # Unless the general itself moves or is already in check, a move can only expose it by changing a square
+        # in its check mask, so every other move is known to be safe without trying it.
+        if from_square == general or self.attacks[side ^ 1][general]:
+            sensitive = -1
+        else:
+            sensitive = CHECK_MASKS[general]
+        legal = []
+        for to in self.piece_destinations(from_square):
+            if not (sensitive >> from_square) & 1 and not (sensitive >> to) & 1 \
+                    or not self._leaves_in_check(from_square, to):
+                legal.append(to)
+        return legal
+
+    def generate_moves(self, side=None):
+        """Returns every packed move for side (the side to move by default) that obeys the movement rules,
+        including moves that leave its own general in check. Passes are excluded"""
+        if side is None:
+            side = self.side
+        moves = []
+        for from_square in self.piece_lists[side]:
+            base = from_square << 7
+            moves.extend(base | to for to in self.piece_destinations(from_square))
+        return moves
+
+    def legal_moves(self, side=None):
+        """Returns every packed move for side (the side to move by default) that does not leave its own general
+        in check. Passes are excluded"""
+        if side is None:
+            side = self.side
+        moves = []
+        for from_square in list(self.piece_lists[side]):
+            base = from_square << 7
+            moves.extend(base | to for to in self._legal_destinations(from_square))
+        return moves
+
+    def is_legal(self, move):
+        """Returns whether the side to move may play a packed move: it must follow the movement rules and must not
+        leave that side's general in check. A pass is legal unless the side to move is in check"""
+        from_square = move >> 7
+        to_square = move & 127
+        code = self.squares[from_square]
+        if not code or code >> 3 != self.side:
+            return False
+        if from_square == to_square:
+            return not self.in_check(self.side)
+        if to_square not in self.piece_destinations(from_square):
+            return False
+        return not self._leaves_in_check(from_square, to_square)
+
+    def in_check(self, side):
+        """Returns whether the general of side is attacked by any enemy piece"""
+        general = self.generals[side]
+        return general >= 0 and self.attacks[side ^ 1][general] > 0
+
+    def checkers(self, side):
+        """Returns the squares of the enemy pieces attacking the general of side"""
+        general = self.generals[side]
+        if general < 0 or not self.attacks[side ^ 1][general]:
+            return []
+        return [sq for sq in self.piece_lists[side ^ 1] if general in self._piece_attacks[sq]]
+
+    def is_checkmate(self, side=None):
+        """Returns whether side (the side to move by default) is checkmated. Rather than trying every move, only
+        the moves that could answer the check are tried: general moves, captures of a checking piece, moves onto
+        a square between a checker and the general (or onto a horse or elephant leg), and moves of a piece
+        screening a checking cannon. A side that is not in check always has a legal turn, since it may skip it,
+        so there is no stalemate"""
+        if side is None:
+            side = self.side
+        if not self.in_check(side):
+            return False
+        general = self.generals[side]
+        for to in self.piece_destinations(general):
+            if not self._leaves_in_check(general, to):
+                return False
+
+        squares = self.squares
+        answers = 0  # squares a piece can move to in order to answer the check
+        screens = 0  # our own pieces whose moving away breaks a cannon check
+        for checker in self.checkers(side):
+            answers |= 1 << checker
+            piece_type = squares[checker] & 7
+            if piece_type == CHARIOT or piece_type == CANNON:
+                for ray in RAYS[checker]:
+                    if general in ray:
+                        for sq in ray[:ray.index(general)]:
+                            answers |= 1 << sq
+                            if squares[sq] and squares[sq] >> 3 == side:
+                                screens |= 1 << sq
+                for screen, to in CANNON_PALACE_JUMPS[checker]:
+                    if to == general:
+                        answers |= 1 << screen
+                        if squares[screen] and squares[screen] >> 3 == side:
+                            screens |= 1 << screen
+            elif piece_type == HORSE:
+                for to, leg in HORSE_MOVES[checker]:
+                    if to == general and leg != NO_LEG:
+                        answers |= 1 << leg
+            elif piece_type == ELEPHANT:
+                for to, first_leg, second_leg in ELEPHANT_MOVES[checker]:
+                    if to == general:
+                        answers |= 1 << first_leg | 1 << second_leg
+
+        for from_square in self.piece_lists[side]:
+            if from_square == general:
+                continue
+            moves_away = (screens >> from_square) & 1
+            for to in self.piece_destinations(from_square):
+                if (moves_away or (answers >> to) & 1) and not self._leaves_in_check(from_square, to):
+                    return False
+        return True
+
+    def gives_check(self, move):
+        """Returns whether a packed move by the side to move would attack the enemy general, either directly or by
+        opening a line for another piece"""
+        from_square = move >> 7
+        to_square = move & 127
+        enemy_general = self.generals[self.side ^ 1]
+        if from_square == to_square or enemy_general < 0:
+            return False
+        mask = CHECK_MASKS[enemy_general]
+        if not (mask >> from_square) & 1 and not (mask >> to_square) & 1 \
+                and not (REACH_MASKS[self.squares[from_square] & 7][to_square] >> enemy_general) & 1:
+            return False  # no line to the general changes and the moved piece can't reach it from to_square
+        return self._attacked_after(from_square, to_square, self.side, enemy_general)
+
+    def _leaves_in_check(self, from_square, to_square):
+        """Returns whether moving the piece on from_square to to_square would leave its own general attacked"""
+        side = self.squares[from_square] >> 3
+        general = self.generals[side]
+        if general < 0:
+            return False
+        if general == from_square:
+            general = to_square
+        return self._attacked_after(from_square, to_square, side ^ 1, general)
+
+    def _attacked_after(self, from_square, to_square, attacker_side, target):
+        """Returns whether any piece of attacker_side would attack target once the piece on from_square moved to
+        to_square. Only the pieces whose rays or legs pass through the two squares are recomputed; everything else
+        is read from the attack maps, which are left alone"""
+        squares = self.squares
+        moved = squares[from_square]
+        captured = squares[to_square]
+        squares[to_square] = moved
+        squares[from_square] = EMPTY
+        try:
+            changed = 1 << from_square | 1 << to_square
+            for sq in self.piece_lists[attacker_side]:
+                if sq == from_square:  # the moving piece itself, now standing on to_square
+                    if target in self._targets(to_square):
+                        return True
+                elif sq == to_square:  # about to be captured
+                    continue
+                elif WATCH_MASKS[squares[sq] & 7][sq] & changed:
+                    if target in self._targets(sq):
+                        return True
+                elif target in self._piece_attacks[sq]:
+                    return True
+            return False
+        finally:
+            squares[from_square] = moved
+            squares[to_square] = captured
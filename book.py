@@ -0,0 +1,169 @@
+# Description: Opening book built from game archives. Every (position, move) pair seen in the first plies of the
+# archived games is counted together with how the games went for the side that played it. The book is written as a
+# sorted file of fixed-size records and queried through mmap with a binary search, so opening it is instant and
+# nothing is loaded into memory.
+#
+# Usage:
+#     python book.py build games.txt book.bin [--plies 12] [--min-count 2]
+#     python book.py probe book.bin [c7 c6 c1 d3 ...]     book moves after the given moves
+#
+# Record layout (little-endian): position hash u64, packed move u16, games u32, wins u32, losses u32.
+# Records are sorted by hash, and by games played (most first) within a hash.
+
+import argparse
+import random
+import struct
+from collections import namedtuple
+
+from board import COLORS, encode_move, move_from, move_to
+from main import JanggiGame
+from notation import BinaryStore
+from replay import Replayer, read_games
+from tables import pos_to_square, square_to_pos
+
+BOOK_MAGIC = b"JANGGIBK"
+_RECORD = struct.Struct("<QHIII")
+RECORD_SIZE = _RECORD.size
+
+BookEntry = namedtuple("BookEntry", ["move", "games", "wins", "losses"])
+
+
+def collect(games, plies=12):
+    """Counts the (position hash, packed move) pairs in the first plies of every game. Returns a dict mapping
+    them to [games, wins, losses], where wins and losses are from the point of view of the side that moved
+    (drawn games count towards games only). A game with an illegal move only counts up to it"""
+    stats = {}
+    replayer = Replayer()
+    for game_id, game_moves in enumerate(games):
+        game_moves = list(game_moves)
+        result = replayer.replay(game_id, game_moves)
+        length = result.plies if result.first_illegal_ply is None else result.first_illegal_ply
+        for ply in range(min(plies, length)):
+            pos1, pos2 = game_moves[ply]
+            key = (result.positions[ply], encode_move(pos_to_square(pos1), pos_to_square(pos2)))
+            entry = stats.get(key)
+            if entry is None:
+                entry = stats[key] = [0, 0, 0]
+            entry[0] += 1
+            mover = COLORS[ply % 2]  # blue moves first
+            if result.state == mover + "_WON":
+                entry[1] += 1
+            elif result.state not in ("UNFINISHED", "DRAW"):
+                entry[2] += 1
+    return stats
+
+
+def write_book(stream, stats, min_count=1):
+    """Writes the book file for stats (see collect), leaving out moves played in fewer than min_count games.
+    Returns the number of records written"""
+    records = sorted(((key, move, *counts) for (key, move), counts in stats.items() if counts[0] >= min_count),
+                     key=lambda record: (record[0], -record[2], record[1]))
+    stream.write(BOOK_MAGIC)
+    for record in records:
+        stream.write(_RECORD.pack(*record))
+    return len(records)
+
+
+def build_book(archive_path, book_path, plies=12, min_count=1):
+    """Builds a book file from a game archive in the replay.py format. Returns the number of records"""
+    with open(archive_path) as archive:
+        stats = collect(read_games(archive), plies)
+    with open(book_path, "wb") as book_file:
+        return write_book(book_file, stats, min_count)
+
+
+class OpeningBook(BinaryStore):
+    """Read-only view of a book file. Use OpeningBook.open(path) to map a file"""
+
+    def __init__(self, buffer):
+        """Wraps a book held in any bytes-like object or mmap"""
+        BinaryStore.__init__(self, buffer, BOOK_MAGIC)
+        self._count = (len(self._view) - len(BOOK_MAGIC)) // RECORD_SIZE
+
+    def __len__(self):
+        """Returns the number of records"""
+        return self._count
+
+    def _record(self, index):
+        """Unpacks the record at index"""
+        return _RECORD.unpack_from(self._view, len(BOOK_MAGIC) + index * RECORD_SIZE)
+
+    def lookup(self, key):
+        """Returns the BookEntry list stored for a position hash, most played first"""
+        low, high = 0, self._count
+        while low < high:  # first record whose hash is >= key
+            middle = (low + high) // 2
+            if self._record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self._count:
+            record = self._record(low)
+            if record[0] != key:
+                break
+            entries.append(BookEntry(*record[1:]))
+            low += 1
+        return entries
+
+    def choose_move(self, board, chooser=None, min_count=1):
+        """Returns a legal packed book move for a CompactBoard, or None if the position isn't in the book.
+        Moves are picked at random in proportion to how often they were played; pass a random.Random as chooser
+        for repeatable picks"""
+        entries = [entry for entry in self.lookup(board.hash)
+                   if entry.games >= min_count and board.is_legal(entry.move)]  # guards against hash collisions
+        if not entries:
+            return None
+        chooser = chooser or random
+        pick = chooser.randrange(sum(entry.games for entry in entries))
+        for entry in entries:
+            pick -= entry.games
+            if pick < 0:
+                return entry.move
+
+
+def book_move(game, book, chooser=None):
+    """Returns a (pos1, pos2) book move for the current position of a JanggiGame, or None"""
+    move = book.choose_move(game.get_compact_board(), chooser)
+    if move is None:
+        return None
+    return square_to_pos(move_from(move)), square_to_pos(move_to(move))
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Janggi opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build a book from a game archive")
+    build_parser.add_argument("archive")
+    build_parser.add_argument("book")
+    build_parser.add_argument("--plies", type=int, default=12, help="plies of every game to include")
+    build_parser.add_argument("--min-count", type=int, default=1, help="leave out moves played fewer times")
+    probe_parser = commands.add_parser("probe", help="list the book moves of a position")
+    probe_parser.add_argument("book")
+    probe_parser.add_argument("moves", nargs="*", help="positions of the moves leading to the position")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_book(args.archive, args.book, args.plies, args.min_count)
+        print("wrote", count, "records to", args.book)
+        return 0
+
+    game = JanggiGame()
+    for pos1, pos2 in zip(args.moves[0::2], args.moves[1::2]):
+        if not game.make_move(pos1, pos2):
+            print("illegal move:", pos1, pos2)
+            return 1
+    with OpeningBook.open(args.book) as book:
+        entries = book.lookup(game.get_position_hash())
+        for entry in entries:
+            print("%s %s  games %d  wins %d  losses %d" % (square_to_pos(move_from(entry.move)),
+                                                            square_to_pos(move_to(entry.move)),
+                                                            entry.games, entry.wins, entry.losses))
+        if not entries:
+            print("position not in book")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,261 @@
+# Description: Headless engine speaking a UCI-style text protocol on stdin/stdout, so GUIs and match runners can drive
+# the alpha-beta Searcher. Searches run in a background thread while commands keep being read; the Searcher (and with
+# it the transposition table) lives as long as the engine, so everything learned while pondering on the predicted
+# reply is still there when the real search starts.
+#
+# Usage:
+#     python engine.py [--table-size 1048576] [--tablebases tablebases]
+#
+# Protocol (one command per line; moves are written as two positions run together, e.g. c7c6, and a pass as the
+# general's position twice, e.g. e9e9):
+#     uci                                  id name/author, the options, then uciok
+#     isready                              readyok
+#     ucinewgame                           forgets everything learned in earlier games
+#     position startpos [moves m1 m2 ...]  sets up the opening, then plays the moves
+#     position text <rows> <b|r> [moves m1 m2 ...]    the same from a notation.py text position
+#     go [wtime ms] [btime ms] [winc ms] [binc ms] [movestogo n] [movetime ms] [depth n] [infinite] [ponder]
+#                                          starts searching; wtime/winc belong to blue, who moves first, btime/binc to
+#                                          red. The search reports "info depth ... pv <move>" after each iteration and
+#                                          ends with "bestmove <move> [ponder <predicted reply>]"
+#     ponderhit                            the predicted reply was played: a "go ponder" search carries on as a timed
+#                                          search under the limits given with it
+#     stop                                 ends the search; its best move is reported at once
+#     setoption name <name> [value <v>]    accepted for GUI compatibility; no option changes the search
+#     quit                                 stops and exits
+# Unknown commands are answered with "info string unknown command <command>" and otherwise ignored. A "go infinite" or
+# "go ponder" search holds its bestmove back until stop or ponderhit, even when it finishes early.
+
+import argparse
+import re
+import sys
+import threading
+import time
+
+from board import encode_move, move_from, move_to
+from notation import START_TEXT, parse_text
+from replay import play_move
+from search import MATE, MATE_BOUND, Searcher
+from tables import square_to_pos
+from zobrist import TranspositionTable
+
+ENGINE_NAME = "Janggi"
+ENGINE_AUTHOR = "the Janggi authors"
+MOVES_TO_GO = 30  # moves the remaining clock time is assumed to cover when the GUI doesn't say
+MOVE_OVERHEAD_MS = 30  # kept back from every timed move for the round trip to the GUI
+
+_MOVE = re.compile(r"([a-i](?:10|[1-9]))([a-i](?:10|[1-9]))")
+
+
+def format_move(move):
+    """Returns the protocol text of a packed move"""
+    return square_to_pos(move_from(move)) + square_to_pos(move_to(move))
+
+
+def time_budget(limits, side):
+    """Returns the milliseconds to spend on a move under the limits of a go command (a dict of its numeric
+    parameters) for side (0 blue, 1 red), or None if they set no time limit"""
+    if "movetime" in limits:
+        return max(1, limits["movetime"] - MOVE_OVERHEAD_MS)
+    clock = limits.get(("wtime", "btime")[side])
+    if clock is None:
+        return None
+    increment = limits.get(("winc", "binc")[side], 0)
+    budget = clock // max(1, limits.get("movestogo", MOVES_TO_GO)) + increment * 3 // 4
+    return max(1, min(budget, clock // 2, clock - MOVE_OVERHEAD_MS))
+
+
+class Engine:
+    """Reads protocol commands through handle() and writes the replies to output"""
+
+    def __init__(self, output=None, table_size=1 << 20, tablebases=None):
+        """Creates an engine with a transposition table of table_size slots. tablebases, a tablebase.TablebaseSet,
+        is handed to the Searcher"""
+        self.output = output or sys.stdout
+        self.searcher = Searcher(TranspositionTable(table_size), tablebases)
+        self.board = parse_text(START_TEXT)
+        self._output_lock = threading.Lock()
+        self._thread = None
+        self._release = threading.Event()  # set once a ponder or infinite search may report its best move
+        self._start = 0.0
+        self._time_ms = None  # the budget a ponder search switches to on ponderhit
+        self._deadline = None  # set by ponderhit; applied by the search thread after every iteration as well
+
+    def send(self, line):
+        """Writes one reply line"""
+        with self._output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """Carries out one command line. Returns False once the engine should exit"""
+        fields = line.split()
+        if not fields:
+            return True
+        command = fields[0]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Ponder type check default true")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            self.searcher = Searcher(TranspositionTable(len(self.searcher.table)), self.searcher.tablebases)
+            self.board = parse_text(START_TEXT)
+        elif command == "position":
+            self.stop()
+            try:
+                self.board = self._position(fields[1:])
+            except ValueError as error:
+                self.send("info string bad position: %s" % error)
+        elif command == "go":
+            self.stop()
+            try:
+                self.go(fields[1:])
+            except ValueError as error:
+                self.send("info string bad go command: %s" % error)
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "stop":
+            self.stop()
+        elif command == "setoption":
+            pass
+        elif command == "quit":
+            self.stop()
+            return False
+        else:
+            self.send("info string unknown command " + command)
+        return True
+
+    def _position(self, fields):
+        """Returns the CompactBoard described by the fields of a position command"""
+        if "moves" in fields:
+            split = fields.index("moves")
+            setup, moves = fields[:split], fields[split + 1:]
+        else:
+            setup, moves = fields, []
+        if setup == ["startpos"]:
+            board = parse_text(START_TEXT)
+        elif setup[:1] == ["text"]:
+            board = parse_text(" ".join(setup[1:]))
+        else:
+            raise ValueError("expected startpos or text <position>")
+        for text in moves:
+            match = _MOVE.fullmatch(text)
+            if match is None or board.is_checkmate() or play_move(board, match.group(1), match.group(2)) is None:
+                raise ValueError("illegal move " + text)
+        return board
+
+    def go(self, fields):
+        """Starts a background search under the limits in the fields of a go command"""
+        limits = {}
+        flags = set()
+        index = 0
+        while index < len(fields):
+            name = fields[index]
+            if name in ("infinite", "ponder"):
+                flags.add(name)
+                index += 1
+                continue
+            if index + 1 == len(fields):
+                raise ValueError("%s needs a value" % name)
+            limits[name] = int(fields[index + 1])
+            index += 2
+        self._time_ms = time_budget(limits, self.board.side)
+        self._deadline = None
+        self._start = time.perf_counter()
+        waits = bool(flags)
+        if waits:
+            self._release.clear()
+        else:
+            self._release.set()
+        time_ms = None if waits else self._time_ms
+        self._thread = threading.Thread(target=self._search, args=(self.board.copy(), time_ms,
+                                                                   limits.get("depth", 64)), daemon=True)
+        self._thread.start()
+
+    def ponderhit(self):
+        """Turns a ponder search into a timed search of the same position, keeping what it has found so far"""
+        if self._thread is None or self._release.is_set():
+            return
+        if self._time_ms is not None:
+            self._deadline = time.perf_counter() + self._time_ms / 1000
+            self.searcher.set_time_left(self._time_ms)
+        self._release.set()
+
+    def stop(self):
+        """Ends the running search, if any, once it has reported its best move"""
+        thread = self._thread
+        if thread is None:
+            return
+        while thread.is_alive():
+            self.searcher.stop()  # again on every pass, in case the search hadn't started yet
+            self._release.set()
+            thread.join(0.01)
+        self._thread = None
+
+    def _search(self, board, time_ms, max_depth):
+        """Runs in the search thread: searches board and reports the best move and the predicted reply"""
+        result = self.searcher.search(board, time_ms, max_depth, self._info)
+        self._release.wait()
+        moves = board.legal_moves()
+        if moves:
+            move = result.move if result.move is not None else moves[0]
+        elif board.in_check(board.side):  # checkmated
+            self.send("bestmove (none)")
+            return
+        else:
+            general = board.generals[board.side]
+            move = encode_move(general, general)  # nothing to play but a pass
+        reply = self._predicted_reply(board, move)
+        self.send("bestmove " + format_move(move) + ("" if reply is None else " ponder " + format_move(reply)))
+
+    def _info(self, result):
+        """Reports a completed iteration, and hands a ponderhit deadline to the search in case ponderhit arrived
+        before the search had set its own"""
+        if self._deadline is not None:
+            self.searcher.set_time_left(max(0.0, (self._deadline - time.perf_counter()) * 1000))
+        if result.move is None:
+            return
+        if abs(result.score) >= MATE_BOUND:
+            plies = MATE - abs(result.score)
+            score = "mate %d" % ((plies + 1) // 2 if result.score > 0 else -(plies // 2))
+        else:
+            score = "cp %d" % result.score
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+            result.depth, score, result.nodes, result.nps, (time.perf_counter() - self._start) * 1000,
+            format_move(result.move)))
+
+    def _predicted_reply(self, board, move):
+        """Returns the transposition table move for the position after move, if it is legal there"""
+        board = board.copy()
+        board.make_move(move)
+        entry = self.searcher.table.probe(board.hash)
+        if entry is None or entry[3] is None or not board.is_legal(entry[3]):
+            return None
+        return entry[3]
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Janggi engine speaking a UCI-style protocol on stdin/stdout")
+    parser.add_argument("--table-size", type=int, default=1 << 20, help="transposition table slots")
+    parser.add_argument("--tablebases", default=None, help="directory of endgame tablebases to probe")
+    args = parser.parse_args(argv)
+
+    tablebases = None
+    if args.tablebases is not None:
+        from tablebase import TablebaseSet
+        tablebases = TablebaseSet(args.tablebases)
+    engine = Engine(table_size=args.table_size, tablebases=tablebases)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else:
+        engine.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
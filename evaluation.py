@@ -0,0 +1,174 @@
+# Description: Static evaluation of CompactBoard positions: material, piece-square tables and palace safety.
+# Material and piece-square values are folded into one table per piece code, so a CompactBoard keeps a running total
+# for each side that make_move/unmake_move adjust as pieces move and are captured.
+#
+# Tables are indexed by piece type (GENERAL=1 ... SOLDIER=7, see tables.py) and are written from blue's side of the
+# board: the first row is row 1 (red's back rank), the last is row 10 (blue's back rank). Red uses them mirrored.
+
+from tables import BOARD_WIDTH, BOARD_HEIGHT, NUM_SQUARES, PALACE, GUARD
+
+PIECE_VALUES = (0, 0, 300, 300, 500, 1300, 700, 200)  # indexed by piece type; the general is priceless
+
+_GENERAL_TABLE = (
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, -20, -15, -20, 0, 0, 0),
+    (0, 0, 0, -5, 10, -5, 0, 0, 0),
+    (0, 0, 0, 0, 5, 0, 0, 0, 0),
+)
+
+_GUARD_TABLE = (
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (0, 0, 0, -10, -5, -10, 0, 0, 0),
+    (0, 0, 0, 0, 10, 0, 0, 0, 0),
+    (0, 0, 0, 5, 0, 5, 0, 0, 0),
+)
+
+_ELEPHANT_TABLE = (
+    (-10, -5, -5, -5, -5, -5, -5, -5, -10),
+    (-5, 0, 0, 0, 0, 0, 0, 0, -5),
+    (-5, 0, 5, 5, 5, 5, 5, 0, -5),
+    (-5, 0, 5, 10, 10, 10, 5, 0, -5),
+    (-5, 0, 5, 10, 10, 10, 5, 0, -5),
+    (-5, 0, 5, 10, 10, 10, 5, 0, -5),
+    (-5, 0, 5, 5, 10, 5, 5, 0, -5),
+    (-5, 0, 0, 5, 5, 5, 0, 0, -5),
+    (-5, 0, 0, 0, 0, 0, 0, 0, -5),
+    (-10, -5, 0, -5, -5, -5, 0, -5, -10),
+)
+
+_HORSE_TABLE = (
+    (-10, -5, 0, 0, 0, 0, 0, -5, -10),
+    (-5, 5, 10, 15, 15, 15, 10, 5, -5),
+    (0, 10, 20, 20, 20, 20, 20, 10, 0),
+    (0, 10, 15, 20, 20, 20, 15, 10, 0),
+    (-5, 5, 10, 15, 15, 15, 10, 5, -5),
+    (-5, 5, 10, 10, 15, 10, 10, 5, -5),
+    (-5, 0, 5, 10, 10, 10, 5, 0, -5),
+    (-10, 0, 5, 5, 5, 5, 5, 0, -10),
+    (-10, -5, 0, 0, 0, 0, 0, -5, -10),
+    (-20, -10, -5, -5, -5, -5, -5, -10, -20),
+)
+
+_CHARIOT_TABLE = (
+    (10, 10, 10, 20, 25, 20, 10, 10, 10),
+    (15, 15, 15, 25, 30, 25, 15, 15, 15),
+    (10, 10, 10, 20, 25, 20, 10, 10, 10),
+    (5, 10, 10, 15, 15, 15, 10, 10, 5),
+    (5, 10, 10, 10, 10, 10, 10, 10, 5),
+    (0, 5, 5, 10, 10, 10, 5, 5, 0),
+    (0, 5, 5, 5, 5, 5, 5, 5, 0),
+    (-5, 0, 0, 5, 5, 5, 0, 0, -5),
+    (-5, 0, 0, 0, 0, 0, 0, 0, -5),
+    (-5, -5, 0, 0, -10, 0, 0, -5, -5),
+)
+
+_CANNON_TABLE = (
+    (0, 0, 5, 10, 10, 10, 5, 0, 0),
+    (0, 0, 5, 10, 15, 10, 5, 0, 0),
+    (0, 0, 0, 5, 10, 5, 0, 0, 0),
+    (0, 0, 0, 0, 5, 0, 0, 0, 0),
+    (0, 0, 0, 0, 5, 0, 0, 0, 0),
+    (0, 0, 0, 0, 5, 0, 0, 0, 0),
+    (0, 0, 0, 0, 5, 0, 0, 0, 0),
+    (0, 5, 0, 5, 10, 5, 0, 5, 0),
+    (0, 0, 0, 10, 15, 10, 0, 0, 0),
+    (0, 0, 0, 5, 5, 5, 0, 0, 0),
+)
+
+_SOLDIER_TABLE = (
+    (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    (20, 25, 30, 40, 50, 40, 30, 25, 20),
+    (20, 25, 35, 45, 55, 45, 35, 25, 20),
+    (15, 20, 25, 35, 40, 35, 25, 20, 15),
+    (10, 15, 20, 25, 30, 25, 20, 15, 10),
+    (5, 10, 10, 15, 20, 15, 10, 10, 5),
+    (0, 0, 5, 5, 10, 5, 5, 0, 0),
+    (-5, 0, 0, 0, 0, 0, 0, 0, -5),
+    (-10, -5, 0, 0, 0, 0, 0, -5, -10),
+    (-10, -5, 0, 0, 0, 0, 0, -5, -10),
+)
+
+SQUARE_TABLES = (None, _GENERAL_TABLE, _GUARD_TABLE, _ELEPHANT_TABLE, _HORSE_TABLE, _CHARIOT_TABLE, _CANNON_TABLE,
+                 _SOLDIER_TABLE)
+
+PALACE_ATTACK_PENALTY = 15  # for every enemy attack on a square of a side's own palace
+PALACE_DEFENCE_BONUS = 5  # for every square of a side's own palace it attacks at least once
+EXPOSED_GENERAL_PENALTY = 40  # for a general with no guard left beside it
+
+
+def _build_piece_square_values():
+    """PIECE_SQUARE_VALUES[code][square]: material plus piece-square value of a piece code on a square, from the
+    point of view of the piece's owner. Code 0 (empty) is all zeros"""
+    values = []
+    for code in range(16):
+        piece_type = code & 7
+        if not piece_type:
+            values.append((0,) * NUM_SQUARES)
+            continue
+        table = SQUARE_TABLES[piece_type]
+        row_values = []
+        for y in range(BOARD_HEIGHT):
+            row = table[BOARD_HEIGHT - 1 - y] if code & 8 else table[y]  # red sees the board upside down
+            row_values.extend(PIECE_VALUES[piece_type] + value for value in row)
+        values.append(tuple(row_values))
+    return tuple(values)
+
+
+PIECE_SQUARE_VALUES = _build_piece_square_values()
+
+# palace squares of each side (BLUE, RED) and the squares next to each one
+PALACE_SQUARES = (tuple(sorted(sq for sq in PALACE if sq >= NUM_SQUARES // 2)),
+                  tuple(sorted(sq for sq in PALACE if sq < NUM_SQUARES // 2)))
+_PALACE_NEIGHBOURS = {sq: tuple(other for other in PALACE
+                                if other != sq and abs(other // BOARD_WIDTH - sq // BOARD_WIDTH) <= 1
+                                and abs(other % BOARD_WIDTH - sq % BOARD_WIDTH) <= 1)
+                      for sq in PALACE}
+
+
+def material_and_squares(squares):
+    """Computes the material plus piece-square total of each side (BLUE, RED) from scratch"""
+    totals = [0, 0]
+    for sq, code in enumerate(squares):
+        if code:
+            totals[code >> 3] += PIECE_SQUARE_VALUES[code][sq]
+    return totals
+
+
+def palace_safety(board, side):
+    """Scores the palace of side: defended squares count for it, enemy attacks and a general without a guard
+    next to it count against it"""
+    own = board.attacks[side]
+    enemy = board.attacks[side ^ 1]
+    score = 0
+    for sq in PALACE_SQUARES[side]:
+        if own[sq]:
+            score += PALACE_DEFENCE_BONUS
+        score -= enemy[sq] * PALACE_ATTACK_PENALTY
+    general = board.generals[side]
+    if general >= 0:
+        squares = board.squares
+        guard = GUARD | (side << 3)
+        if not any(squares[sq] == guard for sq in _PALACE_NEIGHBOURS[general]):
+            score -= EXPOSED_GENERAL_PENALTY
+    return score
+
+
+def evaluate(board):
+    """Returns the score of a CompactBoard from the point of view of the side to move. Material and piece-square
+    values come from the board's running totals; only palace safety is looked at here"""
+    side = board.side
+    scores = board.scores
+    return (scores[side] - scores[side ^ 1]
+            + palace_safety(board, side) - palace_safety(board, side ^ 1))
@@ -0,0 +1,345 @@
+# Description: Position search over game archives. An archive in the replay.py format is replayed once and indexed
+# on disk by position hash (which games reached a position, and at which ply) and by material signature (the piece
+# counts of both sides). Index segments are sorted runs of fixed-size records read through mmap with a binary search,
+# and queries yield their hits one at a time, so neither building nor querying holds more than one run in memory.
+# Updating an index after games were appended to its archive only replays the new games, which go into new segments.
+#
+# Usage:
+#     python gameindex.py build games.txt index_dir [--run-size 500000] [--rebuild]
+#     python gameindex.py query index_dir [--moves c7 c6 c1 d3 ...] [--position "<text>"] [--material KRR-K]
+#                                         [--limit 20]
+#
+# Index directory: manifest.json (the archive, how many of its games and bytes are indexed, and the segment files)
+# and segment-00000.idx, segment-00001.idx, ... Each segment covers a run of consecutive games and holds, after the
+# magic and a header (first game id, games, position records, material records), the archive byte offset of each of
+# its games, then position records (hash u64, game id u32, ply u16) sorted by hash, game and ply, then material
+# records with the same layout holding the material signature in place of the hash.
+
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+from itertools import islice
+
+from board import BLUE, RED
+from notation import START_TEXT, BinaryStore, parse_text
+from replay import Replayer, play_move, read_games
+from tablebase import MATERIAL_LETTERS, LETTER_TYPES
+
+SEGMENT_MAGIC = b"JANGGIIX"
+MANIFEST_NAME = "manifest.json"
+_HEADER = struct.Struct("<IIQQ")  # first game id, games, position records, material records
+_OFFSET = struct.Struct("<Q")
+_RECORD = struct.Struct("<QIH")  # key, game id, ply
+_CHECK_BYTES = 4096  # tail of the indexed part of the archive whose checksum tells an append from a rewrite
+
+IndexHit = namedtuple("IndexHit", ["game_id", "ply"])
+IndexStats = namedtuple("IndexStats", ["games_added", "positions_added", "games", "segments", "seconds"])
+
+
+def material_signature(board):
+    """Returns the material signature of a CompactBoard: three bits counting each piece type of each side"""
+    squares = board.squares
+    signature = 0
+    for side in (BLUE, RED):
+        base = side * 7 - 1
+        for sq in board.piece_lists[side]:
+            signature += 1 << (base + (squares[sq] & 7)) * 3
+    return signature
+
+
+def parse_material(name):
+    """Returns the material signature for a material name such as "KRR-K" (blue's pieces, then red's, in any
+    order). Raises ValueError for a malformed name"""
+    sides = name.upper().split("-")
+    if len(sides) != 2 or any(letter not in LETTER_TYPES for letters in sides for letter in letters):
+        raise ValueError("material must look like KRR-K, not %r" % name)
+    signature = 0
+    for side, letters in zip((BLUE, RED), sides):
+        for letter in letters:
+            signature += 1 << (side * 7 - 1 + LETTER_TYPES[letter]) * 3
+    return signature
+
+
+def material_text(signature):
+    """Returns the material name of a signature, pieces in type order"""
+    return "-".join("".join(MATERIAL_LETTERS[piece_type] * (signature >> (side * 7 - 1 + piece_type) * 3 & 7)
+                            for piece_type in sorted(MATERIAL_LETTERS))
+                    for side in (BLUE, RED))
+
+
+class IndexSegment(BinaryStore):
+    """Read-only view of one segment file. Use IndexSegment.open(path) to map a file"""
+
+    def __init__(self, buffer):
+        """Wraps a segment held in any bytes-like object or mmap"""
+        BinaryStore.__init__(self, buffer, SEGMENT_MAGIC)
+        self.first_game, self.games, positions, materials = _HEADER.unpack_from(self._view, len(SEGMENT_MAGIC))
+        self._offsets = len(SEGMENT_MAGIC) + _HEADER.size
+        self._positions = (self._offsets + self.games * _OFFSET.size, positions)
+        self._materials = (self._positions[0] + positions * _RECORD.size, materials)
+
+    def __len__(self):
+        """Returns the number of games"""
+        return self.games
+
+    def game_offset(self, game_id):
+        """Returns the archive byte offset of a game in this segment"""
+        return _OFFSET.unpack_from(self._view, self._offsets + (game_id - self.first_game) * _OFFSET.size)[0]
+
+    def _scan(self, table, key):
+        """Yields an IndexHit for every record of key in table (a (start, count) pair), in game and ply order"""
+        start, count = table
+        view = self._view
+        low, high = 0, count
+        while low < high:  # first record whose key is >= key
+            middle = (low + high) // 2
+            if _RECORD.unpack_from(view, start + middle * _RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        while low < count:
+            record_key, game_id, ply = _RECORD.unpack_from(view, start + low * _RECORD.size)
+            if record_key != key:
+                return
+            yield IndexHit(game_id, ply)
+            low += 1
+
+    def positions(self, key):
+        """Yields the IndexHits of a position hash"""
+        return self._scan(self._positions, key)
+
+    def materials(self, signature):
+        """Yields the IndexHits of a material signature"""
+        return self._scan(self._materials, signature)
+
+
+def write_segment(stream, first_game, offsets, positions, materials):
+    """Writes a segment file for the games numbered from first_game, whose archive offsets are given. positions and
+    materials are lists of records packed into ints as key << 48 | game id << 16 | ply; they are sorted in place"""
+    positions.sort()
+    materials.sort()
+    stream.write(SEGMENT_MAGIC)
+    stream.write(_HEADER.pack(first_game, len(offsets), len(positions), len(materials)))
+    stream.write(b"".join(_OFFSET.pack(offset) for offset in offsets))
+    for records in (positions, materials):
+        stream.write(b"".join(_RECORD.pack(record >> 48, record >> 16 & 0xFFFFFFFF, record & 0xFFFF)
+                              for record in records))
+
+
+def _read_manifest(index_dir):
+    """Returns the manifest of an index directory, or None if there is none"""
+    try:
+        with open(os.path.join(index_dir, MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(index_dir, manifest):
+    """Replaces the manifest in one step, so a failed update leaves the previous index usable"""
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _tail_check(archive, offset):
+    """Returns the checksum of the _CHECK_BYTES bytes of an open archive that end at offset"""
+    start = max(0, offset - _CHECK_BYTES)
+    archive.seek(start)
+    return zlib.crc32(archive.read(offset - start))
+
+
+def _archive_games(archive, offset):
+    """Yields (byte offset, end offset, moves) for every game in a binary archive stream from offset on. A last
+    line without its newline may still be being written and is left for the next update"""
+    archive.seek(offset)
+    for line in archive:
+        if not line.endswith(b"\n"):
+            return
+        for moves in read_games([line.decode("ascii", "replace")]):
+            yield offset, offset + len(line), moves
+        offset += len(line)
+
+
+def update_index(archive_path, index_dir, run_size=500000, rebuild=False, progress=None):
+    """Brings the index in index_dir up to date with a game archive, creating it if needed. Only games appended
+    since the last update are replayed, unless the indexed part of the archive has changed or rebuild is set, in
+    which case the index is built afresh. A new segment is started whenever run_size records are waiting to be
+    written. progress, if given, is called with an IndexStats after every segment. Returns the final IndexStats"""
+    start = time.perf_counter()
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = None if rebuild else _read_manifest(index_dir)
+    with open(archive_path, "rb") as archive, open(archive_path, "rb") as checked:
+        size = os.fstat(archive.fileno()).st_size
+        if manifest is not None and (manifest["offset"] > size
+                                     or _tail_check(checked, manifest["offset"]) != manifest["check"]):
+            manifest = None
+        if manifest is None:
+            old = _read_manifest(index_dir)
+            for name in old["segments"] if old is not None else []:
+                os.remove(os.path.join(index_dir, name))
+            manifest = {"archive": os.path.abspath(archive_path), "games": 0, "offset": 0,
+                        "check": _tail_check(checked, 0), "segments": []}
+            _write_manifest(index_dir, manifest)
+
+        replayer = Replayer()
+        offsets, positions, materials = [], [], []
+        added = positions_added = 0
+        game_id = manifest["games"]
+        end = manifest["offset"]
+        count = signature = None
+        plies = []
+
+        def visit(board):
+            """Collects the material signature of every position, recounting only after a capture"""
+            nonlocal count, signature
+            pieces = len(board.piece_lists[0]) + len(board.piece_lists[1])
+            if pieces != count:
+                count, signature = pieces, material_signature(board)
+            plies.append(signature)
+
+        def flush():
+            """Writes the waiting records as the next segment and records it in the manifest"""
+            name = "segment-%05d.idx" % len(manifest["segments"])
+            with open(os.path.join(index_dir, name), "wb") as segment_file:
+                write_segment(segment_file, game_id - len(offsets), offsets, positions, materials)
+            manifest["segments"].append(name)
+            manifest["games"] = game_id
+            manifest["offset"] = end
+            manifest["check"] = _tail_check(checked, end)
+            _write_manifest(index_dir, manifest)
+            if progress is not None:
+                progress(IndexStats(added, positions_added, game_id, len(manifest["segments"]),
+                                    time.perf_counter() - start))
+            del offsets[:], positions[:], materials[:]
+
+        for offset, end, moves in _archive_games(archive, manifest["offset"]):
+            count = None
+            del plies[:]
+            result = replayer.replay(game_id, moves, visit=visit)
+            base = game_id << 16
+            for ply, (key, material) in enumerate(zip(result.positions, plies)):
+                positions.append(key << 48 | base | ply)
+                materials.append(material << 48 | base | ply)
+            offsets.append(offset)
+            game_id += 1
+            added += 1
+            positions_added += len(plies)
+            if len(positions) >= run_size:
+                flush()
+        if offsets:
+            flush()
+    return IndexStats(added, positions_added, manifest["games"], len(manifest["segments"]),
+                      time.perf_counter() - start)
+
+
+class ArchiveIndex:
+    """Query side of an index directory. Queries are generators over the mapped segments, yielding hits in game
+    and ply order without collecting them first"""
+
+    def __init__(self, index_dir):
+        """Maps every segment listed in the manifest. Raises FileNotFoundError if index_dir holds no index"""
+        manifest = _read_manifest(index_dir)
+        if manifest is None:
+            raise FileNotFoundError("no index in %s" % index_dir)
+        self.archive_path = manifest["archive"]
+        self.games = manifest["games"]
+        self._segments = [IndexSegment.open(os.path.join(index_dir, name)) for name in manifest["segments"]]
+
+    def close(self):
+        """Unmaps the segments"""
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def positions(self, key):
+        """Yields an IndexHit for every time a position with Zobrist hash key occurred"""
+        for segment in self._segments:
+            yield from segment.positions(key)
+
+    def board_positions(self, board):
+        """Yields an IndexHit for every time the position of a CompactBoard occurred"""
+        return self.positions(board.hash)
+
+    def materials(self, material):
+        """Yields an IndexHit for every position with the given material, a signature or a name such as "KRR-K\""""
+        signature = parse_material(material) if isinstance(material, str) else material
+        for segment in self._segments:
+            yield from segment.materials(signature)
+
+    def game(self, game_id):
+        """Reads the (pos1, pos2) moves of an indexed game back from the archive"""
+        for segment in self._segments:
+            if segment.first_game <= game_id < segment.first_game + segment.games:
+                with open(self.archive_path, "rb") as archive:
+                    archive.seek(segment.game_offset(game_id))
+                    return next(read_games([archive.readline().decode("ascii", "replace")]))
+        raise IndexError("game %d is not indexed" % game_id)
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Index game archives by position and material")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="index a game archive, or the games appended to it")
+    build_parser.add_argument("archive")
+    build_parser.add_argument("index_dir")
+    build_parser.add_argument("--run-size", type=int, default=500000, help="records per segment while building")
+    build_parser.add_argument("--rebuild", action="store_true", help="index the whole archive again")
+    query_parser = commands.add_parser("query", help="list the games reaching a position or material")
+    query_parser.add_argument("index_dir")
+    query_parser.add_argument("--moves", nargs="*", default=None, help="positions of the moves leading there")
+    query_parser.add_argument("--position", default=None, help="a position in notation.py text notation")
+    query_parser.add_argument("--material", default=None, help="a material name such as KRR-K (blue-red)")
+    query_parser.add_argument("--limit", type=int, default=20, help="hits to list")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        def report(stats):
+            """Prints one line of progress"""
+            print("%d games indexed (%d new, %d positions)  %d segments  %.1fs" % (
+                stats.games, stats.games_added, stats.positions_added, stats.segments, stats.seconds), flush=True)
+
+        stats = update_index(args.archive, args.index_dir, args.run_size, args.rebuild, report)
+        if not stats.games_added:  # otherwise the last segment has been reported already
+            report(stats)
+        return 0
+
+    board = signature = None
+    try:
+        if args.material is not None:
+            signature = parse_material(args.material)
+        else:
+            board = parse_text(args.position if args.position is not None else START_TEXT)
+    except ValueError as error:
+        print(error)
+        return 1
+    moves = args.moves or []
+    for pos1, pos2 in zip(moves[0::2], moves[1::2]):
+        if board is None or play_move(board, pos1, pos2) is None:
+            print("illegal move:", pos1, pos2)
+            return 1
+    with ArchiveIndex(args.index_dir) as index:
+        hits = index.materials(signature) if board is None else index.board_positions(board)
+        found = 0
+        for game_id, ply in islice(hits, args.limit):
+            print("game %d ply %d" % (game_id, ply))
+            found += 1
+        if not found:
+            print("no games found")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,9 +2,25 @@
 # Date: 3/3/2021
 # Description: This is the game of Janggi, one of the ancient precursors to Chess.
 
+from collections import namedtuple
+
+from board import CompactBoard, COLORS, EMPTY, PIECE_TYPES, encode_move, move_from, move_to, piece_code
+from rules import DEFAULT_RULES, adjudicate, drawn_by, is_bikjang
+from tables import pos_to_square, square_to_pos
+
+# One entry of the move history. captured is the Piece taken ("" if none), gives_check says whether the player to
+# move next was left in check, turn is the turn counter after the move and hash the position hash after it. passes
+# counts the passes made in a row up to and including this move, bikjang whether the generals face each other after it
+MoveRecord = namedtuple("MoveRecord", ["from_square", "to_square", "captured", "gives_check", "turn", "hash",
+                                       "game_state", "passes", "bikjang"])
+
+
 class Piece:
     """Super-class for each possible game piece. This is the blueprint for every piece in the game,
-    and is used when setting the board."""
+    and is used when setting the board. Pieces never change once created, so the same Piece objects are shared by
+    every game (see JanggiGame.set_board)."""
+
+    __slots__ = ("_color", "_type")
 
     def __init__(self, color):
         """Initializes a Piece object. The color parameter determines what player the piece belongs to"""
@@ -23,6 +39,8 @@ class Piece:
 class Soldier(Piece):
     """Subclass of Piece. Represents the soldier piece"""
 
+    __slots__ = ()
+
     def __init__(self, color):
         """Initializes soldier piece """
         super().__init__(color)
@@ -36,6 +54,8 @@ class Soldier(Piece):
 class General(Piece):
     """Subclass of piece. Represents the general piece"""
 
+    __slots__ = ()
+
     def __init__(self, color):
         """Initializes general piece """
         super().__init__(color)
@@ -49,6 +69,8 @@ class General(Piece):
 class Cannon(Piece):
     """Subclass of piece. Represents the cannon piece"""
 
+    __slots__ = ()
+
     def __init__(self, color):
         """Initializes cannon piece"""
         super().__init__(color)
@@ -62,6 +84,8 @@ class Cannon(Piece):
 class Guard(Piece):
     """Subclass of piece. Represents the guard piece"""
 
+    __slots__ = ()
+
     def __init__(self, color):
         """Initializes guard piece"""
         super().__init__(color)
@@ -75,6 +99,8 @@ class Guard(Piece):
 class Horse(Piece):
     """Subclass of piece. Represents the horse piece"""
 
+    __slots__ = ()
+
     def __init__(self, color):
         """Initializes horse piece"""
         super().__init__(color)
@@ -88,6 +114,8 @@ class Horse(Piece):
 class Elephant(Piece):
     """Subclass of piece. Represents the elephant piece"""
 
+    __slots__ = ()
+
     def __init__(self, color):
         """Initializes elephant piece"""
         super().__init__(color)
@@ -101,6 +129,8 @@ class Elephant(Piece):
 class Chariot(Piece):
     """Subclass of piece. Represents the chariot piece"""
 
+    __slots__ = ()
+
     def __init__(self, color):
         """Initializes chariot piece"""
         super().__init__(color)
@@ -113,134 +143,119 @@ class Chariot(Piece):
 
 class JanggiGame:
 
-    def __init__(self):
-        """Creates an instance of Game, also calls set_board() to instantiate multiple piece objects (method calling
-        a class) """
-        self._board = [["" for _ in range(9)]  # Creates the game board
-                       for _ in range(10)]
-
-        self._translation_key = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7, "i": 8, "j": 9}
-        self._translation_backwards = {0: "a", 1: "b", 2: "c", 3: "d", 4: "e", 5: "f", 6: "g", 7: "h", 8: "i", 9: "i"}
-        self._possible_game_state = ["UNFINISHED", "RED_WON", "BLUE_WON"]
+    # Tables shared by every game
+    _translation_key = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7, "i": 8, "j": 9}
+    _translation_backwards = {0: "a", 1: "b", 2: "c", 3: "d", 4: "e", 5: "f", 6: "g", 7: "h", 8: "i", 9: "i"}
+    _possible_game_state = ("UNFINISHED", "RED_WON", "BLUE_WON", "DRAW")
+    _players = ("BLUE", "RED")
+    _palace = ([3, 7], [4, 7], [5, 7], [3, 8], [4, 8], [5, 8], [3, 9], [4, 9], [5, 9],  # blue
+               [3, 0], [4, 0], [5, 0], [3, 1], [4, 1], [5, 1], [3, 2], [4, 2], [5, 2])  # red
+    _horse_steps = frozenset([(1, 2), (2, 1), (1, -2), (2, -1), (-1, 2), (-2, 1), (-1, -2), (-2, -1)])  # (diff_x, diff_y)
+    _elephant_steps = frozenset([(3, 2), (3, -2), (-2, 3), (-2, -3), (-3, -2), (-3, 2), (2, -3), (2, 3)])
+    _start_board = None  # rows of the starting position, built by the first set_board() call
+    _start_compact = None  # CompactBoard of the starting position, copied by every new game
+
+    def __init__(self, draw_rules=None):
+        """Creates an instance of Game, also calls set_board() to place the pieces. draw_rules is a rules.DrawRules
+        saying how repetitions, passes and bikjang end the game"""
         self._game_state = self._possible_game_state[0]
-        self._players = ["BLUE", "RED"]
         self._current_turn = self._players[0]
         self._turn_counter = 0
-        self._red_is_in_check = False
-        self._blue_is_in_check = False
-        self.next_move_red = None
-        self.next_move_blue = None
 
-        self._game_state = self._possible_game_state[0]
         self.set_board()
+        if JanggiGame._start_compact is None:
+            JanggiGame._start_compact = CompactBoard.from_board(self._board, self._current_turn)
+        self._compact = JanggiGame._start_compact.copy()
+        self._history = []  # MoveRecords of the moves played, oldest first
+        self._redo = []  # MoveRecords taken back by undo(), most recently undone last
+        self._draw_rules = draw_rules or DEFAULT_RULES
+        self._position_counts = {self._compact.hash: 1}  # position hash -> times it has occurred in this game
+
+    def clone(self):
+        """Returns an independent copy of the game, history included, without setting up a board from scratch"""
+        game = JanggiGame.__new__(JanggiGame)
+        game._game_state = self._game_state
+        game._current_turn = self._current_turn
+        game._turn_counter = self._turn_counter
+        game._board = [row[:] for row in self._board]  # the Piece objects themselves are shared
+        game._compact = self._compact.copy(keep_undo=True)
+        game._history = self._history[:]
+        game._redo = self._redo[:]
+        game._draw_rules = self._draw_rules
+        game._position_counts = self._position_counts.copy()
+        return game
 
     def is_in_check(self, color):
-        """Returns whether a player's general is in check"""
-        if color == 'red':
-            if self._red_is_in_check:
-                return True
-            return False
-        if color == "blue":
-            if self._blue_is_in_check:
-                return True
-            return False
-
-    def is_red_in_check_helper(self, pos2):
-        """The purpose of this helper function is find the current position of red's general
-        and then pass the position of red's general and the _NEXT_ position of the previous is_legal_move() call to is_legal_move() AGAIN.
-        This essentially checks to see if a piece that was just moved threatens red's general and sets self._red_is_in_check to True if so."""
-        for x in range(0, 4):
-            for i in self._board[x]:
-                if i != "" and i.get_piece_type() == "General":
-                    column = self._board[x].index(i)
-                    general_pos = (self._translation_backwards[column] + str(x + 1))
-
-        from_coordinate = self.pos_to_coordinate(pos2)
-        to_coordinate = self.pos_to_coordinate(general_pos)
-        current_piece = self._board[from_coordinate[1]][
-            from_coordinate[0]]
-        next_location_or_piece = self._board[to_coordinate[1]][to_coordinate[0]]
-
-        if self.is_legal_move(from_coordinate, current_piece, to_coordinate, next_location_or_piece) == True:
-            if from_coordinate != to_coordinate and current_piece.get_piece_color() != next_location_or_piece.get_piece_color():
-                self._red_is_in_check = True
-                return True
-            else:
-                self._red_is_in_check = False
-                return False
-
-    def is_blue_in_check_helper(self, pos2):
-        """This does the same thing as is_red_in_check_helper, except it checks the location of blue's general"""
-        for list_number in range(7, 10):
-            for list_element in self._board[list_number]:
-                if list_element != "" and list_element.get_piece_type() == "General":
-                    column = self._board[list_number].index(list_element)
-                    general_pos = (self._translation_backwards[column] + str(list_number + 1))
-
-        from_coordinate = self.pos_to_coordinate(pos2)
-        to_coordinate = self.pos_to_coordinate(general_pos)
-        current_piece = self._board[from_coordinate[1]][
-            from_coordinate[0]]
-        next_location_or_piece = self._board[to_coordinate[1]][to_coordinate[0]]
+        """Returns whether a player's general is in check. Answered from the attack maps kept by the compact board,
+        so every attacker counts, including discovered and double checks"""
+        return self._compact.in_check(COLORS.index(color.upper()))
 
-        if self.is_legal_move(from_coordinate, current_piece, to_coordinate, next_location_or_piece):
-
-            if from_coordinate != to_coordinate and current_piece.get_piece_color() != next_location_or_piece.get_piece_color():
-                self._blue_is_in_check = True
-                return True
-            else:
-                self._blue_is_in_check = False
-                return False
+    def is_checkmate(self, color):
+        """Returns whether a player is in check with no legal move to get out of it"""
+        return self._compact.is_checkmate(COLORS.index(color.upper()))
 
     def get_game_state(self):
         """Returns current game state"""
         return self._game_state
 
+    def get_current_turn(self):
+        """Returns the player whose turn it is, BLUE or RED"""
+        return self._current_turn
+
+    def get_piece(self, pos):
+        """Returns the Piece at a position such as "e9", or "" if the square is empty"""
+        x, y = self.pos_to_coordinate(pos)
+        return self._board[y][x]
+
     def display_board(self):
         """Prints board"""
         for board in self._board:
             print(board)
 
     def set_board(self):
-        """After the empty board is instantiated, this method creates a piece object for each player,
-        and places it on the board"""
-
-        # Soldiers
-        for i in range(0, 9, 2):
-            self._board[3][i] = Soldier("RED")
-        for i in range(0, 9, 2):
-            self._board[6][i] = Soldier("BLUE")
-
-        # Generals
-        self._board[1][4] = General("RED")
-        self._board[8][4] = General("BLUE")
-
-        # Cannons
-        self._board[2][1] = Cannon("RED")
-        self._board[2][7] = Cannon("RED")
-        self._board[7][1] = Cannon("BLUE")
-        self._board[7][7] = Cannon("BLUE")
-
-        # Chariots
-        self._board[0][8] = Chariot("RED")
-        self._board[0][0] = Chariot("RED")
-        self._board[9][8] = Chariot("BLUE")
-        self._board[9][0] = Chariot("BLUE")
-        # Guards
-        self._board[9][3] = Guard("BLUE")
-        self._board[9][5] = Guard("BLUE")
-        self._board[0][3] = Guard("RED")
-        self._board[0][5] = Guard("RED")
-        # Horses
-        self._board[0][7] = Horse("RED")
-        self._board[0][2] = Horse("RED")
-        self._board[9][7] = Horse("BLUE")
-        self._board[9][2] = Horse("BLUE")
-        # Elephants
-        self._board[9][1] = Elephant("BLUE")
-        self._board[9][6] = Elephant("BLUE")
-        self._board[0][1] = Elephant("RED")
-        self._board[0][6] = Elephant("RED")
+        """Places a piece object for each player on a new board. The pieces are created the first time a board is
+        set up; every later game puts the same objects on its own board"""
+        if JanggiGame._start_board is None:
+            board = [["" for _ in range(9)]  # Creates the game board
+                     for _ in range(10)]
+            # Soldiers
+            for i in range(0, 9, 2):
+                board[3][i] = Soldier("RED")
+            for i in range(0, 9, 2):
+                board[6][i] = Soldier("BLUE")
+
+            # Generals
+            board[1][4] = General("RED")
+            board[8][4] = General("BLUE")
+
+            # Cannons
+            board[2][1] = Cannon("RED")
+            board[2][7] = Cannon("RED")
+            board[7][1] = Cannon("BLUE")
+            board[7][7] = Cannon("BLUE")
+
+            # Chariots
+            board[0][8] = Chariot("RED")
+            board[0][0] = Chariot("RED")
+            board[9][8] = Chariot("BLUE")
+            board[9][0] = Chariot("BLUE")
+            # Guards
+            board[9][3] = Guard("BLUE")
+            board[9][5] = Guard("BLUE")
+            board[0][3] = Guard("RED")
+            board[0][5] = Guard("RED")
+            # Horses
+            board[0][7] = Horse("RED")
+            board[0][2] = Horse("RED")
+            board[9][7] = Horse("BLUE")
+            board[9][2] = Horse("BLUE")
+            # Elephants
+            board[9][1] = Elephant("BLUE")
+            board[9][6] = Elephant("BLUE")
+            board[0][1] = Elephant("RED")
+            board[0][6] = Elephant("RED")
+            JanggiGame._start_board = tuple(tuple(row) for row in board)
+        self._board = [list(row) for row in JanggiGame._start_board]
 
     def switch_turn(self):
         """Switches player turn by using modulo operator and counter"""
@@ -272,7 +287,11 @@ class JanggiGame:
             return False
 
         if from_coordinate == to_coordinate:  # If beginning position and ending position are the same, skip turn
+            if self.is_in_check(self._current_turn):  # A player in check has to answer it rather than skip
+                return False
+            self._compact.make_move(encode_move(pos_to_square(pos1), pos_to_square(pos1)))
             self.switch_turn()
+            self._record_move(pos_to_square(pos1), pos_to_square(pos1), "")
             return True
 
         if not self.is_legal_move(from_coordinate, current_piece, to_coordinate,
@@ -280,55 +299,128 @@ class JanggiGame:
             # print("NOT A LEGAL MOVE")
             return False
 
-        if self._board[to_coordinate[1]][to_coordinate[0]] != "":
-            if self._board[to_coordinate[1]][to_coordinate[0]].get_piece_color() == self._board[from_coordinate[1]][
-                from_coordinate[0]].get_piece_color():
-                # print("CAN'T TAKE YOUR OWN PIECE")
-                return False
-
-        if self.is_legal_move(from_coordinate, current_piece, to_coordinate,
-                              next_location_or_piece):  # Checks to see if a moves starting position and ending position are valid
-
-            self._board[to_coordinate[1]][to_coordinate[0]] = self._board[from_coordinate[1]][
-                from_coordinate[0]]  # Updates board with new piece positions
-            self._board[from_coordinate[1]][from_coordinate[0]] = ""
-
-            # The below logic checks to see if the move made by the player after being checked is valid.
-            # Checks to see if a defending player's piece can block the check. Places a piece first to determine if that piece will block the check.
-            # If it doesn't block the check, then revert the board update. There is definitely a better way to do this but i'm not smart enough to figure it out.
-
-            if self._red_is_in_check != False:  # This cannot happen unless red is already in check
-                if self.is_red_in_check_helper(self.next_move_red) == True:
-
-                    # print("RED GENERAL NEEDS TO BE UNCHECKED")
-                    self._board[from_coordinate[1]][from_coordinate[0]] = self._board[to_coordinate[1]][
-                        to_coordinate[0]]
-                    self._board[to_coordinate[1]][from_coordinate[0]] = ""
-
-                    return False
-                else:
-                    self._red_is_in_check = False
-
-            if self._blue_is_in_check != False:  # This cannot happen unless blue is already in check
-                if self.is_blue_in_check_helper(self.next_move_blue) == True:
+        if next_location_or_piece != "" and next_location_or_piece.get_piece_color() == current_piece.get_piece_color():
+            # print("CAN'T TAKE YOUR OWN PIECE")
+            return False
 
-                    # print("BLUE GENERAL NEEDS TO BE UNCHECKED")
-                    self._board[from_coordinate[1]][from_coordinate[0]] = self._board[to_coordinate[1]][
-                        to_coordinate[0]]
-                    self._board[to_coordinate[1]][from_coordinate[0]] = ""
-                    return False
+        # Tries the move on the compact board first. A move may not leave the mover's own general in check, which
+        # covers failing to answer a check as well as uncovering an attack on your own general.
+        move = encode_move(pos_to_square(pos1), pos_to_square(pos2))
+        captured = self._compact.make_move(move)
+        if self._compact.in_check(COLORS.index(self._current_turn)):
+            self._compact.unmake_move(move, captured)
+            return False
 
-                else:
-                    self._blue_is_in_check = False
+        self._board[to_coordinate[1]][to_coordinate[0]] = current_piece  # Updates board with new piece positions
+        self._board[from_coordinate[1]][from_coordinate[0]] = ""
+        self.switch_turn()
+
+        if self._compact.is_checkmate():  # The player who just moved wins if the other player has no way out
+            self._game_state = self._possible_game_state[1] if current_piece.get_piece_color() == "RED" \
+                else self._possible_game_state[2]
+        self._record_move(move_from(move), move_to(move), next_location_or_piece)
+        return True
+
+    def _record_move(self, from_square, to_square, captured):
+        """Appends a played move to the history and ends the game if a draw rule applies. A new move makes the
+        undone moves impossible to redo"""
+        compact = self._compact
+        previous = self._history[-1] if self._history else None
+        passes = (previous.passes if previous else 0) + 1 if from_square == to_square else 0
+        bikjang = is_bikjang(compact)
+        repetitions = self._position_counts.get(compact.hash, 0) + 1
+        self._position_counts[compact.hash] = repetitions
+        if self._game_state == self._possible_game_state[0] and \
+                drawn_by(self._draw_rules, repetitions, passes, bikjang and previous is not None and previous.bikjang):
+            self._game_state = adjudicate(compact, self._draw_rules)
+        self._history.append(MoveRecord(from_square, to_square, captured, compact.in_check(compact.side),
+                                        self._turn_counter, compact.hash, self._game_state, passes, bikjang))
+        self._redo.clear()
+
+    def undo(self):
+        """Takes back the last move. Returns False if no move has been played"""
+        if not self._history:
+            return False
+        record = self._history.pop()
+        self._position_counts[record.hash] -= 1
+        captured = EMPTY
+        if record.captured != "":
+            captured = piece_code(COLORS.index(record.captured.get_piece_color()),
+                                  PIECE_TYPES[record.captured.get_piece_type()])
+        self._compact.unmake_move(encode_move(record.from_square, record.to_square), captured)
+        if record.from_square != record.to_square:
+            from_y, from_x = divmod(record.from_square, 9)
+            to_y, to_x = divmod(record.to_square, 9)
+            self._board[from_y][from_x] = self._board[to_y][to_x]
+            self._board[to_y][to_x] = record.captured
+        self._turn_counter -= 1
+        self._current_turn = self._players[self._turn_counter % len(self._players)]
+        self._game_state = self._history[-1].game_state if self._history else self._possible_game_state[0]
+        self._redo.append(record)
+        return True
 
-            if self.is_red_in_check_helper(pos2):  # Logic to see if a move results in check
-                self.next_move_red = pos2
-                # print("red in check")
-            if self.is_blue_in_check_helper(pos2):
-                self.next_move_blue = pos2
-                # print("blue in check")
-            self.switch_turn()
-            return True
+    def redo(self):
+        """Plays the last move taken back by undo() again. Returns False if there is nothing to redo"""
+        if not self._redo:
+            return False
+        record = self._redo.pop()
+        self._compact.make_move(encode_move(record.from_square, record.to_square))
+        if record.from_square != record.to_square:
+            from_y, from_x = divmod(record.from_square, 9)
+            to_y, to_x = divmod(record.to_square, 9)
+            self._board[to_y][to_x] = self._board[from_y][from_x]
+            self._board[from_y][from_x] = ""
+        self.switch_turn()
+        self._game_state = record.game_state
+        self._position_counts[record.hash] = self._position_counts.get(record.hash, 0) + 1
+        self._history.append(record)
+        return True
+
+    def goto_ply(self, ply):
+        """Undoes or redoes moves until ply moves have been played. Returns False if ply is out of reach"""
+        if not 0 <= ply <= len(self._history) + len(self._redo):
+            return False
+        while len(self._history) > ply:
+            self.undo()
+        while len(self._history) < ply:
+            self.redo()
+        return True
+
+    def get_history(self):
+        """Returns the MoveRecords of the moves played so far, oldest first"""
+        return tuple(self._history)
+
+    def get_repetition_count(self):
+        """Returns how many times the current position has occurred in this game, counting this time"""
+        return self._position_counts[self._compact.hash]
+
+    def get_pass_count(self):
+        """Returns how many passes have just been made in a row"""
+        return self._history[-1].passes if self._history else 0
+
+    def legal_moves_from(self, pos):
+        """Returns a list of every position the piece at pos can legally move to"""
+        return [square_to_pos(to) for to in self._compact.legal_destinations(pos_to_square(pos))]
+
+    def get_move_cache_stats(self):
+        """Returns the hit/miss counters of the cache behind legal_moves_from"""
+        return self._compact.get_cache_stats()
+
+    def generate_moves(self, color):
+        """Returns a list of (pos1, pos2) tuples for every legal move the given player can make, not counting
+        skipped turns"""
+        moves = []
+        for move in self._compact.legal_moves(COLORS.index(color.upper())):
+            moves.append((square_to_pos(move_from(move)), square_to_pos(move_to(move))))
+        return moves
+
+    def get_position_hash(self):
+        """Returns the 64-bit Zobrist hash of the current position, including whose turn it is"""
+        return self._compact.hash
+
+    def get_compact_board(self):
+        """Returns the CompactBoard mirroring this game's board, for search and bulk replay"""
+        return self._compact
 
     def is_legal_move(self, from_coordinate, current_piece: Piece, to_coordinate, next_piece: Piece):
         """Checks to see if there are any obstructions between a start and end position. Returns True or False to make move."""
@@ -339,8 +431,7 @@ class JanggiGame:
         to_x = to_coordinate[0]
         diff_y = to_y - from_y
         diff_x = to_x - from_x
-        palace = [[3, 7], [4, 7], [5, 7], [3, 8], [4, 8], [5, 8], [3, 9], [4, 9], [5, 9],  # blue
-                  [3, 0], [4, 0], [5, 0], [3, 1], [4, 1], [5, 1], [3, 2], [4, 2], [5, 2]]  # red
+        palace = self._palace
 
         def check_chariot_move(from_coordinate, current_piece, to_coordinate, next_piece):
             """Check for any chariot obstructions"""
@@ -548,14 +639,7 @@ class JanggiGame:
 
         def check_horse_move(from_coordinate, current_piece, to_coordinate, next_piece):
             """Check for any horse obstructions"""
-            possible_moves = [[from_coordinate[0] + 1, from_coordinate[1] + 2],  # possible moves relative to current coordinate position
-                              [from_coordinate[0] + 2, from_coordinate[1] + 1],
-                              [from_coordinate[0] + 1, from_coordinate[1] - 2],
-                              [from_coordinate[0] + 2, from_coordinate[1] - 1],
-                              [from_coordinate[0] - 1, from_coordinate[1] + 2],
-                              [from_coordinate[0] - 2, from_coordinate[1] + 1],
-                              [from_coordinate[0] - 1, from_coordinate[1] - 2],
-                              [from_coordinate[0] - 2, from_coordinate[1] - 1]]
+            possible_move = (diff_x, diff_y) in self._horse_steps  # moves are relative to current coordinate position
 
             if diff_x == 0 or diff_y == 0:
                 # print("ERROR: NOT POSSIBLE MOVE FOR HORSE")
@@ -564,7 +648,7 @@ class JanggiGame:
             # Move logic is same for both players' horses
 
             if diff_x > 0 and diff_y < 0:  # upper right quadrant
-                if to_coordinate not in possible_moves:
+                if not possible_move:
                     return False
                 for i in range(from_y - 1, to_y, -1):
                     square_being_checked = self._board[i][from_x]
@@ -578,7 +662,7 @@ class JanggiGame:
                         return False
 
             if diff_x < 0 and diff_y < 0:  # upper left quadrant
-                if to_coordinate not in possible_moves:
+                if not possible_move:
                     return False
                 for i in range(from_y - 1, to_y, -1):
                     square_being_checked = self._board[i][from_x]
@@ -592,7 +676,7 @@ class JanggiGame:
                         return False
 
             if diff_x < 0 and diff_y > 0:  # lower left quadrant
-                if to_coordinate not in possible_moves:
+                if not possible_move:
                     return False
                 for i in range(from_y + 1, to_y, -1):
                     square_being_checked = self._board[i][from_x]
@@ -606,7 +690,7 @@ class JanggiGame:
                         return False
 
             if diff_x > 0 and diff_y > 0:  # lower right quadrant
-                if to_coordinate not in possible_moves:
+                if not possible_move:
                     return False
 
                 for i in range(from_y + 1, to_y, -1):
@@ -626,19 +710,12 @@ class JanggiGame:
         def check_elephant_move(from_coordinate, current_piece, to_coordinate, next_piece):
             # Move logic is same for both players' elephants
 
-            possible_moves = [[from_coordinate[0] + 3, from_coordinate[1] + 2], # possible moves are relative to current posiiton
-                              [from_coordinate[0] + 3, from_coordinate[1] - 2],
-                              [from_coordinate[0] - 2, from_coordinate[1] + 3],
-                              [from_coordinate[0] - 2, from_coordinate[1] - 3],
-                              [from_coordinate[0] - 3, from_coordinate[1] - 2],
-                              [from_coordinate[0] - 3, from_coordinate[1] + 2],
-                              [from_coordinate[0] + 2, from_coordinate[1] - 3],
-                              [from_coordinate[0] + 2, from_coordinate[1] + 3]]
+            possible_move = (diff_x, diff_y) in self._elephant_steps  # possible moves are relative to current posiiton
 
             if diff_x == 0 or diff_y == 0:
                 # print("ERROR: NOT A POSSIBLE MOVE FOR ELEPHANT")
                 return False
-            if to_coordinate not in possible_moves:
+            if not possible_move:
                 return False
 
             # upper right quadrant
@@ -0,0 +1,247 @@
+# Description: Monte Carlo tree search player. Selection follows UCT; the tree lives in flat arrays (parent, move,
+# visits, value, virtual loss, first child, child count) indexed by node number rather than in per-node objects.
+# Leaves are collected in batches, each path carrying a virtual loss so the batch spreads over different lines, and
+# their random playouts run in a pool of worker processes. Playouts stop after max_plies and are then scored from
+# the static evaluation.
+#
+# Usage:
+#     python mcts.py bench [--playouts 2000] [--workers 4] [--batch 32]    playouts/second on the opening
+
+import argparse
+import math
+import os
+import random
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from board import encode_move, move_from, move_to
+from evaluation import evaluate
+from main import JanggiGame
+from notation import encode_position, decode_position
+from tables import square_to_pos
+
+MCTSResult = namedtuple("MCTSResult", ["move", "visits", "value", "playouts", "seconds", "playouts_per_second"])
+
+_EVALUATION_SCALE = 400  # centipawn-like evaluation units per e-fold of the win odds at the playout horizon
+
+
+def playout(board, max_plies, chooser):
+    """Plays random legal moves on a CompactBoard (which is changed) for at most max_plies plies. Returns the result
+    for the side to move at the start: 1 won, 0 lost, otherwise the evaluation at the horizon mapped into (0, 1)"""
+    start_side = board.side
+    for _ in range(max_plies):
+        moves = board.generate_moves()
+        side = board.side
+        while moves:
+            index = chooser.randrange(len(moves))
+            move = moves[index]
+            captured = board.make_move(move)
+            if not board.in_check(side):
+                break
+            board.unmake_move(move, captured)
+            moves[index] = moves[-1]
+            moves.pop()
+        else:
+            if board.in_check(side):  # checkmated
+                return 0.0 if side == start_side else 1.0
+            general = board.generals[side]
+            board.make_move(encode_move(general, general))  # nothing to play but a pass
+    result = 1 / (1 + math.exp(-evaluate(board) / _EVALUATION_SCALE))
+    return result if board.side == start_side else 1 - result
+
+
+def _playout_batch(records, max_plies, seed):
+    """Runs inside a worker: one playout from every position record. Returns the results"""
+    chooser = random.Random(seed)
+    return [playout(decode_position(record), max_plies, chooser) for record in records]
+
+
+class MCTSPlayer:
+    """UCT search with batched playouts. Keeps its worker pool between moves; close it (or use it as a context
+    manager) when done"""
+
+    def __init__(self, playouts=800, workers=None, batch_size=None, exploration=1.4, max_plies=60, seed=0):
+        """playouts is the budget per move. workers is the number of playout processes (all cores by default; 1
+        plays out in this process), batch_size the leaves gathered per round (8 per worker by default)"""
+        self.playouts = playouts
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size or 8 * self.workers
+        self.exploration = exploration
+        self.max_plies = max_plies
+        self._chooser = random.Random(seed)
+        self._pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        self._reset()
+
+    def _reset(self):
+        """Empties the tree, leaving only the root"""
+        self.parent = array("i", [-1])
+        self.move = array("H", [0])  # packed move leading to the node
+        self.visits = array("i", [0])
+        self.value = array("d", [0.0])  # summed results for the side that played the move into the node
+        self.virtual = array("i", [0])  # playouts in flight through the node
+        self.first_child = array("i", [-1])  # -1 until the node is expanded
+        self.child_count = array("H", [0])
+        self.mated = bytearray(1)  # 1 if the side to move at the node is checkmated
+
+    def close(self):
+        """Shuts the worker pool down"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _expand(self, node, board):
+        """Adds a child for every legal move of the position at node (a pass if there is none but the side to
+        move isn't in check)"""
+        moves = board.legal_moves()
+        if not moves:
+            if board.in_check(board.side):
+                self.mated[node] = 1
+                self.first_child[node] = len(self.parent)  # expanded, with no children
+                return
+            general = board.generals[board.side]
+            moves = [encode_move(general, general)]
+        first = len(self.parent)
+        count = len(moves)
+        self.parent.extend([node] * count)
+        self.move.extend(moves)
+        self.visits.extend([0] * count)
+        self.value.extend([0.0] * count)
+        self.virtual.extend([0] * count)
+        self.first_child.extend([-1] * count)
+        self.child_count.extend([0] * count)
+        self.mated.extend(bytes(count))
+        self.first_child[node] = first
+        self.child_count[node] = count
+
+    def _select_child(self, node):
+        """Returns the child of node with the best UCT score, counting playouts in flight as losses. A child known
+        to be checkmated wins outright and is always chosen"""
+        visits, value, virtual, mated = self.visits, self.value, self.virtual, self.mated
+        log_total = math.log(visits[node] + virtual[node] + 1)
+        exploration = self.exploration
+        best, best_score = -1, -1.0
+        first = self.first_child[node]
+        for child in range(first, first + self.child_count[node]):
+            if mated[child]:
+                return child
+            count = visits[child] + virtual[child]
+            if not count:
+                return child
+            score = value[child] / count + exploration * math.sqrt(log_total / count)
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+    def _select_leaf(self, root_board):
+        """Walks down from the root, adding a virtual loss along the way. Returns (leaf node, leaf board)"""
+        board = root_board.copy()
+        node = 0
+        while True:
+            self.virtual[node] += 1
+            if self.mated[node]:
+                return node, board
+            if self.first_child[node] < 0:
+                if node and not self.visits[node]:
+                    return node, board
+                self._expand(node, board)
+                if self.mated[node]:
+                    return node, board
+            node = self._select_child(node)
+            board.make_move(self.move[node])
+
+    def _backpropagate(self, node, result):
+        """Adds a playout result, given for the side to move at node, to node and its ancestors"""
+        reward = 1 - result  # for the side that moved into node
+        while node >= 0:
+            self.visits[node] += 1
+            self.virtual[node] -= 1
+            self.value[node] += reward
+            reward = 1 - reward
+            node = self.parent[node]
+
+    def _run_playouts(self, records):
+        """Plays out a batch of position records, spread over the worker pool"""
+        if self._pool is None:
+            return _playout_batch(records, self.max_plies, self._chooser.getrandbits(32))
+        size = -(-len(records) // self.workers)
+        parts = [records[start:start + size] for start in range(0, len(records), size)]
+        results = []
+        for part in self._pool.map(_playout_batch, parts, [self.max_plies] * len(parts),
+                                   [self._chooser.getrandbits(32) for _ in parts]):
+            results.extend(part)
+        return results
+
+    def search(self, board, playouts=None, time_ms=None):
+        """Searches a CompactBoard (left unchanged) with a budget of playouts (the player's default if None),
+        stopping early once time_ms milliseconds have passed if given. Returns an MCTSResult whose move is the most
+        visited packed root move (a mating move if one was found), or None if the side to move is checkmated"""
+        budget = playouts or self.playouts
+        deadline = time.perf_counter() + time_ms / 1000 if time_ms is not None else None
+        start = time.perf_counter()
+        self._reset()
+        done = 0
+        while done < budget and (deadline is None or time.perf_counter() < deadline):
+            leaves, records = [], []
+            for _ in range(min(self.batch_size, budget - done)):
+                node, leaf_board = self._select_leaf(board)
+                if self.mated[node]:
+                    self._backpropagate(node, 0.0)
+                    done += 1
+                    continue
+                leaves.append(node)
+                records.append(encode_position(leaf_board))
+            if records:
+                for node, result in zip(leaves, self._run_playouts(records)):
+                    self._backpropagate(node, result)
+                done += len(records)
+        seconds = time.perf_counter() - start
+        rate = done / seconds if seconds > 0 else 0.0
+        if self.first_child[0] < 0 or not self.child_count[0]:
+            return MCTSResult(None, self.visits[0], 0.0, done, seconds, rate)
+        first = self.first_child[0]
+        best = max(range(first, first + self.child_count[0]), key=lambda child: (self.mated[child], self.visits[child]))
+        value = self.value[best] / self.visits[best] if self.visits[best] else 0.0
+        return MCTSResult(self.move[best], self.visits[best], value, done, seconds, rate)
+
+
+def mcts_move(game, player, playouts=None, time_ms=None):
+    """MCTSPlayer.search for the current position of a JanggiGame: returns an MCTSResult whose move is a
+    (pos1, pos2) tuple ready for game.make_move, or None if the game is over"""
+    if game.get_game_state() != "UNFINISHED":
+        return None
+    result = player.search(game.get_compact_board(), playouts, time_ms)
+    if result.move is None:
+        return result
+    return result._replace(move=(square_to_pos(move_from(result.move)), square_to_pos(move_to(result.move))))
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Monte Carlo tree search player")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="playouts/second on the opening")
+    bench_parser.add_argument("--playouts", type=int, default=2000)
+    bench_parser.add_argument("--workers", type=int, default=None, help="playout processes (default: all cores)")
+    bench_parser.add_argument("--batch", type=int, default=None, help="leaves per batch (default: 8 per worker)")
+    bench_parser.add_argument("--max-plies", type=int, default=60)
+    args = parser.parse_args(argv)
+
+    with MCTSPlayer(args.playouts, args.workers, args.batch, max_plies=args.max_plies) as player:
+        result = mcts_move(JanggiGame(), player)
+    print("%d playouts in %.2fs, %.0f playouts/s with %d worker%s, batches of %d" % (
+        result.playouts, result.seconds, result.playouts_per_second, player.workers,
+        "" if player.workers == 1 else "s", player.batch_size))
+    print("best move %s %s  visits %d  value %.3f" % (result.move[0], result.move[1], result.visits, result.value))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
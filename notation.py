@@ -0,0 +1,315 @@
+# Description: Serialization of positions and games. A FEN-like text notation for interchange, a fixed-size binary
+# position record (90 squares packed two per byte, plus side to move and check flags) and a varint-packed move list
+# format. Binary stores are read through memoryview so a file can be mmapped and its N-th game or position reached
+# without parsing anything before it.
+#
+# Text notation: the ten rows from row 1 (red's back rank) to row 10, separated by "/", then the side to move.
+# Blue pieces are upper case, red pieces lower case, digits count empty squares:
+#     rbna1abnr/4k4/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/4K4/RBNA1ABNR b
+# k general, a guard, b elephant, n horse, r chariot, c cannon, p soldier; side to move is "b" (blue) or "r" (red).
+
+import mmap
+import struct
+
+from board import (CompactBoard, BLUE, RED, RED_FLAG, GENERAL, GUARD, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER,
+                   code_side, code_type)
+from tables import BOARD_WIDTH, BOARD_HEIGHT, NUM_SQUARES
+from zobrist import SIDE_KEY
+
+PIECE_LETTERS = {GENERAL: "k", GUARD: "a", ELEPHANT: "b", HORSE: "n", CHARIOT: "r", CANNON: "c", SOLDIER: "p"}
+LETTER_TYPES = {letter: piece_type for piece_type, letter in PIECE_LETTERS.items()}
+SIDE_LETTERS = ("b", "r")
+
+START_TEXT = "rbna1abnr/4k4/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/4K4/RBNA1ABNR b"
+
+# Binary position record: 45 bytes of square nibbles (even square in the low nibble) and one flags byte
+POSITION_SIZE = NUM_SQUARES // 2 + 1
+RED_TO_MOVE = 1
+BLUE_IN_CHECK = 2
+RED_IN_CHECK = 4
+
+GAME_STORE_MAGIC = b"JANGGIGS"
+POSITION_STORE_MAGIC = b"JANGGIPS"
+_FOOTER = struct.Struct("<QQ")  # index offset, number of games
+_OFFSET = struct.Struct("<Q")
+
+
+def write_text(board):
+    """Returns the text notation of a CompactBoard"""
+    squares = board.squares
+    rows = []
+    for y in range(BOARD_HEIGHT):
+        row = ""
+        empty = 0
+        for x in range(BOARD_WIDTH):
+            code = squares[y * BOARD_WIDTH + x]
+            if not code:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            letter = PIECE_LETTERS[code_type(code)]
+            row += letter if code_side(code) == RED else letter.upper()
+        if empty:
+            row += str(empty)
+        rows.append(row)
+    return "/".join(rows) + " " + SIDE_LETTERS[board.side]
+
+
+def parse_text(text):
+    """Builds a CompactBoard from text notation. Raises ValueError if the text isn't a valid position"""
+    fields = text.split()
+    if len(fields) != 2 or fields[1] not in SIDE_LETTERS:
+        raise ValueError("expected '<rows> <b|r>': " + repr(text))
+    rows = fields[0].split("/")
+    if len(rows) != BOARD_HEIGHT:
+        raise ValueError("expected %d rows, got %d" % (BOARD_HEIGHT, len(rows)))
+    board = CompactBoard()
+    for y, row in enumerate(rows):
+        x = 0
+        for char in row:
+            if char.isdigit():
+                x += int(char)
+                continue
+            piece_type = LETTER_TYPES.get(char.lower())
+            if piece_type is None:
+                raise ValueError("unknown piece letter " + repr(char))
+            if x >= BOARD_WIDTH:
+                raise ValueError("row %d has more than %d squares: %r" % (y + 1, BOARD_WIDTH, row))
+            board.put_piece(y * BOARD_WIDTH + x, piece_type | (RED_FLAG if char.islower() else 0))
+            x += 1
+        if x != BOARD_WIDTH:
+            raise ValueError("row %d does not have %d squares: %r" % (y + 1, BOARD_WIDTH, row))
+    board.side = SIDE_LETTERS.index(fields[1])
+    if board.side == RED:
+        board.hash ^= SIDE_KEY
+    board.rebuild_attacks()
+    return board
+
+
+def encode_position(board):
+    """Returns the POSITION_SIZE byte record of a CompactBoard"""
+    squares = board.squares
+    record = bytearray(POSITION_SIZE)
+    for i in range(NUM_SQUARES // 2):
+        record[i] = squares[2 * i] | squares[2 * i + 1] << 4
+    flags = RED_TO_MOVE if board.side == RED else 0
+    if board.in_check(BLUE):
+        flags |= BLUE_IN_CHECK
+    if board.in_check(RED):
+        flags |= RED_IN_CHECK
+    record[-1] = flags
+    return bytes(record)
+
+
+def decode_position(record):
+    """Builds a CompactBoard from a position record held in any bytes-like object"""
+    record = memoryview(record)
+    if len(record) != POSITION_SIZE:
+        raise ValueError("position record must be %d bytes" % POSITION_SIZE)
+    board = CompactBoard()
+    for i in range(NUM_SQUARES // 2):
+        byte = record[i]
+        for sq, code in ((2 * i, byte & 15), (2 * i + 1, byte >> 4)):
+            if code:
+                if not code & 7:
+                    raise ValueError("invalid piece code %d on square %d" % (code, sq))
+                board.put_piece(sq, code)
+    if record[-1] & RED_TO_MOVE:
+        board.side = RED
+        board.hash ^= SIDE_KEY
+    board.rebuild_attacks()
+    return board
+
+
+def position_flags(record):
+    """Returns the flags byte of a position record without decoding the squares"""
+    return record[POSITION_SIZE - 1]
+
+
+def write_varint(value, out):
+    """Appends an unsigned integer to a bytearray as a little-endian base-128 varint"""
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset=0):
+    """Reads a varint from a bytes-like object and returns (value, offset just past it)"""
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_moves(moves):
+    """Returns the varint record of a list of packed moves: the move count followed by every move"""
+    out = bytearray()
+    write_varint(len(moves), out)
+    for move in moves:
+        write_varint(move, out)
+    return bytes(out)
+
+
+def decode_moves(record):
+    """Returns the list of packed moves in a record written by encode_moves"""
+    count, offset = read_varint(record)
+    moves = []
+    for _ in range(count):
+        move, offset = read_varint(record, offset)
+        moves.append(move)
+    return moves
+
+
+def replay_positions(moves, start=None):
+    """Yields a CompactBoard for the starting position (the opening by default) and after every packed move.
+    The same board object is updated in place, so copy it to keep a position"""
+    board = parse_text(START_TEXT) if start is None else start.copy()
+    yield board
+    for move in moves:
+        board.make_move(move)
+        yield board
+
+
+class BinaryStore:
+    """Shared buffer handling for the binary stores. The buffer may be bytes, a bytearray or an mmap"""
+
+    def __init__(self, buffer, magic):
+        """Wraps buffer without copying it and checks its header"""
+        self._mmap = None
+        self._view = memoryview(buffer)
+        if bytes(self._view[:len(magic)]) != magic:
+            raise ValueError("not a %s file" % magic.decode())
+
+    @classmethod
+    def open(cls, path):
+        """Maps a store file into memory read-only"""
+        with open(path, "rb") as store_file:
+            mapped = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        store = cls(mapped)
+        store._mmap = mapped
+        return store
+
+    def close(self):
+        """Releases the buffer, unmapping the file if open() mapped it. Records handed out by the store must be
+        released first"""
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameStoreWriter:
+    """Writes games to a binary stream as varint move records, followed by an offset index and a footer"""
+
+    def __init__(self, stream):
+        """Starts a store on a binary file-like object"""
+        self._stream = stream
+        self._offsets = []
+        self._position = len(GAME_STORE_MAGIC)
+        stream.write(GAME_STORE_MAGIC)
+
+    def add(self, moves):
+        """Appends a game given as a list of packed moves"""
+        record = encode_moves(moves)
+        self._offsets.append(self._position)
+        self._stream.write(record)
+        self._position += len(record)
+
+    def close(self):
+        """Writes the index and footer. The stream itself is left open"""
+        index_offset = self._position
+        for offset in self._offsets + [index_offset]:
+            self._stream.write(_OFFSET.pack(offset))
+        self._stream.write(_FOOTER.pack(index_offset, len(self._offsets)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameStore(BinaryStore):
+    """Random access to the games of a store written by GameStoreWriter"""
+
+    def __init__(self, buffer):
+        """Reads the footer of a store held in buffer"""
+        BinaryStore.__init__(self, buffer, GAME_STORE_MAGIC)
+        self._index_offset, self._count = _FOOTER.unpack_from(self._view, len(self._view) - _FOOTER.size)
+
+    def __len__(self):
+        """Returns the number of games"""
+        return self._count
+
+    def record(self, n):
+        """Returns a memoryview of the N-th game's move record, sharing memory with the store"""
+        if not 0 <= n < self._count:
+            raise IndexError("game index out of range")
+        start, = _OFFSET.unpack_from(self._view, self._index_offset + n * _OFFSET.size)
+        end, = _OFFSET.unpack_from(self._view, self._index_offset + (n + 1) * _OFFSET.size)
+        return self._view[start:end]
+
+    def moves(self, n):
+        """Returns the packed moves of the N-th game"""
+        return decode_moves(self.record(n))
+
+    def positions(self, n):
+        """Yields every position of the N-th game, see replay_positions"""
+        return replay_positions(self.moves(n))
+
+    def __iter__(self):
+        """Yields the packed move list of every game in order"""
+        for n in range(self._count):
+            yield self.moves(n)
+
+
+def write_positions(stream, boards):
+    """Writes a position store: a header followed by one fixed-size record per CompactBoard. Returns the count"""
+    stream.write(POSITION_STORE_MAGIC)
+    count = 0
+    for board in boards:
+        stream.write(encode_position(board))
+        count += 1
+    return count
+
+
+class PositionStore(BinaryStore):
+    """Random access to the fixed-size records of a store written by write_positions"""
+
+    def __init__(self, buffer):
+        """Wraps a position store held in buffer"""
+        BinaryStore.__init__(self, buffer, POSITION_STORE_MAGIC)
+        self._count = (len(self._view) - len(POSITION_STORE_MAGIC)) // POSITION_SIZE
+
+    def __len__(self):
+        """Returns the number of positions"""
+        return self._count
+
+    def __getitem__(self, n):
+        """Returns a memoryview of the N-th position record, sharing memory with the store"""
+        if not 0 <= n < self._count:
+            raise IndexError("position index out of range")
+        start = len(POSITION_STORE_MAGIC) + n * POSITION_SIZE
+        return self._view[start:start + POSITION_SIZE]
+
+    def board(self, n):
+        """Decodes the N-th position into a CompactBoard"""
+        return decode_position(self[n])
+
+    def flags(self, n):
+        """Returns the side to move and check flags of the N-th position"""
+        return position_flags(self[n])
+
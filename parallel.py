@@ -0,0 +1,195 @@
+# Description: Parallel root-splitting search. Each iteration of iterative deepening searches the expected best
+# root move first, then hands the remaining root moves to a pool of worker processes, each running its own Searcher
+# with the best score found so far as its lower bound. Positions are sent to the workers as notation.py position
+# records, not pickled Piece objects.
+#
+# Usage:
+#     python parallel.py bench [--depth 4] [--workers 4]    time to depth on the opening with 1..N workers
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from board import move_from, move_to
+from notation import encode_position, decode_position
+from search import Searcher, SearchResult, INFINITY, MATE, MATE_BOUND
+from evaluation import evaluate
+from main import JanggiGame
+from tables import square_to_pos
+from zobrist import TranspositionTable
+
+_worker_searcher = None
+_worker_position = None
+
+
+def _search_root_move(record, move, depth, alpha, time_limit):
+    """Runs inside a worker: searches one root move of the position in record. Returns (score, nodes); score is
+    None if the time ran out"""
+    global _worker_searcher, _worker_position
+    if _worker_searcher is None:
+        _worker_searcher = Searcher(TranspositionTable(1 << 18))
+    if record != _worker_position:  # a new root position: let the table's old entries be replaced
+        _worker_searcher.table.new_search()
+        _worker_position = record
+    score = _worker_searcher.search_move(decode_position(record), move, depth, alpha, time_limit)
+    return score, _worker_searcher.nodes
+
+
+def _ready(_):
+    """Does nothing; mapped over the pool so every worker has started before anything is timed"""
+    return os.getpid()
+
+
+class ParallelSearcher:
+    """Iterative deepening search whose root moves are split across a process pool. The workers keep their
+    transposition tables between iterations and between calls, so a ParallelSearcher should be reused for the
+    moves of a game and closed when done"""
+
+    def __init__(self, workers=None):
+        """Starts a pool of workers processes (all cores by default)"""
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(self.workers)
+        self.nodes = 0
+
+    def warm_up(self):
+        """Makes sure every worker process is running"""
+        list(self._pool.map(_ready, range(self.workers * 4)))
+
+    def close(self):
+        """Shuts the worker pool down"""
+        self._pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def search(self, board, time_ms=200, max_depth=64, info=None):
+        """Searches a CompactBoard like Searcher.search (without a time limit if time_ms is None) and returns a
+        SearchResult. As there, the move is None only if there is no legal move; a search out of time before
+        depth 1 completes returns the first legal move at depth 0"""
+        start = time.perf_counter()
+        deadline = start + time_ms / 1000 if time_ms is not None else float("inf")
+        record = encode_position(board)
+        self.nodes = 0
+        moves = board.legal_moves()
+        if not moves:
+            score = -MATE if board.in_check(board.side) else evaluate(board)
+            return SearchResult(None, score, 0, 0, 0.0, 0)
+
+        best_move, best_score, completed_depth = None, 0, 0
+        scores = {}
+        for depth in range(1, max_depth + 1):
+            moves.sort(key=lambda move: (move == best_move, scores.get(move, -INFINITY)), reverse=True)
+            result = self._search_depth(record, moves, depth, deadline)
+            if result is None:
+                break
+            best_move, best_score, scores = result
+            completed_depth = depth
+            elapsed = time.perf_counter() - start
+            if info is not None:
+                info(self._result(best_move, best_score, completed_depth, elapsed))
+            if abs(best_score) >= MATE_BOUND or start + elapsed * 2 > deadline:
+                break
+        if best_move is None:  # out of time before depth 1 finished: any legal move beats none
+            best_move, best_score = moves[0], evaluate(board)
+        return self._result(best_move, best_score, completed_depth, time.perf_counter() - start)
+
+    def _search_depth(self, record, moves, depth, deadline):
+        """Searches every root move to depth. The first move is searched alone to get a lower bound, the rest are
+        handed out as workers become free, each with the best score known at the time. Returns (best move, score,
+        {move: score}) or None if the time ran out"""
+        pool = self._pool
+        time_left = deadline - time.perf_counter()
+        if time_left <= 0:
+            return None
+        score, nodes = pool.submit(_search_root_move, record, moves[0], depth, -INFINITY, time_left).result()
+        self.nodes += nodes
+        if score is None:
+            return None
+        best_move, alpha = moves[0], score
+        scores = {best_move: score}
+
+        remaining = iter(moves[1:])
+        running = {}
+        try:
+            while True:
+                while len(running) < self.workers:
+                    move = next(remaining, None)
+                    if move is None:
+                        break
+                    time_left = deadline - time.perf_counter()
+                    running[pool.submit(_search_root_move, record, move, depth, alpha, time_left)] = move
+                if not running:
+                    return best_move, alpha, scores
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    move = running.pop(future)
+                    score, nodes = future.result()
+                    self.nodes += nodes
+                    if score is None:
+                        return None
+                    scores[move] = score
+                    if score > alpha:
+                        best_move, alpha = move, score
+        finally:
+            for future in running:
+                future.cancel()
+
+    def _result(self, move, score, depth, seconds):
+        """Packages search statistics into a SearchResult"""
+        nps = int(self.nodes / seconds) if seconds > 0 else 0
+        return SearchResult(move, score, depth, self.nodes, seconds, nps)
+
+
+def parallel_best_move(game, searcher, time_ms=200, max_depth=64, info=None):
+    """search.best_move for a ParallelSearcher: returns a SearchResult whose move is a (pos1, pos2) tuple"""
+    if game.get_game_state() != "UNFINISHED":
+        return None
+    result = searcher.search(game.get_compact_board(), time_ms, max_depth, info)
+    if result.move is None:
+        return result
+    return result._replace(move=(square_to_pos(move_from(result.move)), square_to_pos(move_to(result.move))))
+
+
+def bench_scaling(depth=4, max_workers=None):
+    """Times a fixed-depth search of the opening with a plain Searcher and with 1..max_workers workers.
+    Returns a list of (workers, seconds, nodes, score); workers is 0 for the single-process Searcher"""
+    board = JanggiGame().get_compact_board()
+    rows = []
+    start = time.perf_counter()
+    result = Searcher().search(board, time_ms=10 ** 9, max_depth=depth)
+    rows.append((0, time.perf_counter() - start, result.nodes, result.score))
+    for workers in range(1, (max_workers or os.cpu_count() or 1) + 1):
+        with ParallelSearcher(workers) as searcher:
+            searcher.warm_up()
+            start = time.perf_counter()
+            result = searcher.search(board, time_ms=10 ** 9, max_depth=depth)
+            rows.append((workers, time.perf_counter() - start, result.nodes, result.score))
+    return rows
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Parallel Janggi search")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="speedup from 1 to N workers on the opening")
+    bench_parser.add_argument("--depth", type=int, default=4)
+    bench_parser.add_argument("--workers", type=int, default=None, help="largest pool to try (default: all cores)")
+    args = parser.parse_args(argv)
+
+    rows = bench_scaling(args.depth, args.workers)
+    serial_seconds = rows[0][1]
+    one_worker_seconds = rows[1][1] if len(rows) > 1 else serial_seconds
+    print("depth %d on the opening, %d cores" % (args.depth, os.cpu_count() or 1))
+    for workers, seconds, nodes, score in rows:
+        name = "serial" if workers == 0 else "%d worker%s" % (workers, "" if workers == 1 else "s")
+        print("  %-10s %7.2fs %9d nodes  score %6d  speedup %.2fx (vs serial %.2fx)"
+              % (name, seconds, nodes, score, one_worker_seconds / seconds, serial_seconds / seconds))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,286 @@
+# Description: Perft move-path enumeration and a benchmark command line for the move generator and validators.
+# perft counts every move sequence of a given length, so any change to the rules shows up as a different count.
+# perft walks the CompactBoard move generator; game_perft instead tries every (pos1, pos2) pair through
+# JanggiGame.make_move, and so through is_legal_move, and is the slow ground truth the reference counts come from.
+#
+# Usage:
+#     python perft.py perft 3 [--game]   count move paths from the opening (through JanggiGame.make_move)
+#     python perft.py divide 2           per root move breakdown
+#     python perft.py bench              nodes/second, game construction/clone cost and per-piece validation cost
+#     python perft.py regress            compare node counts against perft_reference.json, with game_perft as well
+#                                        up to --game-depth (2 by default)
+
+import argparse
+import json
+import os
+import random
+import time
+
+from board import PIECE_NAMES, move_from, move_to
+from main import JanggiGame
+from rules import DrawRules
+from tables import NUM_SQUARES, square_to_pos
+
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perft_reference.json")
+NO_DRAWS = DrawRules(None, None, False, "draw")  # perft counts moves, so no path may end early in a draw
+
+
+def _start_game(moves=(), draw_rules=None):
+    """Returns a JanggiGame from the opening with a list of (pos1, pos2) moves already played"""
+    game = JanggiGame(draw_rules)
+    for pos1, pos2 in moves:
+        if not game.make_move(pos1, pos2):
+            raise ValueError("illegal move in setup: " + pos1 + " " + pos2)
+    return game
+
+
+def _perft(board, depth):
+    """Counts the move paths of length depth from a CompactBoard"""
+    moves = board.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        captured = board.make_move(move)
+        nodes += _perft(board, depth - 1)
+        board.unmake_move(move, captured)
+    return nodes
+
+
+def perft(depth, game=None):
+    """Returns the number of move paths of length depth from game's position (the opening by default).
+    Skipped turns are not counted as moves"""
+    if game is None:
+        game = JanggiGame()
+    if depth == 0:
+        return 1
+    return _perft(game.get_compact_board().copy(), depth)
+
+
+def divide(depth, game=None):
+    """Returns a dict mapping each root move (pos1, pos2) to the number of paths of length depth starting with it"""
+    if game is None:
+        game = JanggiGame()
+    board = game.get_compact_board().copy()
+    counts = {}
+    for move in board.legal_moves():
+        captured = board.make_move(move)
+        counts[(square_to_pos(move_from(move)), square_to_pos(move_to(move)))] = \
+            _perft(board, depth - 1) if depth > 1 else 1
+        board.unmake_move(move, captured)
+    return counts
+
+
+def _game_perft(game, depth):
+    """Counts the move paths of length depth from a JanggiGame by trying every (pos1, pos2) pair of a piece of the
+    side to move and another square with make_move, taking each accepted move back with undo"""
+    turn = game.get_current_turn()
+    from_squares = [square for square in range(NUM_SQUARES) if _piece_color(game, square) == turn]
+    nodes = 0
+    for from_square in from_squares:
+        pos1 = square_to_pos(from_square)
+        for to_square in range(NUM_SQUARES):
+            if to_square != from_square and game.make_move(pos1, square_to_pos(to_square)):
+                nodes += _game_perft(game, depth - 1) if depth > 1 else 1
+                game.undo()
+    return nodes
+
+
+def _piece_color(game, square):
+    """Returns the color of the piece on a square of a JanggiGame, or None if it is empty"""
+    piece = game.get_piece(square_to_pos(square))
+    return None if piece == "" else piece.get_piece_color()
+
+
+def game_perft(depth, game=None):
+    """Like perft, but every move is found and played through JanggiGame.make_move. game's moves are replayed on a
+    new game without draw rules, which is the one searched"""
+    moves = () if game is None else [(square_to_pos(record.from_square), square_to_pos(record.to_square))
+                                     for record in game.get_history()]
+    game = _start_game(moves, NO_DRAWS)
+    if depth == 0:
+        return 1
+    return _game_perft(game, depth)
+
+
+def sample_games(count, length, seed=0):
+    """Plays count random games of at most length moves with make_move and returns their move lists"""
+    chooser = random.Random(seed)
+    games = []
+    for _ in range(count):
+        game = JanggiGame()
+        moves = []
+        while len(moves) < length and game.get_game_state() == "UNFINISHED":
+            candidates = game.generate_moves(game.get_current_turn())
+            if not candidates:
+                break
+            move = chooser.choice(candidates)
+            game.make_move(*move)
+            moves.append(move)
+        games.append(moves)
+    return games
+
+
+def bench_perft(depth):
+    """Times perft from the opening and returns (nodes, seconds)"""
+    start = time.perf_counter()
+    nodes = perft(depth)
+    return nodes, time.perf_counter() - start
+
+
+def bench_make_move(games):
+    """Replays games through JanggiGame.make_move and returns (moves, seconds)"""
+    moves = 0
+    start = time.perf_counter()
+    for game_moves in games:
+        game = JanggiGame()
+        for pos1, pos2 in game_moves:
+            game.make_move(pos1, pos2)
+            moves += 1
+    return moves, time.perf_counter() - start
+
+
+def bench_construction(count=2000, moves=()):
+    """Times JanggiGame() and JanggiGame.clone() of a game with moves played. Returns (seconds per construction,
+    seconds per clone)"""
+    start = time.perf_counter()
+    for _ in range(count):
+        JanggiGame()
+    construction = (time.perf_counter() - start) / count
+    game = _start_game(moves)
+    start = time.perf_counter()
+    for _ in range(count):
+        game.clone()
+    return construction, (time.perf_counter() - start) / count
+
+
+def bench_validators(games, positions_per_game=5):
+    """Calls is_legal_move for every piece against every square in positions taken from games. Returns a dict
+    mapping piece type name to (calls, seconds)"""
+    costs = {name: [0, 0.0] for name in PIECE_NAMES.values()}
+    timer = time.perf_counter
+    for game_moves in games:
+        game = JanggiGame()
+        stride = max(1, len(game_moves) // positions_per_game)
+        for ply, (pos1, pos2) in enumerate(game_moves):
+            game.make_move(pos1, pos2)
+            if ply % stride:
+                continue
+            positions = [square_to_pos(square) for square in range(NUM_SQUARES)]
+            pieces = [(game.pos_to_coordinate(pos), game.get_piece(pos)) for pos in positions]
+            for from_coordinate, piece in pieces:
+                if piece == "":
+                    continue
+                targets = [(coordinate, next_piece) for coordinate, next_piece in pieces
+                           if coordinate != from_coordinate]
+                start = timer()
+                for to_coordinate, next_piece in targets:
+                    game.is_legal_move(from_coordinate, piece, to_coordinate, next_piece)
+                cost = costs[piece.get_piece_type()]
+                cost[0] += len(targets)
+                cost[1] += timer() - start
+    return {name: tuple(cost) for name, cost in costs.items()}
+
+
+def load_reference(path=REFERENCE_FILE):
+    """Reads the stored perft reference positions"""
+    with open(path) as reference_file:
+        return json.load(reference_file)["positions"]
+
+
+def regress(path=REFERENCE_FILE, max_depth=None, game_depth=2):
+    """Recomputes every node count in the reference file with perft, and up to game_depth with game_perft too.
+    Returns a list of (name, depth, expected, actual, method) for each count that no longer matches"""
+    mismatches = []
+    for position in load_reference(path):
+        game = _start_game(position["moves"])
+        for depth, expected in enumerate(position["nodes"], 1):
+            if max_depth is not None and depth > max_depth:
+                break
+            actual = perft(depth, game)
+            if actual != expected:
+                mismatches.append((position["name"], depth, expected, actual, "perft"))
+            if depth <= game_depth:
+                actual = game_perft(depth, game)
+                if actual != expected:
+                    mismatches.append((position["name"], depth, expected, actual, "game_perft"))
+    return mismatches
+
+
+def update_reference(path=REFERENCE_FILE):
+    """Rewrites the node counts in the reference file with game_perft, so they come from the rules in main.py
+    rather than from the move generator they check. This is slow: minutes for the full file"""
+    positions = load_reference(path)
+    for position in positions:
+        game = _start_game(position["moves"])
+        position["nodes"] = [game_perft(depth, game) for depth in range(1, len(position["nodes"]) + 1)]
+    with open(path, "w") as reference_file:
+        json.dump({"positions": positions}, reference_file, indent=2)
+        reference_file.write("\n")
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Janggi perft and move generation benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    perft_parser = commands.add_parser("perft", help="count move paths from the opening")
+    perft_parser.add_argument("depth", type=int)
+    perft_parser.add_argument("--game", action="store_true", help="count through JanggiGame.make_move instead")
+    divide_parser = commands.add_parser("divide", help="count move paths per root move")
+    divide_parser.add_argument("depth", type=int)
+    bench_parser = commands.add_parser("bench", help="report nodes/second and validation cost")
+    bench_parser.add_argument("--depth", type=int, default=3)
+    bench_parser.add_argument("--games", type=int, default=20)
+    bench_parser.add_argument("--length", type=int, default=80)
+    regress_parser = commands.add_parser("regress", help="compare node counts with the reference file")
+    regress_parser.add_argument("--reference", default=REFERENCE_FILE)
+    regress_parser.add_argument("--max-depth", type=int)
+    regress_parser.add_argument("--game-depth", type=int, default=2, help="depths checked with game_perft as well")
+    regress_parser.add_argument("--update", action="store_true", help="rewrite the reference counts instead")
+    args = parser.parse_args(argv)
+
+    if args.command == "perft" and args.game:
+        start = time.perf_counter()
+        nodes = game_perft(args.depth)
+        print("game_perft", args.depth, nodes, "nodes", "%.0f nodes/s" % (nodes / (time.perf_counter() - start)))
+
+    elif args.command == "perft":
+        nodes, seconds = bench_perft(args.depth)
+        print("perft", args.depth, nodes, "nodes", "%.0f nodes/s" % (nodes / seconds))
+
+    elif args.command == "divide":
+        counts = divide(args.depth)
+        for (pos1, pos2), nodes in sorted(counts.items()):
+            print(pos1, pos2, nodes)
+        print("moves", len(counts), "nodes", sum(counts.values()))
+
+    elif args.command == "bench":
+        nodes, seconds = bench_perft(args.depth)
+        print("perft %d: %d nodes in %.3fs, %.0f nodes/s" % (args.depth, nodes, seconds, nodes / seconds))
+        games = sample_games(args.games, args.length)
+        moves, seconds = bench_make_move(games)
+        print("make_move: %d moves in %.3fs, %.0f moves/s" % (moves, seconds, moves / seconds))
+        construction, clone = bench_construction(moves=games[0][:40])
+        print("JanggiGame(): %.1f us, clone() after %d moves: %.1f us" % (construction * 1e6, len(games[0][:40]),
+                                                                          clone * 1e6))
+        print("is_legal_move cost per call:")
+        for name, (calls, seconds) in sorted(bench_validators(games).items()):
+            if calls:
+                print("  %-8s %8d calls %8.0f ns/call" % (name, calls, seconds / calls * 1e9))
+
+    elif args.command == "regress":
+        if args.update:
+            update_reference(args.reference)
+            print("reference updated")
+            return 0
+        mismatches = regress(args.reference, args.max_depth, args.game_depth)
+        for name, depth, expected, actual, method in mismatches:
+            print("MISMATCH", name, "depth", depth, "expected", expected, "got", actual, "from", method)
+        if mismatches:
+            return 1
+        print("all node counts match")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,225 @@
+# Description: Opt-in instrumentation of the move validation hot path. enable() wraps JanggiGame.make_move, every
+# check_*_move validator (through is_legal_move, which calls exactly one of them), the check helpers and the
+# CompactBoard mutations in counting/timing wrappers; disable() puts the original methods back, so nothing at all
+# is measured or paid for while profiling is off.
+#
+# Usage:
+#     python profiling.py [--games 20]      replays sample games with profiling on and prints the counters
+#
+# In a running program:
+#     import profiling
+#     profiling.enable()
+#     ...
+#     print(profiling.prometheus_text())
+
+import argparse
+import random
+from time import perf_counter_ns
+
+from board import CompactBoard
+from main import JanggiGame
+from tables import NUM_SQUARES, square_to_pos
+
+# name -> [calls, rejections, total nanoseconds]; wrappers hold on to these lists, so reset() zeroes them in place
+_stats = {}
+_make_move_rejections = {}  # reason -> count
+_originals = {}  # (class, method name) -> original function, while enabled
+
+VALIDATORS = ("check_general_move", "check_guard_move", "check_elephant_move", "check_horse_move",
+              "check_chariot_move", "check_cannon_move", "check_soldier_move")
+
+# (class, method name, reported name, whether a falsy result counts as a rejection)
+_TIMED_METHODS = (
+    (JanggiGame, "is_in_check", "is_in_check", False),
+    (JanggiGame, "is_checkmate", "is_checkmate", False),
+    (CompactBoard, "make_move", "board_make_move", False),
+    (CompactBoard, "unmake_move", "board_unmake_move", False),
+    (CompactBoard, "in_check", "board_in_check", False),
+    (CompactBoard, "is_checkmate", "board_is_checkmate", False),
+    (CompactBoard, "is_legal", "board_is_legal", True),
+    (CompactBoard, "legal_destinations", "board_legal_destinations", False),
+)
+
+
+def _counters(name):
+    """Returns the counter list for an instrumented name"""
+    return _stats.setdefault(name, [0, 0, 0])
+
+
+def _timed(function, name, counts_rejections):
+    """Wraps function so every call is counted and timed under name"""
+    stats = _counters(name)
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter_ns()
+        result = function(*args, **kwargs)
+        stats[2] += perf_counter_ns() - start
+        stats[0] += 1
+        if counts_rejections and not result:
+            stats[1] += 1
+        return result
+
+    wrapper.__wrapped__ = function
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def _timed_is_legal_move(function):
+    """Wraps JanggiGame.is_legal_move, charging each call to the validator it dispatches to"""
+    validator_stats = {name.split("_")[1].capitalize(): _counters(name) for name in VALIDATORS}
+
+    def is_legal_move(self, from_coordinate, current_piece, to_coordinate, next_piece):
+        start = perf_counter_ns()
+        result = function(self, from_coordinate, current_piece, to_coordinate, next_piece)
+        elapsed = perf_counter_ns() - start
+        stats = validator_stats[current_piece.get_piece_type()]
+        stats[0] += 1
+        stats[2] += elapsed
+        if not result:
+            stats[1] += 1
+        return result
+
+    is_legal_move.__wrapped__ = function
+    is_legal_move.__doc__ = function.__doc__
+    return is_legal_move
+
+
+def _rejection_reason(game, pos1, pos2):
+    """Works out why JanggiGame.make_move refused a move, following the order of its own checks. Only called after
+    a refusal, when the game is known to be unchanged"""
+    if game.get_game_state() != "UNFINISHED":
+        return "game_over"
+    from_x, from_y = game.pos_to_coordinate(pos1)
+    to_x, to_y = game.pos_to_coordinate(pos2)
+    piece = game._board[from_y][from_x]
+    if piece == "":
+        return "empty_square"
+    if piece.get_piece_color() != game._current_turn:
+        return "wrong_turn"
+    if (from_x, from_y) == (to_x, to_y):
+        return "pass_in_check"
+    next_piece = game._board[to_y][to_x]
+    is_legal_move = _originals.get((JanggiGame, "is_legal_move"), JanggiGame.is_legal_move)
+    if not is_legal_move(game, [from_x, from_y], piece, [to_x, to_y], next_piece):
+        return "illegal_" + piece.get_piece_type().lower() + "_move"
+    if next_piece != "" and next_piece.get_piece_color() == piece.get_piece_color():
+        return "own_piece"
+    return "leaves_general_in_check"
+
+
+def _timed_make_move(function):
+    """Wraps JanggiGame.make_move, counting refusals by reason"""
+    stats = _counters("make_move")
+
+    def make_move(self, pos1, pos2):
+        start = perf_counter_ns()
+        result = function(self, pos1, pos2)
+        stats[2] += perf_counter_ns() - start
+        stats[0] += 1
+        if not result:
+            stats[1] += 1
+            reason = _rejection_reason(self, pos1, pos2)
+            _make_move_rejections[reason] = _make_move_rejections.get(reason, 0) + 1
+        return result
+
+    make_move.__wrapped__ = function
+    make_move.__doc__ = function.__doc__
+    return make_move
+
+
+def enable():
+    """Starts collecting. Counters carry on from where they were; call reset() to start from zero"""
+    if _originals:
+        return
+    _originals[(JanggiGame, "make_move")] = JanggiGame.make_move
+    _originals[(JanggiGame, "is_legal_move")] = JanggiGame.is_legal_move
+    JanggiGame.make_move = _timed_make_move(JanggiGame.make_move)
+    JanggiGame.is_legal_move = _timed_is_legal_move(JanggiGame.is_legal_move)
+    for cls, method, name, counts_rejections in _TIMED_METHODS:
+        original = getattr(cls, method)
+        _originals[(cls, method)] = original
+        setattr(cls, method, _timed(original, name, counts_rejections))
+
+
+def disable():
+    """Stops collecting and restores the original methods. Counters are kept"""
+    for (cls, method), original in _originals.items():
+        setattr(cls, method, original)
+    _originals.clear()
+
+
+def is_enabled():
+    """Returns whether profiling is on"""
+    return bool(_originals)
+
+
+def reset():
+    """Zeroes every counter"""
+    for stats in _stats.values():
+        stats[:] = [0, 0, 0]
+    _make_move_rejections.clear()
+
+
+def get_stats():
+    """Returns the counters as a dict: for every instrumented name its calls, rejections, total and average
+    nanoseconds, plus make_move refusals by reason under "make_move_rejections" """
+    stats = {}
+    for name, (calls, rejections, total_ns) in sorted(_stats.items()):
+        stats[name] = {"calls": calls, "rejections": rejections, "total_ns": total_ns,
+                       "average_ns": total_ns / calls if calls else 0.0}
+    stats["make_move_rejections"] = dict(sorted(_make_move_rejections.items()))
+    return stats
+
+
+def prometheus_text(prefix="janggi"):
+    """Returns the counters in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, kind, description, samples):
+        lines.append("# HELP %s_%s %s" % (prefix, name, description))
+        lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+        for label, value in samples:
+            lines.append("%s_%s{%s} %s" % (prefix, name, label, value))
+
+    items = sorted(_stats.items())
+    metric("calls_total", "counter", "Calls of each instrumented function.",
+           [('function="%s"' % name, stats[0]) for name, stats in items])
+    metric("rejections_total", "counter", "Calls that refused a move.",
+           [('function="%s"' % name, stats[1]) for name, stats in items])
+    metric("seconds_total", "counter", "Time spent in each instrumented function.",
+           [('function="%s"' % name, "%.9f" % (stats[2] / 1e9)) for name, stats in items])
+    metric("average_nanoseconds", "gauge", "Average time per call.",
+           [('function="%s"' % name, "%.1f" % (stats[2] / stats[0] if stats[0] else 0.0)) for name, stats in items])
+    metric("make_move_rejections_total", "counter", "make_move refusals by reason.",
+           [('reason="%s"' % reason, count) for reason, count in sorted(_make_move_rejections.items())])
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    """Command line entry point: replays sample games, including some refused moves, with profiling on"""
+    from perft import sample_games
+    parser = argparse.ArgumentParser(description="Profile make_move and the move validators")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--length", type=int, default=80)
+    args = parser.parse_args(argv)
+
+    games = sample_games(args.games, args.length)
+    chooser = random.Random(0)
+    enable()
+    try:
+        for game_moves in games:
+            game = JanggiGame()
+            for pos1, pos2 in game_moves:
+                # a refused attempt before every move, to exercise the validators' rejection paths
+                target = square_to_pos(chooser.randrange(NUM_SQUARES))
+                if target != pos1 and target not in game.legal_moves_from(pos1):
+                    game.make_move(pos1, target)
+                game.make_move(pos1, pos2)
+    finally:
+        disable()
+    print(prometheus_text(), end="")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,186 @@
+# Description: Batch replay of recorded games. Every move is validated with the same rules as JanggiGame.make_move,
+# but on a single reused CompactBoard that is reset from the opening for each game, and large archives can be
+# spread over a process pool.
+#
+# Usage:
+#     python replay.py games.txt [--workers 8]
+#
+# A game archive holds one game per line, written as the positions of each move in order, e.g. "c7 c8 c1 d3".
+
+import argparse
+import os
+import re
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from board import COLORS, encode_move
+from main import JanggiGame
+from rules import DEFAULT_RULES, adjudicate, drawn_by, is_bikjang
+from tables import NUM_SQUARES, pos_to_square
+
+ReplayResult = namedtuple("ReplayResult", ["game_id", "state", "plies", "first_illegal_ply", "positions"])
+
+_POSITION = re.compile(r"[a-i](?:10|[1-9])")
+
+
+def read_games(stream):
+    """Yields the (pos1, pos2) move list of every non-empty line of a game archive. Tokens are passed on as they
+    are, so replay refuses a garbled position at the move it belongs to, and a trailing position without its
+    partner becomes a last move (pos1, None) that is refused as well"""
+    for line in stream:
+        tokens = line.split()
+        if tokens:
+            moves = list(zip(tokens[0::2], tokens[1::2]))
+            if len(tokens) % 2:
+                moves.append((tokens[-1], None))
+            yield moves
+
+
+def _square(pos):
+    """Returns the square for a position string, or None if it isn't a square on the board"""
+    if not isinstance(pos, str) or not _POSITION.fullmatch(pos):
+        return None
+    sq = pos_to_square(pos)
+    return sq if sq < NUM_SQUARES else None
+
+
+def play_move(board, pos1, pos2):
+    """Plays a (pos1, pos2) move on the CompactBoard of an unfinished game if JanggiGame.make_move would accept it.
+    Returns the game state after the move, or None if the move is refused and the board is left unchanged"""
+    from_square = _square(pos1)
+    to_square = _square(pos2)
+    if from_square is None or to_square is None:
+        return None
+    move = encode_move(from_square, to_square)
+    if not board.is_legal(move):
+        return None
+    board.make_move(move)
+    if board.is_checkmate():
+        return COLORS[board.side ^ 1] + "_WON"
+    return "UNFINISHED"
+
+
+class Replayer:
+    """Replays games one after another on the same CompactBoard"""
+
+    def __init__(self, draw_rules=None):
+        """Builds the opening position once; every replay starts from a copy of it. draw_rules is the
+        rules.DrawRules the games are judged by, as in JanggiGame"""
+        self._opening = JanggiGame().get_compact_board().copy()
+        self._board = self._opening.copy()
+        self._draw_rules = draw_rules or DEFAULT_RULES
+
+    def replay(self, game_id, moves, with_positions=True, visit=None):
+        """Replays a sequence of (pos1, pos2) moves and returns a ReplayResult. Replay stops at the first move
+        JanggiGame.make_move would refuse. positions lists the Zobrist hash of the opening and of the position
+        after every accepted move, or is None when with_positions is False. visit, if given, is called with the
+        CompactBoard at each of those positions; it must not change the board"""
+        board = self._board
+        board.copy_from(self._opening)
+        if visit is not None:
+            visit(board)
+        state = "UNFINISHED"
+        positions = [board.hash] if with_positions else None
+        plies = 0
+        counts = {board.hash: 1}  # the same draw bookkeeping as JanggiGame._record_move
+        passes = 0
+        bikjang = False
+        for pos1, pos2 in moves:
+            next_state = play_move(board, pos1, pos2) if state == "UNFINISHED" else None
+            if next_state is None:
+                return ReplayResult(game_id, state, plies, plies, positions)
+            state = next_state
+            plies += 1
+            passes = passes + 1 if pos1 == pos2 else 0
+            bikjang_kept, bikjang = bikjang, is_bikjang(board)
+            counts[board.hash] = counts.get(board.hash, 0) + 1
+            if state == "UNFINISHED" and \
+                    drawn_by(self._draw_rules, counts[board.hash], passes, bikjang and bikjang_kept):
+                state = adjudicate(board, self._draw_rules)
+            if with_positions:
+                positions.append(board.hash)
+            if visit is not None:
+                visit(board)
+        return ReplayResult(game_id, state, plies, None, positions)
+
+
+_worker_replayers = {}  # draw rules -> Replayer, per worker process
+
+
+def _replay_chunk(chunk, with_positions, draw_rules=None):
+    """Replays a list of (game_id, moves) pairs inside a worker process"""
+    replayer = _worker_replayers.get(draw_rules)
+    if replayer is None:
+        replayer = _worker_replayers[draw_rules] = Replayer(draw_rules)
+    return [replayer.replay(game_id, moves, with_positions) for game_id, moves in chunk]
+
+
+def _chunks(games, chunk_size):
+    """Groups an iterable of move lists into lists of (game_id, moves) pairs"""
+    chunk = []
+    for game_id, moves in enumerate(games):
+        chunk.append((game_id, list(moves)))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def replay_games(games, workers=1, chunk_size=256, with_positions=True, draw_rules=None):
+    """Replays an iterable of games, each a sequence of (pos1, pos2) moves, and yields a ReplayResult per game in
+    input order. Game ids are positions in the input. With more than one worker the games are replayed in a
+    process pool; only a few chunks per worker are in flight at once, so a stream of any length is handled in
+    bounded memory. draw_rules is the rules.DrawRules the games are judged by, as in Replayer"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        replayer = Replayer(draw_rules)
+        for game_id, moves in enumerate(games):
+            yield replayer.replay(game_id, moves, with_positions)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in _chunks(games, chunk_size):
+            pending.append(pool.submit(_replay_chunk, chunk, with_positions, draw_rules))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    """Command line entry point: replays an archive and prints a summary"""
+    parser = argparse.ArgumentParser(description="Validate and replay a Janggi game archive")
+    parser.add_argument("archive", help="game archive, one game per line ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--show-illegal", action="store_true", help="print every game with an illegal move")
+    args = parser.parse_args(argv)
+
+    stream = sys.stdin if args.archive == "-" else open(args.archive)
+    games = moves = illegal = 0
+    states = {}
+    start = time.perf_counter()
+    with stream:
+        for result in replay_games(read_games(stream), args.workers, args.chunk_size, with_positions=False):
+            games += 1
+            moves += result.plies
+            states[result.state] = states.get(result.state, 0) + 1
+            if result.first_illegal_ply is not None:
+                illegal += 1
+                if args.show_illegal:
+                    print("game", result.game_id, "illegal move at ply", result.first_illegal_ply)
+    seconds = time.perf_counter() - start
+    print("games %d  moves %d  with illegal moves %d  %.1fs  %.0f moves/s"
+          % (games, moves, illegal, seconds, moves / seconds if seconds else 0))
+    for state, count in sorted(states.items()):
+        print("  %-10s %d" % (state, count))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
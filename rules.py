@@ -0,0 +1,57 @@
+# Description: Ways a game can end other than checkmate: the same position coming up again, both players passing
+# one after the other, and bikjang (the two generals facing each other on an open file, left standing by the
+# player who could have broken it). A DrawRules tuple says which of these end the game and how it is then decided:
+# as a draw, or on material points the way tournament Janggi scores an unfinished game.
+
+from collections import namedtuple
+
+from board import BLUE, RED, COLORS
+from tables import BOARD_WIDTH
+
+# repetitions: how many times a position may occur before the game ends (None never ends it)
+# passes: how many passes in a row end the game (None never ends it)
+# bikjang: whether an unbroken bikjang ends the game
+# adjudication: "draw" to call an ended game a draw, "points" to award it to the side with more material points
+DrawRules = namedtuple("DrawRules", ["repetitions", "passes", "bikjang", "adjudication"])
+DEFAULT_RULES = DrawRules(repetitions=3, passes=2, bikjang=True, adjudication="draw")
+
+POINT_VALUES = (0, 0, 3, 3, 5, 13, 7, 2)  # indexed by piece type; the usual tournament counting
+RED_BONUS = 1.5  # deom: red moves second and gets a point and a half, which also rules out a tie
+
+
+def is_bikjang(board):
+    """Returns whether the generals on a CompactBoard stand on the same file with nothing between them"""
+    blue_general, red_general = board.generals[BLUE], board.generals[RED]
+    if blue_general < 0 or red_general < 0 or blue_general % BOARD_WIDTH != red_general % BOARD_WIDTH:
+        return False
+    squares = board.squares
+    low, high = sorted((blue_general, red_general))
+    return not any(squares[sq] for sq in range(low + BOARD_WIDTH, high, BOARD_WIDTH))
+
+
+def material_points(board, side):
+    """Returns the material points of side on a CompactBoard, counting red's bonus"""
+    squares = board.squares
+    points = sum(POINT_VALUES[squares[sq] & 7] for sq in board.piece_lists[side])
+    return points + RED_BONUS if side == RED else points
+
+
+def adjudicate(board, rules):
+    """Returns the game state an ended game is given under rules: "DRAW", or the winner on points"""
+    if rules.adjudication == "points":
+        winner = BLUE if material_points(board, BLUE) > material_points(board, RED) else RED
+        return COLORS[winner] + "_WON"
+    return "DRAW"
+
+
+def drawn_by(rules, repetitions, passes, bikjang_kept):
+    """Returns the name of the rule that ends the game ("repetition", "passes" or "bikjang"), or None. repetitions
+    is how often the current position has occurred, passes how many passes were just made in a row, and
+    bikjang_kept whether a bikjang was on the board both before and after the last move"""
+    if rules.repetitions is not None and repetitions >= rules.repetitions:
+        return "repetition"
+    if rules.passes is not None and passes >= rules.passes:
+        return "passes"
+    if rules.bikjang and bikjang_kept:
+        return "bikjang"
+    return None
@@ -0,0 +1,317 @@
+# Description: Alpha-beta search engine for JanggiGame positions. Negamax with iterative deepening, a transposition
+# table, captures-first/killer/history move ordering and a quiescence search over chariot and cannon captures.
+
+import time
+from collections import namedtuple
+
+from board import CHARIOT, CANNON, move_from, move_to
+from evaluation import PIECE_VALUES, evaluate
+from tables import square_to_pos
+from zobrist import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+INFINITY = 1000000
+MATE = 100000  # score for checkmate, reduced by the ply it happens at
+MATE_BOUND = MATE - 1000
+
+SearchResult = namedtuple("SearchResult", ["move", "score", "depth", "nodes", "seconds", "nps"])
+
+
+class _SearchTimeout(Exception):
+    """Raised inside the search when the wall-clock budget runs out"""
+
+
+class Searcher:
+    """Iterative deepening negamax searcher. The transposition table, killer moves and history scores are kept
+    between calls so a Searcher can be reused for consecutive moves of the same game."""
+
+    def __init__(self, table=None, tablebases=None):
+        """Creates a searcher, optionally sharing an existing TranspositionTable. tablebases, a
+        tablebase.TablebaseSet, is probed for exact scores once few enough pieces are left"""
+        self.table = table if table is not None else TranspositionTable()
+        self.tablebases = tablebases
+        self.history = [0] * (90 << 7)  # indexed by packed move
+        self.killers = []
+        self.nodes = 0
+        self._board = None
+        self._deadline = None
+
+    def search(self, board, time_ms=200, max_depth=64, info=None):
+        """Searches a CompactBoard (which is left unchanged) until time_ms milliseconds have passed (never, if
+        None) or max_depth is reached. Returns a SearchResult holding the best packed move, its score and the depth
+        of the last completed iteration. info, if given, is called with a SearchResult after every completed
+        iteration. Another thread may end the search early with stop() or move its end with set_time_left(). The
+        move is None only if the side to move has no legal move; a search stopped before depth 1 completes falls
+        back to the transposition table move or the first legal move in search order, at depth 0"""
+        self._board = board.copy()
+        self._deadline = time.perf_counter() + time_ms / 1000 if time_ms is not None else float("inf")
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(max_depth + 64)]
+        self.history = [score >> 2 for score in self.history]  # let old history fade between moves
+        self.table.new_search()
+        start = time.perf_counter()
+
+        best_move, best_score, completed_depth = None, 0, 0
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self._root(depth)
+            except _SearchTimeout:
+                break
+            if move is not None:
+                best_move, best_score, completed_depth = move, score, depth
+            elapsed = time.perf_counter() - start
+            if info is not None:
+                info(self._result(best_move, best_score, completed_depth, elapsed))
+            if move is None or abs(score) >= MATE_BOUND:
+                break
+            if time.perf_counter() + elapsed > self._deadline:  # the next iteration would not finish in time
+                break
+        if best_move is None:  # stopped before the first iteration finished
+            best_move = self._fallback_move(board)
+            if best_move is not None:
+                best_score = evaluate(board)
+        return self._result(best_move, best_score, completed_depth, time.perf_counter() - start)
+
+    def _fallback_move(self, board):
+        """Returns the transposition table move of a CompactBoard if it is legal, otherwise its first legal move in
+        search order, or None if there is no legal move. Used when a search ends before completing depth 1"""
+        entry = self.table.probe(board.hash)
+        if entry is not None and entry[3] is not None and board.is_legal(entry[3]):
+            return entry[3]
+        moves = board.legal_moves()
+        if not moves:
+            return None
+        self._board = board.copy()
+        return self._ordered(moves, None, 0)[0]
+
+    def stop(self):
+        """Makes a running search return its best move so far as soon as possible"""
+        self._deadline = float("-inf")
+
+    def set_time_left(self, time_ms):
+        """Lets a running search go on for time_ms more milliseconds (without limit if None)"""
+        self._deadline = time.perf_counter() + time_ms / 1000 if time_ms is not None else float("inf")
+
+    def search_move(self, board, move, depth, alpha=-INFINITY, time_limit=None):
+        """Searches one root move of a CompactBoard to depth with the window (alpha, INFINITY) and returns its
+        score, or None if time_limit seconds ran out first. The board is left in an undefined state, so pass a
+        copy. Used by parallel.ParallelSearcher to hand out root moves to worker processes"""
+        self._board = board
+        self._deadline = time.perf_counter() + time_limit if time_limit is not None else float("inf")
+        self.nodes = 0
+        if len(self.killers) < depth + 64:
+            self.killers = [[None, None] for _ in range(depth + 64)]
+        board.make_move(move)
+        try:
+            return -self._negamax(depth - 1, -INFINITY, -alpha, 1)
+        except _SearchTimeout:
+            return None
+
+    def _result(self, move, score, depth, seconds):
+        """Packages search statistics into a SearchResult"""
+        nps = int(self.nodes / seconds) if seconds > 0 else 0
+        return SearchResult(move, score, depth, self.nodes, seconds, nps)
+
+    def _root(self, depth):
+        """Searches every root move to depth and returns (score, move) for the best one"""
+        board = self._board
+        entry = self.table.probe(board.hash)
+        tt_move = entry[3] if entry is not None else None
+        alpha, beta = -INFINITY, INFINITY
+        best_move = None
+        for move in self._ordered(board.generate_moves(), tt_move, 0):
+            captured = board.make_move(move)
+            if board.in_check(board.side ^ 1):  # leaves our own general in check
+                board.unmake_move(move, captured)
+                continue
+            score = -self._negamax(depth - 1, -beta, -alpha, 1)
+            board.unmake_move(move, captured)
+            if score > alpha:
+                alpha, best_move = score, move
+        if best_move is None:
+            return (-MATE if board.in_check(board.side) else evaluate(board)), None
+        self.table.store(board.hash, depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, depth, alpha, beta, ply):
+        """Fail-soft alpha-beta search of the current position"""
+        self.nodes += 1
+        if not self.nodes & 1023 and time.perf_counter() > self._deadline:
+            raise _SearchTimeout
+        if depth <= 0:
+            return self._quiesce(alpha, beta, ply)
+
+        board = self._board
+        tablebases = self.tablebases
+        # The tables are solved over the moves searched here (a pass only when nothing else is legal) and without
+        # the draw rules of rules.py: a WIN is a forced mate against an opponent who doesn't pass, unless a
+        # repetition, two passes in a row or bikjang ends the game first
+        if tablebases is not None and len(board.piece_lists[0]) + len(board.piece_lists[1]) <= tablebases.max_pieces:
+            result = tablebases.probe(board)
+            if result is not None:
+                if result.result == "WIN":
+                    return MATE - ply - result.plies
+                if result.result == "LOSS":
+                    return -MATE + ply + result.plies
+                return 0
+        key = board.hash
+        entry = self.table.probe(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, value, flag, tt_move = entry
+            if entry_depth >= depth:
+                value = _score_from_table(value, ply)
+                if flag == EXACT:
+                    return value
+                if flag == LOWER_BOUND and value >= beta:
+                    return value
+                if flag == UPPER_BOUND and value <= alpha:
+                    return value
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, None
+        for move in self._ordered(board.generate_moves(), tt_move, ply):
+            captured = board.make_move(move)
+            if board.in_check(board.side ^ 1):
+                board.unmake_move(move, captured)
+                continue
+            score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move(move, captured)
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not captured:
+                            self._remember_quiet_cutoff(move, depth, ply)
+                        break
+
+        if best_move is None:  # no legal move: mated if in check, otherwise the turn would be skipped
+            return -MATE + ply if board.in_check(board.side) else evaluate(board)
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table.store(key, depth, _score_to_table(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiesce(self, alpha, beta, ply):
+        """Searches chariot and cannon captures until the position is quiet"""
+        self.nodes += 1
+        if not self.nodes & 1023 and time.perf_counter() > self._deadline:
+            raise _SearchTimeout
+        board = self._board
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        squares = board.squares
+        captures = []
+        for from_square in board.piece_lists[board.side]:
+            if squares[from_square] & 7 in (CHARIOT, CANNON):
+                base = from_square << 7
+                for to in board.piece_destinations(from_square):
+                    if squares[to]:
+                        captures.append(base | to)
+        captures.sort(key=lambda move: PIECE_VALUES[squares[move & 127] & 7] * 16
+                      - PIECE_VALUES[squares[move >> 7] & 7], reverse=True)
+
+        best_score = stand_pat
+        for move in captures:
+            captured = board.make_move(move)
+            if board.in_check(board.side ^ 1):
+                board.unmake_move(move, captured)
+                continue
+            score = -self._quiesce(-beta, -alpha, ply + 1)
+            board.unmake_move(move, captured)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_score
+
+    def _ordered(self, moves, tt_move, ply):
+        """Sorts moves: transposition table move, then captures (most valuable victim first), then killer moves,
+        then quiet checks, then the remaining quiet moves by history score"""
+        board = self._board
+        squares = board.squares
+        killers = self.killers[ply]
+        history = self.history
+
+        def order_key(move):
+            if move == tt_move:
+                return 1 << 40
+            victim = squares[move & 127]
+            if victim:
+                return (1 << 30) + PIECE_VALUES[victim & 7] * 16 - PIECE_VALUES[squares[move >> 7] & 7]
+            if move == killers[0]:
+                return 1 << 29
+            if move == killers[1]:
+                return (1 << 29) - 1
+            if board.gives_check(move):
+                return (1 << 28) + history[move]
+            return history[move]
+
+        moves.sort(key=order_key, reverse=True)
+        return moves
+
+    def _remember_quiet_cutoff(self, move, depth, ply):
+        """Updates killer moves and history scores after a quiet move caused a beta cutoff"""
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move] += depth * depth
+
+
+def _score_to_table(score, ply):
+    """Makes mate scores relative to the stored position rather than the root"""
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    """Reverses _score_to_table when a stored score is read back at a different ply"""
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def best_move(game, time_ms=200, max_depth=64, searcher=None, info=None, book=None, tablebases=None):
+    """Searches the current position of a JanggiGame for at most time_ms milliseconds. Returns a SearchResult
+    whose move is a (pos1, pos2) tuple ready for game.make_move, or None if there is nothing to play.
+    If an opening book (book.OpeningBook) is given and knows the position, its move is played without searching.
+    tablebases (tablebase.TablebaseSet) is handed to the Searcher created when none is given"""
+    if game.get_game_state() != "UNFINISHED":
+        return None
+    if book is not None:
+        move = book.choose_move(game.get_compact_board())
+        if move is not None:
+            return SearchResult((square_to_pos(move_from(move)), square_to_pos(move_to(move))), 0, 0, 0, 0.0, 0)
+    if searcher is None:
+        searcher = Searcher(tablebases=tablebases)
+    result = searcher.search(game.get_compact_board(), time_ms, max_depth, info)
+    if result.move is None:
+        return result
+    return result._replace(move=(square_to_pos(move_from(result.move)), square_to_pos(move_to(result.move))))
+
+
+if __name__ == "__main__":
+    from main import JanggiGame
+
+    def print_info(result):
+        """Prints one line of search progress"""
+        print("depth", result.depth, "score", result.score, "nodes", result.nodes, "nps", result.nps)
+
+    print(best_move(JanggiGame(), time_ms=1000, info=print_info))
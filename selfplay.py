@@ -0,0 +1,256 @@
+# Description: Self-play data generation. Worker processes play games of JanggiGame against themselves with random,
+# capture/check-weighted or engine-chosen moves and send every finished game through a bounded queue to the parent,
+# which streams them into gzip-compressed shard files. Nothing but the games in the queue is held in memory, so runs
+# of any length are fine; a full queue simply makes the workers wait for the writer.
+#
+# Usage:
+#     python selfplay.py out_dir [--games 1000] [--workers 8] [--policy random|weighted|engine]
+#                                [--max-plies 200] [--shard-games 1000] [--time-ms 20] [--depth 3] [--seed 0]
+#
+# Shard layout (inside the gzip stream): the magic, then per game a header holding the result index (into RESULTS)
+# and the body length, and a body of the notation.py varint move record followed by one notation.py position record
+# for the opening and for the position after every move.
+
+import argparse
+import gzip
+import multiprocessing
+import os
+import queue
+import random
+import struct
+import time
+from collections import namedtuple
+
+from board import encode_move, move_from, move_to
+from evaluation import PIECE_VALUES
+from main import JanggiGame
+from notation import POSITION_SIZE, encode_position, encode_moves, decode_moves
+from search import Searcher
+from tables import square_to_pos
+
+SHARD_MAGIC = b"JANGGISP"
+RESULTS = ("UNFINISHED", "BLUE_WON", "RED_WON", "DRAW")
+POLICIES = ("random", "weighted", "engine")
+_GAME_HEADER = struct.Struct("<BI")  # result index, body length
+
+SelfPlayGame = namedtuple("SelfPlayGame", ["result", "moves", "positions"])
+SelfPlayStats = namedtuple("SelfPlayStats", ["games", "positions", "seconds", "games_per_hour",
+                                             "positions_per_second", "shards"])
+
+
+def _choose_random(board, moves, chooser, _searcher, _options):
+    """Picks any legal move"""
+    return chooser.choice(moves)
+
+
+def _choose_weighted(board, moves, chooser, _searcher, _options):
+    """Picks a legal move at random, favouring captures of valuable pieces and checks"""
+    squares = board.squares
+    weights = []
+    for move in moves:
+        weight = 1 + PIECE_VALUES[squares[move_to(move)] & 7] // 100
+        if board.gives_check(move):
+            weight += 4
+        weights.append(weight)
+    return chooser.choices(moves, weights)[0]
+
+
+def _choose_engine(board, moves, chooser, searcher, options):
+    """Picks the move of a short search; falls back to a random move if the search found none"""
+    result = searcher.search(board, options["time_ms"], options["depth"])
+    return result.move if result.move is not None else chooser.choice(moves)
+
+
+_CHOOSERS = {"random": _choose_random, "weighted": _choose_weighted, "engine": _choose_engine}
+
+
+def play_game(policy="random", chooser=None, searcher=None, max_plies=200, random_plies=0, time_ms=20, depth=3):
+    """Plays one self-play game and returns a SelfPlayGame. The first random_plies moves are always random, so
+    engine games don't all repeat the same opening. A side with no legal move but not in check passes"""
+    chooser = chooser or random
+    if policy == "engine" and searcher is None:
+        searcher = Searcher()
+    choose = _CHOOSERS[policy]
+    options = {"time_ms": time_ms, "depth": depth}
+    game = JanggiGame()
+    board = game.get_compact_board()
+    moves = []
+    positions = [encode_position(board)]
+    while game.get_game_state() == "UNFINISHED" and len(moves) < max_plies:
+        legal = board.legal_moves()
+        if legal:
+            move = (_choose_random if len(moves) < random_plies else choose)(board, legal, chooser, searcher, options)
+        else:
+            general = board.generals[board.side]
+            move = encode_move(general, general)
+        if not game.make_move(square_to_pos(move_from(move)), square_to_pos(move_to(move))):
+            raise RuntimeError("make_move refused the self-play move %s%s" % (square_to_pos(move_from(move)),
+                                                                              square_to_pos(move_to(move))))
+        moves.append(move)
+        positions.append(encode_position(board))
+    return SelfPlayGame(game.get_game_state(), moves, positions)
+
+
+def encode_game(game):
+    """Returns the shard record of a SelfPlayGame"""
+    body = encode_moves(game.moves) + b"".join(game.positions)
+    return _GAME_HEADER.pack(RESULTS.index(game.result), len(body)) + body
+
+
+def read_shard(path):
+    """Yields the SelfPlayGames of a shard file one at a time"""
+    with gzip.open(path, "rb") as shard:
+        if shard.read(len(SHARD_MAGIC)) != SHARD_MAGIC:
+            raise ValueError("%s is not a self-play shard" % path)
+        while True:
+            header = shard.read(_GAME_HEADER.size)
+            if not header:
+                return
+            result, length = _GAME_HEADER.unpack(header)
+            body = shard.read(length)
+            moves = decode_moves(body)
+            start = length - (len(moves) + 1) * POSITION_SIZE
+            positions = [body[offset:offset + POSITION_SIZE] for offset in range(start, length, POSITION_SIZE)]
+            yield SelfPlayGame(RESULTS[result], moves, positions)
+
+
+def _worker(games, seed, output, options):
+    """Runs inside a worker process: plays games and puts (encoded game, positions) on output, then None"""
+    chooser = random.Random(seed)
+    searcher = Searcher() if options["policy"] == "engine" else None
+    for _ in range(games):
+        game = play_game(options["policy"], chooser, searcher, options["max_plies"], options["random_plies"],
+                         options["time_ms"], options["depth"])
+        output.put((encode_game(game), len(game.positions)))
+    output.put(None)
+
+
+class ShardWriter:
+    """Writes encoded games to out_dir/selfplay-00000.bin.gz, selfplay-00001.bin.gz, ..., starting a new shard
+    every shard_games games"""
+
+    def __init__(self, out_dir, shard_games=1000, compresslevel=6):
+        """Prepares to write into out_dir, which is created if needed"""
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.shard_games = shard_games
+        self.compresslevel = compresslevel
+        self.paths = []
+        self._shard = None
+        self._games_in_shard = 0
+
+    def write(self, record):
+        """Appends one encoded game"""
+        if self._shard is None or self._games_in_shard == self.shard_games:
+            self._next_shard()
+        self._shard.write(record)
+        self._games_in_shard += 1
+
+    def _next_shard(self):
+        """Closes the current shard and opens the next"""
+        self.close()
+        path = os.path.join(self.out_dir, "selfplay-%05d.bin.gz" % len(self.paths))
+        self._shard = gzip.open(path, "wb", compresslevel=self.compresslevel)
+        self._shard.write(SHARD_MAGIC)
+        self.paths.append(path)
+        self._games_in_shard = 0
+
+    def close(self):
+        """Closes the current shard"""
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _stats(games, positions, seconds, shards):
+    """Packages throughput figures into a SelfPlayStats"""
+    return SelfPlayStats(games, positions, seconds, games * 3600 / seconds if seconds > 0 else 0.0,
+                         positions / seconds if seconds > 0 else 0.0, shards)
+
+
+def run_selfplay(out_dir, games=1000, workers=None, policy="random", max_plies=200, shard_games=1000,
+                 queue_size=None, seed=0, random_plies=0, time_ms=20, depth=3, progress=None, progress_seconds=5.0):
+    """Plays games self-play games spread over workers processes and writes them to shards in out_dir. At most
+    queue_size finished games (four per worker by default) wait for the writer at any time. progress, if given, is
+    called with a SelfPlayStats every progress_seconds. Returns the final SelfPlayStats"""
+    if policy not in POLICIES:
+        raise ValueError("unknown policy %r" % policy)
+    workers = max(1, min(workers or os.cpu_count() or 1, games))
+    options = {"policy": policy, "max_plies": max_plies, "random_plies": random_plies, "time_ms": time_ms,
+               "depth": depth}
+    games_queue = multiprocessing.Queue(queue_size or workers * 4)
+    processes = [multiprocessing.Process(target=_worker, daemon=True,
+                                         args=(len(range(index, games, workers)), seed * 1000 + index, games_queue,
+                                               options))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    start = last_report = time.perf_counter()
+    written = positions = 0
+    running = workers
+    try:
+        with ShardWriter(out_dir, shard_games) as writer:
+            while running:
+                try:
+                    item = games_queue.get(timeout=1.0)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        raise RuntimeError("self-play workers exited before finishing their games")
+                    continue
+                if item is None:
+                    running -= 1
+                    continue
+                record, game_positions = item
+                writer.write(record)
+                written += 1
+                positions += game_positions
+                now = time.perf_counter()
+                if progress is not None and now - last_report >= progress_seconds:
+                    last_report = now
+                    progress(_stats(written, positions, now - start, len(writer.paths)))
+            shards = len(writer.paths)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    return _stats(written, positions, time.perf_counter() - start, shards)
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Generate Janggi self-play games")
+    parser.add_argument("out_dir")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--policy", choices=POLICIES, default="random")
+    parser.add_argument("--max-plies", type=int, default=200, help="games still going after this are unfinished")
+    parser.add_argument("--shard-games", type=int, default=1000, help="games per shard file")
+    parser.add_argument("--random-plies", type=int, default=0, help="random moves at the start of every game")
+    parser.add_argument("--time-ms", type=int, default=20, help="search time per move for the engine policy")
+    parser.add_argument("--depth", type=int, default=3, help="search depth limit for the engine policy")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        """Prints one line of throughput"""
+        print("%d games  %d positions  %.0f games/hour  %.0f positions/s" % (
+            stats.games, stats.positions, stats.games_per_hour, stats.positions_per_second), flush=True)
+
+    stats = run_selfplay(args.out_dir, args.games, args.workers, args.policy, args.max_plies, args.shard_games,
+                         seed=args.seed, random_plies=args.random_plies, time_ms=args.time_ms, depth=args.depth,
+                         progress=report)
+    report(stats)
+    print("%.1fs, %d shard%s in %s" % (stats.seconds, stats.shards, "" if stats.shards == 1 else "s", args.out_dir))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
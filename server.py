@@ -0,0 +1,364 @@
+# Description: asyncio game server hosting many concurrent games over a line protocol on TCP, and a load generator
+# for it. Games live as CompactBoards rather than JanggiGame objects, moves that arrive during one event-loop tick
+# are validated together, and games left idle are evicted to 46-byte position records until they are used again.
+#
+# Usage:
+#     python server.py serve [--port 8765]
+#     python server.py load [--sessions 10000] [--connections 200]
+#
+# Protocol (one request per line, one reply line per request):
+#     NEW                        OK <game id>
+#     MOVE <id> <pos1> <pos2>    OK <state>, or ILLEGAL <state> if make_move would refuse the move
+#     STATE <id>                 OK <state> <position in notation.py text notation>
+#     CLOSE <id>                 OK
+#     EVICT <seconds>            OK <games evicted>; evicts games idle for at least that long
+#     STATS                      OK followed by key=value counters
+# A malformed request or an unknown game id is answered with ERROR <reason>.
+
+import argparse
+import asyncio
+import os
+import random
+import struct
+import sys
+import time
+
+from main import JanggiGame
+from notation import encode_position, decode_position, write_text
+from replay import play_move
+from rules import DEFAULT_RULES, adjudicate, drawn_by, is_bikjang
+
+_COUNT = struct.Struct("<QH")  # position hash, times it occurred
+
+
+def memory_kb():
+    """Returns the resident memory of this process in kilobytes"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # peak rather than current outside Linux
+
+
+def _pack_counts(counts):
+    """Returns the bytes of a position hash -> occurrences dict"""
+    return b"".join(_COUNT.pack(key, count) for key, count in counts.items())
+
+
+def _unpack_counts(data):
+    """Reverses _pack_counts"""
+    return dict(_COUNT.iter_unpack(data))
+
+
+class Session:
+    """One hosted game: a live CompactBoard, or the position record it was evicted to, with the draw bookkeeping
+    of JanggiGame (occurrences of every position, packed into bytes while evicted, consecutive passes, and whether
+    the last move left bikjang standing)"""
+
+    __slots__ = ("board", "snapshot", "state", "last_active", "counts", "passes", "bikjang")
+
+    def __init__(self, board, now):
+        """Starts a session on a board"""
+        self.board = board
+        self.snapshot = None
+        self.state = "UNFINISHED"
+        self.last_active = now
+        self.counts = {board.hash: 1}
+        self.passes = 0
+        self.bikjang = False
+
+
+class GameServer:
+    """Hosts games for any number of connections. Move requests are queued and validated together once per
+    event-loop tick"""
+
+    def __init__(self, idle_timeout=60.0, sweep_interval=5.0, draw_rules=None):
+        """Creates a server that evicts games idle for idle_timeout seconds, looking every sweep_interval seconds.
+        draw_rules is the rules.DrawRules hosted games are judged by, as in JanggiGame"""
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.draw_rules = draw_rules or DEFAULT_RULES
+        self._opening = JanggiGame().get_compact_board().copy()
+        self._sessions = {}
+        self._next_id = 1
+        self._pending = []  # (session, pos1, pos2, future) waiting for the end of the tick
+        self._flush_scheduled = False
+        self.moves = 0
+        self.batches = 0
+        self.evictions = 0
+        self.restores = 0
+
+    def new_game(self):
+        """Creates a game at the opening position and returns its id"""
+        game_id = self._next_id
+        self._next_id += 1
+        self._sessions[game_id] = Session(self._opening.copy(), time.monotonic())
+        return game_id
+
+    def close_game(self, game_id):
+        """Forgets a game. Raises KeyError for an unknown id"""
+        del self._sessions[game_id]
+
+    def _session(self, game_id):
+        """Returns the live session for a game id, restoring it from its snapshot if it was evicted"""
+        session = self._sessions[game_id]
+        if session.board is None:
+            self._restore(session)
+        session.last_active = time.monotonic()
+        return session
+
+    def _restore(self, session):
+        """Turns an evicted session's position record back into a CompactBoard"""
+        session.board = decode_position(session.snapshot)
+        session.counts = _unpack_counts(session.counts)
+        session.snapshot = None
+        self.restores += 1
+
+    def submit_move(self, game_id, pos1, pos2):
+        """Queues a move and returns a future for (accepted, state after the move). Raises KeyError for an
+        unknown id"""
+        session = self._session(game_id)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((session, pos1, pos2, future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        return future
+
+    def _flush(self):
+        """Validates and plays every move queued during this tick"""
+        pending, self._pending = self._pending, []
+        self._flush_scheduled = False
+        self.batches += 1
+        for session, pos1, pos2, future in pending:
+            if session.board is None:  # evicted between submit and flush
+                self._restore(session)
+            board = session.board
+            state = play_move(board, pos1, pos2) if session.state == "UNFINISHED" else None
+            if state is not None:
+                session.passes = session.passes + 1 if pos1 == pos2 else 0  # the same bookkeeping as Replayer
+                bikjang_kept, session.bikjang = session.bikjang, is_bikjang(board)
+                count = session.counts[board.hash] = session.counts.get(board.hash, 0) + 1
+                if state == "UNFINISHED" and \
+                        drawn_by(self.draw_rules, count, session.passes, session.bikjang and bikjang_kept):
+                    state = adjudicate(board, self.draw_rules)
+                session.state = state
+                self.moves += 1
+            if not future.cancelled():
+                future.set_result((state is not None, session.state))
+
+    def game_text(self, game_id):
+        """Returns the state and text notation of a game"""
+        session = self._session(game_id)
+        return session.state + " " + write_text(session.board)
+
+    def evict_idle(self, idle_for=None):
+        """Replaces the board of every game idle for at least idle_for seconds (idle_timeout by default) with a
+        position record. Returns the number of games evicted"""
+        if idle_for is None:
+            idle_for = self.idle_timeout
+        cutoff = time.monotonic() - idle_for
+        evicted = 0
+        for session in self._sessions.values():
+            if session.board is not None and session.last_active <= cutoff:
+                session.snapshot = encode_position(session.board)
+                session.counts = _pack_counts(session.counts)
+                session.board = None
+                evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def get_stats(self):
+        """Returns session and traffic counters"""
+        live = sum(1 for session in self._sessions.values() if session.board is not None)
+        snapshot_bytes = sum(sys.getsizeof(session.snapshot) + sys.getsizeof(session.counts)
+                             for session in self._sessions.values() if session.snapshot is not None)
+        return {"sessions": len(self._sessions), "live": live, "snapshots": len(self._sessions) - live,
+                "snapshot_bytes": snapshot_bytes,
+                "moves": self.moves, "batches": self.batches, "evictions": self.evictions,
+                "restores": self.restores, "memory_kb": memory_kb()}
+
+    def handle_line(self, line):
+        """Answers one request that doesn't have to wait for the tick to end. Returns the reply, or a future for
+        a MOVE request"""
+        fields = line.split()
+        if not fields:
+            return "ERROR empty request"
+        command = fields[0].upper()
+        try:
+            if command == "NEW" and len(fields) == 1:
+                return "OK %d" % self.new_game()
+            if command == "MOVE" and len(fields) == 4:
+                return self.submit_move(int(fields[1]), fields[2], fields[3])
+            if command == "STATE" and len(fields) == 2:
+                return "OK " + self.game_text(int(fields[1]))
+            if command == "CLOSE" and len(fields) == 2:
+                self.close_game(int(fields[1]))
+                return "OK"
+            if command == "EVICT" and len(fields) == 2:
+                return "OK %d" % self.evict_idle(float(fields[1]))
+            if command == "STATS" and len(fields) == 1:
+                return "OK " + " ".join("%s=%d" % item for item in self.get_stats().items())
+        except KeyError:
+            return "ERROR unknown game"
+        except ValueError:
+            return "ERROR bad argument"
+        return "ERROR unknown request"
+
+    async def handle_connection(self, reader, writer):
+        """Serves one client connection until it closes"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = self.handle_line(line.decode(errors="replace"))
+                if not isinstance(reply, str):
+                    accepted, state = await reply
+                    reply = ("OK " if accepted else "ILLEGAL ") + state
+                writer.write(reply.encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _sweep(self):
+        """Evicts idle games every sweep_interval seconds"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.evict_idle()
+
+    async def serve(self, host="127.0.0.1", port=8765, ready=None):
+        """Accepts connections forever. ready, if given, is called with the (host, port) actually bound"""
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=1 << 16)
+        sweeper = asyncio.create_task(self._sweep())
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[:2])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+
+
+def _percentile(sorted_values, fraction):
+    """Returns the value below which fraction of a sorted list falls"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def _request(reader, writer, line):
+    """Sends one request line and returns the reply"""
+    writer.write(line.encode() + b"\n")
+    await writer.drain()
+    return (await reader.readline()).decode().strip()
+
+
+async def _stats(host, port):
+    """Fetches the STATS counters of a running server"""
+    reader, writer = await asyncio.open_connection(host, port)
+    reply = await _request(reader, writer, "STATS")
+    writer.close()
+    return {key: int(value) for key, value in (item.split("=") for item in reply.split()[1:])}
+
+
+async def run_load(host, port, sessions=10000, connections=200, moves_per_game=40, games=None, seed=0):
+    """Opens sessions games spread over connections client connections and plays moves_per_game moves in each,
+    taken from recorded games. Returns a dict with move latencies (milliseconds), throughput and server memory"""
+    if games is None:
+        from perft import sample_games
+        games = sample_games(50, moves_per_game, seed)
+    before = await _stats(host, port)
+    latencies = []
+
+    async def client(count, chooser):
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 16)
+        owned = []
+        for _ in range(count):
+            game_id = (await _request(reader, writer, "NEW")).split()[1]
+            owned.append((game_id, chooser.choice(games)))
+        for ply in range(moves_per_game):
+            for game_id, moves in owned:
+                if ply < len(moves):
+                    start = time.perf_counter()
+                    await _request(reader, writer, "MOVE %s %s %s" % (game_id, moves[ply][0], moves[ply][1]))
+                    latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    share, extra = divmod(sessions, connections)
+    chooser = random.Random(seed)
+    await asyncio.gather(*(client(share + (index < extra), random.Random(chooser.random()))
+                           for index in range(connections)))
+    seconds = time.perf_counter() - start
+    loaded = await _stats(host, port)
+
+    reader, writer = await asyncio.open_connection(host, port)
+    await _request(reader, writer, "EVICT 0")
+    writer.close()
+    evicted = await _stats(host, port)
+
+    latencies.sort()
+    opened = max(1, loaded["sessions"] - before["sessions"])
+    return {"sessions": opened, "moves": len(latencies), "seconds": seconds,
+            "moves_per_second": len(latencies) / seconds if seconds else 0.0,
+            "p50_ms": _percentile(latencies, 0.5) * 1000, "p99_ms": _percentile(latencies, 0.99) * 1000,
+            "bytes_per_live_game": (loaded["memory_kb"] - before["memory_kb"]) * 1024 / opened,
+            "bytes_per_evicted_game": (evicted["snapshot_bytes"] - before["snapshot_bytes"]) / opened,
+            "batches": loaded["batches"] - before["batches"]}
+
+
+async def _load_against_child(args):
+    """Starts a server in a child process, runs the load generator against it and stops the server"""
+    child = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), "serve", "--port", "0",
+                                                 stdout=asyncio.subprocess.PIPE)
+    try:
+        host, port = (await child.stdout.readline()).decode().split()[-1].rsplit(":", 1)
+        return await run_load(host, int(port), args.sessions, args.connections, args.moves)
+    finally:
+        child.terminate()
+        await child.wait()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Janggi game server and load generator")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the game server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--idle-timeout", type=float, default=60.0, help="seconds before an idle game is evicted")
+    load_parser = commands.add_parser("load", help="measure move latency and memory per game")
+    load_parser.add_argument("--host", help="server to load (default: start one in a child process)")
+    load_parser.add_argument("--port", type=int, default=8765)
+    load_parser.add_argument("--sessions", type=int, default=10000)
+    load_parser.add_argument("--connections", type=int, default=200)
+    load_parser.add_argument("--moves", type=int, default=40, help="moves played in every game")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        def ready(address):
+            print("listening on %s:%d" % address, flush=True)
+        try:
+            asyncio.run(GameServer(args.idle_timeout).serve(args.host, args.port, ready))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.host is None:
+        report = asyncio.run(_load_against_child(args))
+    else:
+        report = asyncio.run(run_load(args.host, args.port, args.sessions, args.connections, args.moves))
+    print("%d sessions, %d moves in %.1fs (%.0f moves/s, %d server batches)"
+          % (report["sessions"], report["moves"], report["seconds"], report["moves_per_second"], report["batches"]))
+    print("move latency p50 %.2f ms, p99 %.2f ms" % (report["p50_ms"], report["p99_ms"]))
+    print("server memory per game: %.0f bytes live, %.0f byte snapshot after eviction"
+          % (report["bytes_per_live_game"], report["bytes_per_evicted_game"]))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
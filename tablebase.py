@@ -0,0 +1,476 @@
+# Description: Endgame tablebases built by retrograde analysis. A table covers one material set, e.g. KR-KA (blue
+# general and chariot against red general and guard), and holds for every position the result for the side to move
+# and the distance to mate in plies. Positions are numbered by a perfect index: every piece contributes its square
+# within the squares it can ever stand on (its own palace for generals and guards, the squares outside both
+# palaces for soldiers, the whole board otherwise), times two for the side to move. Tables are probed through mmap,
+# so nothing is read into memory until a position is looked up.
+#
+# Usage:
+#     python tablebase.py build KR-KA [--dir tablebases] [--workers 8]    builds a table and every table its captures
+#                                                                         lead to
+#     python tablebase.py probe "4k4/9/9/9/9/9/9/4R4/4K4/9 r" [--dir tablebases]
+#
+# Material is written blue side first, with K general, A guard, B elephant, N horse, R chariot, C cannon, P soldier.
+# The tables score checkmate only: repetitions, passes in a row and bikjang depend on how a position was reached,
+# so a position a draw rule would end is scored as if play went on. The move graph holds the moves search.Searcher
+# plays: a side passes only when it has no other legal move. A win therefore never rests on a pass the engine won't
+# make, but it assumes the losing side doesn't pass either, which a real opponent may do to get out of zugzwang.
+#
+# File layout: magic, material name (ASCII, zero padded), number of entries (u64), then one little-endian i16 per
+# index: 0 draw, d > 0 side to move mates in d plies, -(d + 1) side to move is mated in d plies, INVALID for indices
+# that are not a reachable position (two pieces on one square, identical pieces out of order, side not to move in
+# check).
+
+import argparse
+import os
+import struct
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from board import CompactBoard, BLUE, RED, GENERAL, GUARD, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER, piece_code
+from notation import BinaryStore, parse_text
+from tables import NUM_SQUARES, BOARD_WIDTH, PALACE
+from zobrist import SIDE_KEY
+
+TABLEBASE_MAGIC = b"JANGGIT2"  # JANGGITB tables counted a pass as a move everywhere and have to be rebuilt
+_HEADER = struct.Struct("<8s24sQ")
+_VALUE = struct.Struct("<h")
+DRAW = 0
+INVALID = -32768
+MAX_DISTANCE = 32766
+
+MATERIAL_LETTERS = {GENERAL: "K", GUARD: "A", ELEPHANT: "B", HORSE: "N", CHARIOT: "R", CANNON: "C", SOLDIER: "P"}
+LETTER_TYPES = {letter: piece_type for piece_type, letter in MATERIAL_LETTERS.items()}
+
+TablebaseResult = namedtuple("TablebaseResult", ["result", "plies"])  # result is "WIN", "LOSS" or "DRAW"
+
+
+def decode_value(value):
+    """Turns a stored table value into a TablebaseResult for the side to move, or None for INVALID"""
+    if value == INVALID:
+        return None
+    if value > 0:
+        return TablebaseResult("WIN", value)
+    if value < 0:
+        return TablebaseResult("LOSS", -value - 1)
+    return TablebaseResult("DRAW", 0)
+
+
+def _domain(side, piece_type):
+    """Returns the squares a piece can ever stand on, in ascending order"""
+    if piece_type in (GENERAL, GUARD):  # blue's palace is rows 8-10, red's rows 1-3
+        return tuple(sorted(sq for sq in PALACE if (sq >= 5 * BOARD_WIDTH) == (side == BLUE)))
+    if piece_type == SOLDIER:  # soldiers never step into a palace
+        return tuple(sq for sq in range(NUM_SQUARES) if sq not in PALACE)
+    return tuple(range(NUM_SQUARES))
+
+
+def material_name(board):
+    """Returns the material name ("KR-KA") of a CompactBoard, or None if a side has no general"""
+    squares = board.squares
+    names = []
+    for side in (BLUE, RED):
+        types = sorted(squares[sq] & 7 for sq in board.piece_lists[side])
+        if not types or types[0] != GENERAL:
+            return None
+        names.append("".join(MATERIAL_LETTERS[piece_type] for piece_type in types))
+    return "-".join(names)
+
+
+class Material:
+    """The perfect index of one material set"""
+
+    def __init__(self, name):
+        """Parses a material name such as "KR-KA". Raises ValueError for a malformed one"""
+        sides = name.upper().split("-")
+        if len(sides) != 2 or any(letter not in LETTER_TYPES for letters in sides for letter in letters):
+            raise ValueError("material must look like KR-KA, not %r" % name)
+        slots = []
+        for side, letters in zip((BLUE, RED), sides):
+            types = sorted(LETTER_TYPES[letter] for letter in letters)
+            if types.count(GENERAL) != 1:
+                raise ValueError("each side needs exactly one general: %r" % name)
+            slots.extend(piece_code(side, piece_type) for piece_type in types)
+        self.codes = tuple(slots)  # piece code of every slot, blue's first, in type order
+        self.name = "-".join("".join(MATERIAL_LETTERS[code & 7] for code in self.codes if code >> 3 == side)
+                             for side in (BLUE, RED))
+        self.domains = tuple(_domain(code >> 3, code & 7) for code in self.codes)
+        self.positions = []  # per slot: square -> place in its domain, -1 off the domain
+        for domain in self.domains:
+            places = [-1] * NUM_SQUARES
+            for place, sq in enumerate(domain):
+                places[sq] = place
+            self.positions.append(places)
+        self.size = 2
+        for domain in self.domains:
+            self.size *= len(domain)
+        # runs of identical slots; their squares are kept in ascending order so each position has one index
+        self._twins = [i for i in range(1, len(self.codes)) if self.codes[i] == self.codes[i - 1]]
+
+    def index(self, squares, side):
+        """Returns the index of the position with each slot's piece on squares[slot], or -1 if a piece is off its
+        domain. Identical pieces may be given in any order"""
+        if self._twins:
+            squares = self._canonical(squares)
+        index = 0
+        for places, domain, sq in zip(self.positions, self.domains, squares):
+            place = places[sq]
+            if place < 0:
+                return -1
+            index = index * len(domain) + place
+        return index * 2 + side
+
+    def _canonical(self, squares):
+        """Sorts the squares of identical pieces"""
+        squares = list(squares)
+        codes = self.codes
+        start = 0
+        while start < len(codes):
+            end = start + 1
+            while end < len(codes) and codes[end] == codes[start]:
+                end += 1
+            if end - start > 1:
+                squares[start:end] = sorted(squares[start:end])
+            start = end
+        return squares
+
+    def squares(self, index):
+        """Returns (slot squares, side to move) for an index"""
+        side = index & 1
+        index >>= 1
+        squares = [0] * len(self.domains)
+        for slot in range(len(self.domains) - 1, -1, -1):
+            domain = self.domains[slot]
+            index, place = divmod(index, len(domain))
+            squares[slot] = domain[place]
+        return squares, side
+
+    def is_canonical(self, squares):
+        """Returns whether no two pieces share a square and identical pieces are in ascending square order"""
+        if len(set(squares)) != len(squares):
+            return False
+        return all(squares[i - 1] < squares[i] for i in self._twins)
+
+    def without(self, slot):
+        """Returns the Material left after the piece in slot is captured"""
+        codes = self.codes[:slot] + self.codes[slot + 1:]
+        return Material("-".join("".join(MATERIAL_LETTERS[code & 7] for code in codes if code >> 3 == side)
+                                 for side in (BLUE, RED)))
+
+    def board(self, squares, side):
+        """Builds the CompactBoard of a position"""
+        board = CompactBoard()
+        for code, sq in zip(self.codes, squares):
+            board.put_piece(sq, code)
+        if side == RED:
+            board.side = RED
+            board.hash ^= SIDE_KEY
+        board.rebuild_attacks()
+        return board
+
+
+class Tablebase(BinaryStore):
+    """Read-only view of a table file. Use Tablebase.open(path) to map a file"""
+
+    def __init__(self, buffer):
+        """Wraps a table held in any bytes-like object or mmap"""
+        BinaryStore.__init__(self, buffer, TABLEBASE_MAGIC)
+        _, name, self._count = _HEADER.unpack_from(self._view)
+        self.material = Material(name.rstrip(b"\0").decode("ascii"))
+
+    def __len__(self):
+        """Returns the number of entries"""
+        return self._count
+
+    def value(self, index):
+        """Returns the raw stored value at index"""
+        return _VALUE.unpack_from(self._view, _HEADER.size + index * 2)[0]
+
+    def probe(self, board):
+        """Returns the TablebaseResult of a CompactBoard holding this table's material, or None"""
+        material = self.material
+        pieces = sorted((board.squares[sq], sq) for side in (BLUE, RED) for sq in board.piece_lists[side])
+        by_code = sorted(range(len(material.codes)), key=lambda slot: material.codes[slot])
+        if len(pieces) != len(by_code):
+            return None
+        squares = [0] * len(by_code)
+        for slot, (code, sq) in zip(by_code, pieces):
+            if material.codes[slot] != code:
+                return None
+            squares[slot] = sq
+        index = material.index(squares, board.side)
+        return decode_value(self.value(index)) if index >= 0 else None
+
+
+class TablebaseSet:
+    """Every table file in a directory, mapped when first needed"""
+
+    def __init__(self, directory):
+        """Looks for KR-KA.jtb style files in directory"""
+        self.directory = directory
+        self._tables = {}
+        self._paths = {}
+        if os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                if file_name.endswith(".jtb"):
+                    self._paths[file_name[:-4]] = os.path.join(directory, file_name)
+        # most pieces in any table, so callers can skip probing bigger positions without building a name
+        self.max_pieces = max((len(name) - 1 for name in self._paths), default=0)
+
+    def __contains__(self, name):
+        return name in self._paths
+
+    def table(self, name):
+        """Returns the Tablebase for a material name, or None if there is no such file"""
+        table = self._tables.get(name)
+        if table is None and name in self._paths:
+            table = self._tables[name] = Tablebase.open(self._paths[name])
+        return table
+
+    def probe(self, board):
+        """Returns the TablebaseResult of a CompactBoard, or None if no table covers its material"""
+        if len(board.piece_lists[0]) + len(board.piece_lists[1]) > self.max_pieces:
+            return None
+        name = material_name(board)
+        table = self.table(name) if name is not None else None
+        return table.probe(board) if table is not None else None
+
+    def close(self):
+        """Unmaps every open table"""
+        for table in self._tables.values():
+            table.close()
+        self._tables.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _analyse_range(name, directory, start, stop):
+    """Runs inside a worker: generates the moves of every position in [start, stop). Returns, as bytes, the flags
+    of every index (0 invalid, 1 a position, 2 checkmated), per position the number of moves staying inside the
+    table and their target indices, and per position the number of captures and the stored values of the
+    positions they lead to (from the subtables, for the side to move next)"""
+    material = Material(name)
+    subtables = {}
+    tablebases = TablebaseSet(directory)
+    flags = bytearray(stop - start)
+    counts = array("H")
+    successors = array("I")
+    capture_counts = array("H")
+    capture_values = array("h")
+    try:
+        for offset, index in enumerate(range(start, stop)):
+            counts.append(0)
+            capture_counts.append(0)
+            squares, side = material.squares(index)
+            if not material.is_canonical(squares):
+                continue
+            board = material.board(squares, side)
+            if board.in_check(side ^ 1):
+                continue
+            moves = board.legal_moves()
+            in_check = board.in_check(side)
+            if not moves and in_check:
+                flags[offset] = 2
+                continue
+            flags[offset] = 1
+            first, first_capture = len(successors), len(capture_values)
+            if not moves:  # not in check, so nothing to play but a pass
+                successors.append(index ^ 1)
+            for move in moves:
+                from_square, to_square = move >> 7, move & 127
+                after = list(squares)
+                after[squares.index(from_square)] = to_square
+                if not board.squares[to_square]:
+                    successors.append(material.index(after, side ^ 1))
+                    continue
+                captured = squares.index(to_square)
+                del after[captured]
+                subtable = subtables.get(captured)
+                if subtable is None:
+                    sub_name = material.without(captured).name
+                    subtable = subtables[captured] = tablebases.table(sub_name)
+                    if subtable is None:
+                        raise FileNotFoundError("table %s is needed first" % sub_name)
+                capture_values.append(subtable.value(subtable.material.index(after, side ^ 1)))
+            counts[-1] = len(successors) - first
+            capture_counts[-1] = len(capture_values) - first_capture
+        return bytes(flags), counts.tobytes(), successors.tobytes(), capture_counts.tobytes(), capture_values.tobytes()
+    finally:
+        subtables.clear()
+        tablebases.close()
+
+
+def _solve(size, flags, counts, successors, capture_counts, capture_values):
+    """Retrograde analysis of the move graph, in order of increasing distance to mate. A position is won as soon
+    as one move reaches a lost position, and lost once every move reaches a won one; whatever is left is drawn.
+    Returns the array of stored values"""
+    win, loss, refuted = 0, 1, 2  # event kinds: resolve as won, resolve as lost, one more move found to lose
+    values = array("h", [INVALID]) * size
+    remaining = array("i", [0]) * size  # moves of each position not yet known to lead to a won position
+    done = bytearray(size)
+    buckets = [[]]  # distance -> events
+
+    def schedule(distance, index, kind):
+        while len(buckets) <= distance:
+            buckets.append([])
+        buckets[distance].append((index, kind))
+
+    # predecessor lists, flattened: predecessors[starts[i]:starts[i + 1]] are the positions with a move to i
+    starts = array("i", [0]) * (size + 1)
+    for target in successors:
+        starts[target + 1] += 1
+    for index in range(size):
+        starts[index + 1] += starts[index]
+    fill = array("i", starts)
+    predecessors = array("I", [0]) * len(successors)
+    edge = capture = 0
+    for index in range(size):
+        count, capture_count = counts[index], capture_counts[index]
+        if flags[index]:
+            values[index] = DRAW
+            remaining[index] = count + capture_count
+        if flags[index] == 2:
+            schedule(0, index, loss)
+        for target in successors[edge:edge + count]:
+            predecessors[fill[target]] = index
+            fill[target] += 1
+        for value in capture_values[capture:capture + capture_count]:  # captures reach positions already solved
+            if value < 0:
+                schedule(-value, index, win)  # the opponent is mated in -value - 1 plies
+            elif value > 0:
+                schedule(value, index, refuted)
+        edge += count
+        capture += capture_count
+    del fill
+
+    distance = 0
+    while distance < len(buckets):
+        if distance > MAX_DISTANCE:
+            raise OverflowError("distance to mate does not fit the table format")
+        for index, kind in buckets[distance]:
+            if done[index]:
+                continue
+            if kind == refuted:
+                remaining[index] -= 1
+                if not remaining[index]:
+                    schedule(distance + 1, index, loss)
+                continue
+            done[index] = 1
+            values[index] = distance if kind == win else -distance - 1
+            for predecessor in predecessors[starts[index]:starts[index + 1]]:
+                if done[predecessor]:
+                    continue
+                if kind == loss:
+                    schedule(distance + 1, predecessor, win)
+                else:
+                    remaining[predecessor] -= 1
+                    if not remaining[predecessor]:
+                        schedule(distance + 1, predecessor, loss)
+        buckets[distance] = None
+        distance += 1
+    return values
+
+
+def table_path(directory, name):
+    """Returns the file name of a material's table"""
+    return os.path.join(directory, Material(name).name + ".jtb")
+
+
+def _is_current(path):
+    """Returns whether a table file exists and is in the current format"""
+    try:
+        with open(path, "rb") as table_file:
+            return table_file.read(len(TABLEBASE_MAGIC)) == TABLEBASE_MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def build_table(name, directory="tablebases", workers=None, chunk_size=16384, progress=None):
+    """Builds the table of a material set into directory, after the tables of every material its captures lead
+    to (existing files in the current format are reused). The moves of the positions are generated in a pool of
+    workers processes. progress, if given, is called with (material name, entries, seconds) after each table.
+    Returns the path"""
+    material = Material(name)
+    path = table_path(directory, material.name)
+    if _is_current(path):
+        return path
+    for slot, code in enumerate(material.codes):
+        if code & 7 != GENERAL:
+            build_table(material.without(slot).name, directory, workers, chunk_size, progress)
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+
+    ranges = [(low, min(low + chunk_size, material.size)) for low in range(0, material.size, chunk_size)]
+    flags = bytearray()
+    counts, successors, capture_counts, capture_values = array("H"), array("I"), array("H"), array("h")
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(ranges) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_analyse_range, *zip(*((material.name, directory, low, high)
+                                                          for low, high in ranges))))
+    else:
+        parts = [_analyse_range(material.name, directory, low, high) for low, high in ranges]
+    for part_flags, part_counts, part_successors, part_capture_counts, part_capture_values in parts:
+        flags += part_flags
+        counts.frombytes(part_counts)
+        successors.frombytes(part_successors)
+        capture_counts.frombytes(part_capture_counts)
+        capture_values.frombytes(part_capture_values)
+    del parts
+
+    values = _solve(material.size, flags, counts, successors, capture_counts, capture_values)
+    if values.itemsize != 2:
+        raise RuntimeError("array('h') is not 16 bits on this platform")
+    if struct.pack("=h", 1) != struct.pack("<h", 1):
+        values.byteswap()
+    with open(path + ".tmp", "wb") as table_file:  # renamed when complete, so a partial file is never probed
+        table_file.write(_HEADER.pack(TABLEBASE_MAGIC, material.name.encode("ascii"), material.size))
+        values.tofile(table_file)
+    os.replace(path + ".tmp", path)
+    if progress is not None:
+        progress(material.name, material.size, time.perf_counter() - start)
+    return path
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Janggi endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build the table of a material set, e.g. KR-KA")
+    build_parser.add_argument("material")
+    build_parser.add_argument("--dir", default="tablebases")
+    build_parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    probe_parser = commands.add_parser("probe", help="look up a position given in notation.py text notation")
+    probe_parser.add_argument("position")
+    probe_parser.add_argument("--dir", default="tablebases")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        def report(name, entries, seconds):
+            """Prints one line per finished table"""
+            print("%-10s %10d entries  %.1fs" % (name, entries, seconds), flush=True)
+
+        build_table(args.material, args.dir, args.workers, progress=report)
+        return 0
+
+    board = parse_text(args.position)
+    with TablebaseSet(args.dir) as tablebases:
+        result = tablebases.probe(board)
+    if result is None:
+        print("no table for", material_name(board) or "this position")
+        return 1
+    if result.result == "DRAW":
+        print("draw")
+    else:
+        print("side to move %s, mate in %d plies" % ("wins" if result.result == "WIN" else "loses", result.plies))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
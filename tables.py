@@ -0,0 +1,166 @@
+# Description: Move tables for the Janggi board, built once at import time. Squares are numbered row by row
+# (square = y * 9 + x) so they line up with the _board[y][x] layout used by JanggiGame.
+
+BOARD_WIDTH = 9
+BOARD_HEIGHT = 10
+NUM_SQUARES = BOARD_WIDTH * BOARD_HEIGHT
+COLUMNS = "abcdefghi"
+
+EMPTY = 0  # piece types; board.py combines them with the side into the codes stored on the board
+GENERAL = 1
+GUARD = 2
+ELEPHANT = 3
+HORSE = 4
+CHARIOT = 5
+CANNON = 6
+SOLDIER = 7
+
+NO_LEG = -1  # marks a horse jump that check_horse_move never treats as blocked
+
+
+def square(x, y):
+    """Returns the square number for an (x, y) coordinate"""
+    return y * BOARD_WIDTH + x
+
+
+def pos_to_square(pos):
+    """Converts a position such as 'e9' to its square number"""
+    return (int(pos[1:]) - 1) * BOARD_WIDTH + COLUMNS.index(pos[0])
+
+
+def square_to_pos(sq):
+    """Converts a square number back to a position such as 'e9'"""
+    y, x = divmod(sq, BOARD_WIDTH)
+    return COLUMNS[x] + str(y + 1)
+
+
+def _on_board(x, y):
+    """Returns whether an (x, y) coordinate lies on the board"""
+    return 0 <= x < BOARD_WIDTH and 0 <= y < BOARD_HEIGHT
+
+
+PALACE = frozenset(square(x, y) for x in range(3, 6) for y in (0, 1, 2, 7, 8, 9))
+
+# up, down, left, right
+DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+
+def _build_rays():
+    """For every square, lists the squares met walking outwards in each orthogonal direction"""
+    rays = []
+    for sq in range(NUM_SQUARES):
+        y, x = divmod(sq, BOARD_WIDTH)
+        square_rays = []
+        for step_x, step_y in DIRECTIONS:
+            ray = []
+            ray_x, ray_y = x + step_x, y + step_y
+            while _on_board(ray_x, ray_y):
+                ray.append(square(ray_x, ray_y))
+                ray_x, ray_y = ray_x + step_x, ray_y + step_y
+            square_rays.append(tuple(ray))
+        rays.append(tuple(square_rays))
+    return tuple(rays)
+
+
+def _build_palace_steps():
+    """One step in any direction, starting and ending inside a palace. Used by the general and the guards"""
+    steps = []
+    for sq in range(NUM_SQUARES):
+        y, x = divmod(sq, BOARD_WIDTH)
+        targets = []
+        if sq in PALACE:
+            for step_y in (-1, 0, 1):
+                for step_x in (-1, 0, 1):
+                    if (step_x or step_y) and _on_board(x + step_x, y + step_y) \
+                            and square(x + step_x, y + step_y) in PALACE:
+                        targets.append(square(x + step_x, y + step_y))
+        steps.append(tuple(targets))
+    return tuple(steps)
+
+
+def _build_soldier_moves():
+    """Soldier targets as accepted by check_soldier_move: one orthogonal step outside the palace, any step
+    inside it, and any orthogonal distance when leaving it. Soldiers never step into a palace"""
+    moves = []
+    for sq in range(NUM_SQUARES):
+        y, x = divmod(sq, BOARD_WIDTH)
+        targets = []
+        if sq in PALACE:
+            targets.extend(PALACE_STEPS[sq])
+            for ray in RAYS[sq]:
+                targets.extend(to for to in ray if to not in PALACE)
+        else:
+            for step_x, step_y in DIRECTIONS:
+                if _on_board(x + step_x, y + step_y) and square(x + step_x, y + step_y) not in PALACE:
+                    targets.append(square(x + step_x, y + step_y))
+        moves.append(tuple(targets))
+    return tuple(moves)
+
+
+def _horse_leg(x, y, diff_x, diff_y):
+    """Returns the square check_horse_move inspects for a jump, or NO_LEG if that jump is never blocked"""
+    if diff_y == -2:
+        return square(x, y - 1)
+    if diff_x == 2 and diff_y == -1 and x + 1 <= y - 1:
+        return square(x + 1, y)
+    if diff_x == 2 and diff_y == 1 and x + 1 >= y + 1:
+        return square(x + 1, y)
+    if diff_x == -2 and diff_y == 1 and x - 1 >= y + 1:
+        return square(x - 1, y)
+    return NO_LEG
+
+
+def _build_horse_moves():
+    """Horse jumps as (target, leg) pairs"""
+    moves = []
+    for sq in range(NUM_SQUARES):
+        y, x = divmod(sq, BOARD_WIDTH)
+        jumps = []
+        for diff_x, diff_y in ((1, 2), (2, 1), (1, -2), (2, -1), (-1, 2), (-2, 1), (-1, -2), (-2, -1)):
+            if _on_board(x + diff_x, y + diff_y):
+                jumps.append((square(x + diff_x, y + diff_y), _horse_leg(x, y, diff_x, diff_y)))
+        moves.append(tuple(jumps))
+    return tuple(moves)
+
+
+def _build_elephant_moves():
+    """Elephant jumps as (target, first leg, second leg) triples"""
+    moves = []
+    for sq in range(NUM_SQUARES):
+        y, x = divmod(sq, BOARD_WIDTH)
+        jumps = []
+        for diff_x, diff_y in ((3, 2), (3, -2), (-2, 3), (-2, -3), (-3, -2), (-3, 2), (2, -3), (2, 3)):
+            if not _on_board(x + diff_x, y + diff_y):
+                continue
+            step_x = (diff_x > 0) - (diff_x < 0)
+            step_y = (diff_y > 0) - (diff_y < 0)
+            if abs(diff_x) == 3:  # first leg is the orthogonal step along the long side
+                first_leg = square(x + step_x, y)
+            else:
+                first_leg = square(x, y + step_y)
+            second_leg = square(x + diff_x - step_x, y + diff_y - step_y)
+            jumps.append((square(x + diff_x, y + diff_y), first_leg, second_leg))
+        moves.append(tuple(jumps))
+    return tuple(moves)
+
+
+def _build_cannon_palace_jumps():
+    """Diagonal cannon jumps from a palace corner to the opposite corner, as (screen, target) pairs"""
+    jumps = []
+    for sq in range(NUM_SQUARES):
+        y, x = divmod(sq, BOARD_WIDTH)
+        corner_jumps = []
+        if sq in PALACE:
+            for diff_x, diff_y in ((2, 2), (-2, -2), (2, -2), (-2, 2)):
+                if _on_board(x + diff_x, y + diff_y) and square(x + diff_x, y + diff_y) in PALACE:
+                    corner_jumps.append((square(x + diff_x // 2, y + diff_y // 2), square(x + diff_x, y + diff_y)))
+        jumps.append(tuple(corner_jumps))
+    return tuple(jumps)
+
+
+RAYS = _build_rays()
+PALACE_STEPS = _build_palace_steps()
+SOLDIER_MOVES = _build_soldier_moves()
+HORSE_MOVES = _build_horse_moves()
+ELEPHANT_MOVES = _build_elephant_moves()
+CANNON_PALACE_JUMPS = _build_cannon_palace_jumps()
@@ -0,0 +1,158 @@
+# Description: Invariant tests over seeded random games: the move generator agrees with JanggiGame.make_move, the
+# incrementally kept hash, scores and attack maps agree with a board rebuilt from scratch, batch legality agrees with
+# is_legal_move, and undo/redo and the draw rules keep the game's bookkeeping straight.
+#
+# Usage:
+#     python -m pytest -q test_invariants.py
+
+import random
+
+import pytest
+
+from board import CompactBoard
+from main import JanggiGame
+from notation import write_text
+from rules import DrawRules
+from tables import NUM_SQUARES, square_to_pos
+
+SEEDS = (1, 2, 3, 4)
+NO_DRAWS = DrawRules(None, None, False, "draw")
+
+
+def random_game(seed, plies=60, draw_rules=None):
+    """Yields a JanggiGame after each move of a seeded random game, passing now and then when allowed"""
+    chooser = random.Random(seed)
+    game = JanggiGame(draw_rules)
+    while len(game.get_history()) < plies and game.get_game_state() == "UNFINISHED":
+        turn = game.get_current_turn()
+        moves = game.generate_moves(turn)
+        if not moves or (chooser.random() < 0.05 and not game.is_in_check(turn)):
+            compact = game.get_compact_board()
+            general = square_to_pos(compact.generals[compact.side])
+            moves = [(general, general)]
+        assert game.make_move(*chooser.choice(moves))
+        yield game
+
+
+def snapshot(game):
+    """Returns what undo and redo must restore"""
+    return (write_text(game.get_compact_board()), game.get_position_hash(), game.get_current_turn(),
+            game.get_game_state(), game.get_repetition_count(), game.get_pass_count())
+
+
+def board_rows(game):
+    """Returns the game's board as rows of Pieces ("" for an empty square), indexed [y][x]"""
+    return [[game.get_piece(square_to_pos(y * 9 + x)) for x in range(9)] for y in range(10)]
+
+
+def accepted_moves(game):
+    """Returns every (pos1, pos2) move, passes aside, that make_move accepts, found by trying them all"""
+    turn = game.get_current_turn()
+    positions = [square_to_pos(square) for square in range(NUM_SQUARES)]
+    accepted = set()
+    for pos1 in positions:
+        piece = game.get_piece(pos1)
+        if piece == "" or piece.get_piece_color() != turn:
+            continue
+        for pos2 in positions:
+            if pos1 != pos2 and game.make_move(pos1, pos2):
+                accepted.add((pos1, pos2))
+                game.undo()
+    return accepted
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_generate_moves_matches_make_move(seed):
+    for game in random_game(seed, draw_rules=NO_DRAWS):
+        if len(game.get_history()) % 6 == 0 and game.get_game_state() == "UNFINISHED":
+            assert set(game.generate_moves(game.get_current_turn())) == accepted_moves(game)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_incremental_state_matches_rebuild(seed):
+    for game in random_game(seed, plies=120):
+        compact = game.get_compact_board()
+        rebuilt = CompactBoard.from_board(board_rows(game), game.get_current_turn())
+        assert compact.squares == rebuilt.squares
+        assert compact.hash == rebuilt.hash
+        assert compact.scores == rebuilt.scores
+        assert compact.generals == rebuilt.generals
+        assert compact.attacks == rebuilt.attacks
+        assert [sorted(pieces) for pieces in compact.piece_lists] == [sorted(pieces) for pieces in rebuilt.piece_lists]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_is_legal_batch_matches_is_legal_move(seed):
+    np = pytest.importorskip("numpy")
+    from batch import is_legal_batch
+
+    rows, moves, expected = [], [], []
+    for game in random_game(seed):
+        if len(game.get_history()) % 10:
+            continue
+        board = board_rows(game)
+        squares = bytes(game.get_compact_board().squares)
+        for from_y, row in enumerate(board):
+            for from_x, piece in enumerate(row):
+                if piece == "":
+                    continue
+                for to_y in range(10):
+                    for to_x in range(9):
+                        if (to_x, to_y) == (from_x, from_y):
+                            continue
+                        target = board[to_y][to_x]
+                        legal = bool(game.is_legal_move([from_x, from_y], piece, [to_x, to_y], target)) and \
+                            (target == "" or target.get_piece_color() != piece.get_piece_color())
+                        rows.append(squares)
+                        moves.append((from_x, from_y, to_x, to_y))
+                        expected.append(legal)
+    positions = np.frombuffer(b"".join(rows), dtype=np.int8).reshape(-1, NUM_SQUARES)
+    assert is_legal_batch(positions, np.array(moves)).tolist() == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_undo_and_redo_restore_every_ply(seed):
+    game = JanggiGame()
+    snapshots = [snapshot(game)]
+    for game in random_game(seed, plies=80):
+        snapshots.append(snapshot(game))
+    history = game.get_history()
+    for ply in range(len(snapshots) - 1, 0, -1):
+        assert game.undo()
+        assert snapshot(game) == snapshots[ply - 1]
+    assert not game.undo()
+    for ply in range(1, len(snapshots)):
+        assert game.redo()
+        assert snapshot(game) == snapshots[ply]
+    assert game.get_history() == history
+    assert game.goto_ply(len(snapshots) // 2)
+    assert snapshot(game) == snapshots[len(snapshots) // 2]
+
+
+def test_repetition_draw_is_tracked_through_undo():
+    game = JanggiGame()
+    shuffle = [("c10", "d8"), ("c1", "d3"), ("d8", "c10"), ("d3", "c1")]
+    for pos1, pos2 in shuffle * 2:
+        assert game.make_move(pos1, pos2)
+    assert game.get_repetition_count() == 3
+    assert game.get_game_state() == "DRAW"
+    assert not game.make_move("c10", "d8")
+    game.undo()
+    assert game.get_game_state() == "UNFINISHED"
+    assert game.get_repetition_count() == 2
+    game.redo()
+    assert game.get_game_state() == "DRAW"
+
+
+def test_consecutive_passes_draw():
+    game = JanggiGame()
+    assert game.make_move("e9", "e9")
+    assert game.get_pass_count() == 1
+    assert game.make_move("e2", "e2")
+    assert game.get_game_state() == "DRAW"
+
+    game = JanggiGame(NO_DRAWS)
+    for pos in ("e9", "e2", "e9", "e2"):
+        assert game.make_move(pos, pos)
+    assert game.get_pass_count() == 4
+    assert game.get_game_state() == "UNFINISHED"
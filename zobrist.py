@@ -0,0 +1,78 @@
+# Description: Zobrist keys for hashing positions, and a bounded transposition table keyed on those hashes.
+
+import random
+
+from tables import NUM_SQUARES
+
+_key_source = random.Random(0x4A414E47)  # fixed seed so hashes are stable between runs and processes
+
+# PIECE_KEYS[code][square] for every piece code a CompactBoard can hold (code 0 is an empty square)
+PIECE_KEYS = tuple(tuple(_key_source.getrandbits(64) if code & 7 else 0 for _ in range(NUM_SQUARES))
+                   for code in range(16))
+SIDE_KEY = _key_source.getrandbits(64)  # mixed in while red is to move
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+def hash_squares(squares, side):
+    """Computes the Zobrist hash of a position from scratch"""
+    key = SIDE_KEY if side else 0
+    for sq, code in enumerate(squares):
+        if code:
+            key ^= PIECE_KEYS[code][sq]
+    return key
+
+
+class TranspositionTable:
+    """Fixed-size hash table of search results. Each slot holds one entry; a new entry replaces the old one
+    when it belongs to the same position, was searched at least as deep, or the old one is left over
+    from an earlier search."""
+
+    def __init__(self, size=1 << 20):
+        """Creates a table with size slots, rounded down to a power of two"""
+        self._size = 1 << (max(size, 1).bit_length() - 1)
+        self._mask = self._size - 1
+        self._entries = [None] * self._size
+        self._generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        """Returns the number of slots"""
+        return self._size
+
+    def new_search(self):
+        """Ages every stored entry so the next search is free to overwrite them"""
+        self._generation += 1
+
+    def clear(self):
+        """Empties the table"""
+        self._entries = [None] * self._size
+        self.probes = self.hits = self.stores = 0
+
+    def probe(self, key):
+        """Returns the (depth, value, flag, move) stored for key, or None"""
+        self.probes += 1
+        entry = self._entries[key & self._mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1:5]
+        return None
+
+    def store(self, key, depth, value, flag, move=None):
+        """Records a search result for key, subject to the replacement policy"""
+        index = key & self._mask
+        entry = self._entries[index]
+        if entry is None or entry[0] == key or depth >= entry[1] or entry[5] != self._generation:
+            if entry is not None and entry[0] == key and move is None:
+                move = entry[4]  # keep the best move from a shallower search of the same position
+            self._entries[index] = (key, depth, value, flag, move, self._generation)
+            self.stores += 1
+
+    def get_stats(self):
+        """Returns probe/hit/store counters and how many slots are filled"""
+        used = sum(1 for entry in self._entries if entry is not None)
+        return {"size": self._size, "used": used, "probes": self.probes, "hits": self.hits, "stores": self.stores}